@@ -1,27 +1,36 @@
 from fastapi import APIRouter, HTTPException, Response, UploadFile, File, BackgroundTasks, Body, Request, Header
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from app.services.generators.factory import ExerciseFactory
 from app.services.pdf.generator import generate_pdf_file
 from app.services.db import DatabaseService
 from app.services.generators.review import ReviewGenerator
 from app.services.generators.vocabulary import VocabularyGenerator
 from app.services.generators.exam import ExamGenerator
+from app.services.generators.prompts import registry_report
 from app.services.grader import CorrectionService
 from app.services.audio import AudioService
+from app.services.audio_cache import audio_cache, tts_cache, iter_file
+from app.services.transcription import transcription_service, UploadTooLarge
 from app.services.storage import StorageService 
+from app.services.replenisher import PoolReplenisher
+from app.services.singleflight import SingleFlight
+from app.services.pipeline import generation_pipeline
+from app.services.image_library import image_library
+from app.services.user_cache import user_cache, mistakes_cache
+from app.services.quota import quota_engine
+from app.services.streaming import exercise_event_stream, sse_event
+from app.services.pool import exercise_pool
 from pydantic import BaseModel
 from typing import Optional, List, Any
 from collections import Counter
 import os
-from app.core.config import settings
 import tempfile
-import base64
-from openai import OpenAI
+from app.services.llm import llm
 import json
-from datetime import datetime
 from firebase_admin import firestore
 import time
 import random
+import asyncio
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 
@@ -46,6 +55,7 @@ class ExerciseRequest(BaseModel):
 class SubmitResultRequest(BaseModel):
     user_id: str
     exercise_type: str
+    exercise_id: Optional[str] = None
     score: int
     total: Optional[int] = None
     mistakes: Optional[List[Dict[str, Any]]] = []
@@ -110,86 +120,60 @@ FALLBACK_SPEAKING_2 = {
 def generate_and_save_exercise(level: str, exercise_type: str, is_public: bool = True, weak_words: list = None):
     print(f"⚙️ BACKGROUND: Iniciant generació per {exercise_type}...")
     try:
-        # 1. Generem el text base (Factory)
-        exercise_object = ExerciseFactory.create_exercise(exercise_type, level)
-        exercise_data = exercise_object.model_dump()
-        
-        # 2. Gestió d'Àudio (Listening)
-        if exercise_type.startswith("listening"):
-            try:
-                audio_bytes = AudioService.generate_audio(exercise_data['text'])
-                audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-                exercise_data['audio_base64'] = audio_base64
-            except Exception as e:
-                print(f"⚠️ Error generant àudio inicial: {e}")
-
-        # 3. 🔴 GESTIÓ D'IMATGES FORÇADA (Speaking Part 2 - 3 IMATGES)
-        # Si és Speaking 2, generem 3 imatges d'alta qualitat.
-        if exercise_type == "speaking2":
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            topic = exercise_data.get('title', 'General Topic').replace("Speaking Part 2: ", "")
-            
-            # Assegurem que tenim una llista per guardar les URLs
-            if 'image_urls' not in exercise_data or not exercise_data['image_urls']:
-                exercise_data['image_urls'] = []
-
-            # A. Generar les 3 imatges si no n'hi ha
-            if len(exercise_data['image_urls']) < 3:
-                print(f"🎨 BACKGROUND: Generant 3 imatges separades d'alta qualitat per al tema '{topic}'...")
-                temp_urls = []
-                
-                # Variacions per als prompts per assegurar que les 3 fotos siguin diferents
-                variations = ["focusing on an individual scenario", "showing a group interaction", "depicting a contrasting situation or outcome"]
-                
-                for i in range(3):
-                    try:
-                        variation = variations[i] if i < len(variations) else "different perspective"
-                        image_prompt = f"A photorealistic, candid photograph showing a scene related to '{topic}', {variation}. Educational context, high detail. Image {i+1} of 3."
-                        
-                        print(f"   ▶️ Generant imatge {i+1}/3...")
-                        img_resp = client.images.generate(model="dall-e-3", prompt=image_prompt, n=1, size="1024x1024")
-                        temp_urls.append(img_resp.data[0].url)
-                    except Exception as e:
-                         print(f"⚠️ Error generant la imatge {i+1}: {e}")
-                
-                # Afegim les temporals a la llista
-                exercise_data['image_urls'].extend(temp_urls)
-
-            # B. Pujar les URLs temporals a Firebase Storage
-            final_urls = []
-            print("💾 BACKGROUND: Pujant imatges a Firebase Storage...")
-            for i, url in enumerate(exercise_data.get('image_urls', [])):
-                if "firebasestorage" not in url and "oai" in url: # Si és d'OpenAI
-                     try:
-                         print(f"   ▶️ Pujant imatge {i+1}...")
-                         perm_url = StorageService.save_image_from_url(url, folder="speaking_part2")
-                         final_urls.append(perm_url)
-                     except Exception as e:
-                         print(f"   ⚠️ Error pujant imatge {i+1}: {e}")
-                         # Si falla, intentem mantenir la temporal encara que caduqui
-                         final_urls.append(url)
-                else:
-                    # Ja és permanent o no és vàlida
-                    final_urls.append(url)
-            
-            # Actualitzem la llista definitiva
-            exercise_data['image_urls'] = final_urls
-            # Eliminem el camp singular antic per evitar confusions
-            if 'image_url' in exercise_data: del exercise_data['image_url']
-
-        # 4. Guardar a Firestore
-        doc_id = DatabaseService.save_exercise(exercise_data, is_public=is_public)
-        print(f"✅ BACKGROUND: Exercici guardat correctament a la DB! ID: {doc_id}")
-        return exercise_data
+        # Text -> recursos en paral·lel (àudio / 3 imatges + pujades) -> Firestore
+        return generation_pipeline.run(level, exercise_type, is_public=is_public, weak_words=weak_words)
 
     except Exception as e:
         print(f"❌ BACKGROUND ERROR CRÍTIC: {e}")
         return None
 
+def generate_and_save_batch(level: str, exercise_type: str, count: int, is_public: bool = True):
+    """Genera 'count' exercicis en una sola crida i els guarda amb una escriptura agrupada."""
+    print(f"⚙️ BACKGROUND: Iniciant generació en lot ({count}x {exercise_type})...")
+    try:
+        exercises = []
+        for exercise_object in ExerciseFactory.create_exercise_batch(exercise_type, level, count):
+            exercise_data = exercise_object.model_dump()
+            exercise_data.setdefault("level", level)
+            exercise_data.setdefault("type", exercise_type)
+            exercises.append(generation_pipeline.attach_assets(exercise_data, exercise_type))
+
+        DatabaseService.save_exercises_batch(exercises, is_public=is_public)
+        # Només els que s'han guardat de debò (la Pool i el replenisher compten aquests)
+        return [exercise for exercise in exercises if exercise.get("id")]
+
+    except Exception as e:
+        print(f"❌ BACKGROUND ERROR CRÍTIC (lot): {e}")
+        return []
+
+# Reposició de la Pool guiada per la profunditat 'unseen' (no per cada petició)
+replenisher = PoolReplenisher(
+    generate_and_save_exercise,
+    batch_generate_fn=generate_and_save_batch,
+    batch_types=ExerciseFactory.BATCHABLE_TYPES,
+)
+
+# Generacions on-demand agrupades per (level, type, personalització)
+generation_flight = SingleFlight()
+
+def generate_on_demand(level: str, exercise_type: str, weak_words: list = None):
+    """
+    Generació on-demand amb single-flight: si ja n'hi ha una en curs per la mateixa clau,
+    l'esperem. La demanda extra agrupada es converteix en reposició de la Pool.
+    """
+    key = (level, exercise_type, tuple(sorted(weak_words or [])))
+    exercise_data, followers = generation_flight.do(
+        key, generate_and_save_exercise, level, exercise_type, is_public=True, weak_words=weak_words
+    )
+    if followers > 0:
+        print(f"🤝 SINGLE-FLIGHT: {followers} peticions agrupades per {level}/{exercise_type}.")
+        replenisher.request_refill(level, exercise_type, followers)
+    return dict(exercise_data) if isinstance(exercise_data, dict) else exercise_data
+
 # --- ENDPOINTS ---
 
 @router.post("/generate")
-def generate_exercise_endpoint(request: GenerateRequest):
+async def generate_exercise_endpoint(request: GenerateRequest):
     
     # =================================================================
     # 🧠 SPEAKING PART 1
@@ -197,7 +181,6 @@ def generate_exercise_endpoint(request: GenerateRequest):
     if request.type == "speaking1":
         # ... (Codi de Speaking 1 igual que abans) ...
         try:
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
             topic_str = request.topic if request.topic else "General Life"
             extra_instr = f"Note: {request.instructions}" if request.instructions else ""
 
@@ -208,9 +191,10 @@ def generate_exercise_endpoint(request: GenerateRequest):
             {extra_instr}
             """
 
-            response = client.chat.completions.create(
+            response = await llm.achat(
                 model="gpt-4o", 
-                messages=[{"role": "system", "content": "You are a Cambridge C1 exam expert."}, {"role": "user", "content": prompt}]
+                messages=[{"role": "system", "content": "You are a Cambridge C1 exam expert."}, {"role": "user", "content": prompt}],
+                label="exercise:speaking1"
             )
             ai_text = response.choices[0].message.content.strip()
 
@@ -232,7 +216,6 @@ def generate_exercise_endpoint(request: GenerateRequest):
     # =================================================================
     elif request.type == "speaking2":
         try:
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
             topic_str = request.topic if request.topic else "Risk & Achievement"
             
             # 1. GENERAR TEXT
@@ -259,32 +242,41 @@ def generate_exercise_endpoint(request: GenerateRequest):
             [Question starting with 'Which...']
             """
 
-            response = client.chat.completions.create(
+            response = await llm.achat(
                 model="gpt-4o",
-                messages=[{"role": "system", "content": "You are a Cambridge C1 exam expert. Follow formatting strictly."}, {"role": "user", "content": prompt}]
+                messages=[{"role": "system", "content": "You are a Cambridge C1 exam expert. Follow formatting strictly."}, {"role": "user", "content": prompt}],
+                label="exercise:speaking2"
             )
             ai_text = response.choices[0].message.content.strip()
 
-            # 2. GENERAR 3 IMATGES (Qualitat C1)
+            # 2. GENERAR 3 IMATGES (Qualitat C1) EN PARAL·LEL
             print(f"🎨 FOREGROUND: Generant 3 imatges d'alta qualitat per '{topic_str}'...")
-            final_urls = []
             variations = ["individual focus", "group interaction", "contrasting perspective"]
-            
-            for i in range(3):
+
+            # Imatges de la biblioteca per a temes semblants: DALL-E només per a les que falten
+            stored = await asyncio.to_thread(image_library.choose, topic_str, 3)
+
+            async def render_image(i: int):
                 try:
-                    variation = variations[i]
-                    image_prompt = f"A photorealistic, candid photograph showing a scene related to '{topic_str}', {variation}. Educational context. Image {i+1}/3."
+                    if stored[i]:
+                        return {"url": stored[i]["url"], "variants": stored[i].get("variants")}
+                    image_prompt = f"A photorealistic, candid photograph showing a scene related to '{topic_str}', {variations[i]}. Educational context. Image {i+1}/3."
                     print(f"   ▶️ Generant imatge {i+1}/3...")
-                    img_resp = client.images.generate(model="dall-e-3", prompt=image_prompt, n=1, size="1024x1024")
-                    temp_url = img_resp.data[0].url
+                    temp_url = await llm.aimage(image_prompt, model="dall-e-3", size="1024x1024")
                     
-                    # Guardar a Storage immediatament
+                    # Guardar a Storage immediatament (original + variants WebP)
                     print(f"   💾 Pujant imatge {i+1} a Storage...")
-                    perm_url = StorageService.save_image_from_url(temp_url, folder="speaking_part2")
-                    final_urls.append(perm_url)
+                    saved = await StorageService.asave_image_with_variants(temp_url, folder="speaking_part2")
+                    if saved["url"] != temp_url:
+                        await asyncio.to_thread(image_library.add, topic_str, i, image_prompt, saved["url"], saved["variants"])
+                    return saved
                 except Exception as e:
                     print(f"⚠️ Error en imatge {i+1}: {e}")
                     # Si falla una, intentem seguir. Si no n'hi ha cap, saltarà l'error general.
+                    return None
+
+            results = [saved for saved in await asyncio.gather(*(render_image(i) for i in range(3))) if saved]
+            final_urls = [saved["url"] for saved in results]
 
             if not final_urls:
                  raise Exception("Failed to generate any images.")
@@ -296,6 +288,7 @@ def generate_exercise_endpoint(request: GenerateRequest):
                 "instruction": "Compare TWO pictures and answer both questions.",
                 "text": ai_text,
                 "image_urls": final_urls, # 👈 Retornem la llista de 3 URLs
+                "image_variants": [saved["variants"] for saved in results],
                 "level": request.level
             }
 
@@ -311,70 +304,73 @@ def generate_exercise_endpoint(request: GenerateRequest):
     # 🔄 GENERACIÓ STANDARD
     # =================================================================
     try:
-        exercise = ExerciseFactory.create_exercise(request.type, request.level)
+        exercise = await ExerciseFactory.acreate_exercise(request.type, request.level)
         return exercise.model_dump() 
     except Exception as e:
         print(f"Error generating exercise: {e}") 
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def consume_daily_quota(user_id: str, ex_type: str):
+    """Límit diari d'exercicis per tipus (excepte VIP). Llença 429 si s'ha superat."""
+    if not quota_engine.check_and_consume(user_id, "exercise", scope=ex_type):
+        raise HTTPException(status_code=429, detail="DAILY_LIMIT")
+
+def get_weak_words(user_id: str, ex_type: str) -> list:
+    """Les 3 paraules amb més errors de l'usuari (només per Parts 1 i 4)."""
+    weak_words = []
+    if ex_type in ["reading_and_use_of_language1", "reading_and_use_of_language4"]:
+        try:
+            vocab_ref = db.collection("users").document(user_id).collection("vocabulary")
+            # Agafem les 3 paraules amb més errors
+            weak_docs = vocab_ref.order_by("mistakes", direction=firestore.Query.DESCENDING).limit(3).stream()
+            weak_words = [doc.to_dict().get("word") for doc in weak_docs]
+            if weak_words:
+                print(f"🎯 Injectant punts febles al Prompt: {weak_words}")
+        except Exception as e:
+            print(f"Error llegint vocabulari feble: {e}")
+    return weak_words
+
+def strip_sentinels(exercise):
+    """Treu els Sentinel de Firebase (p.ex. SERVER_TIMESTAMP) que no es poden serialitzar."""
+    if isinstance(exercise, dict):
+        return {k: v for k, v in exercise.items() if type(v).__name__ != 'Sentinel'}
+    return exercise
+
 @router.post("/get_exercise/")
 def get_exercise_data(request: ExerciseRequest, background_tasks: BackgroundTasks):
     try:
         user_id = request.user_id
         ex_type = request.exercise_type
         
-        # --- 1. LLEGIR DADES I COMPROVAR LÍMITS ---
-        user_ref = db.collection("users").document(user_id)
-        user_doc = user_ref.get()
-        user_data = user_doc.to_dict() if user_doc.exists else {}
-        is_vip = user_data.get("is_vip", False)
-        usage_data = user_data.get("daily_usage", {})
-        
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        if usage_data.get("date") != today_str:
-            usage_data = {"date": today_str, "counts": {}}
-            
-        current_count = usage_data.get("counts", {}).get(ex_type, 0)
-        
-        if not is_vip and current_count >= 3:
-            raise HTTPException(status_code=429, detail="DAILY_LIMIT")
-
-        # --- 2. ACTUALITZAR COMPTADOR IMMEDIATAMENT ---
-        if not is_vip:
-            usage_data["counts"][ex_type] = current_count + 1
-            user_ref.set({"daily_usage": usage_data}, merge=True)
+        # --- 1-2. COMPROVAR LÍMITS I ACTUALITZAR COMPTADOR ---
+        consume_daily_quota(user_id, ex_type)
 
         # --- 3. BUSCAR O GENERAR L'EXERCICI ---
-        existing = DatabaseService.get_existing_exercise(request.level, request.exercise_type, request.completed_ids)
+        # Filtre compacte de vistos (persistit) + els IDs que encara envia el client
+        seen = DatabaseService.get_user_seen_filter(user_id)
+        for ex_id in request.completed_ids:
+            seen.add(ex_id)
+        existing = DatabaseService.get_existing_exercise(request.level, request.exercise_type, seen)
         
         if existing:
             print("✨ REUTILITZANT EXERCICI DB")
-            background_tasks.add_task(generate_and_save_exercise, request.level, request.exercise_type)
+            # Només reomplim si a l'usuari li queden pocs exercicis per veure
+            depth = DatabaseService.estimate_unseen_depth(request.level, request.exercise_type, seen)
+            replenisher.notify(request.level, request.exercise_type, depth)
             final_exercise = existing
         else:
             print("⚠️ POOL BUIDA. Generant on-demand...")
             
             # 🔥 NOU: BUSQUEM ELS PUNTS FEBLES DE L'USUARI
-            weak_words = []
-            if ex_type in ["reading_and_use_of_language1", "reading_and_use_of_language4"]:
-                try:
-                    vocab_ref = db.collection("users").document(user_id).collection("vocabulary")
-                    # Agafem les 3 paraules amb més errors
-                    weak_docs = vocab_ref.order_by("mistakes", direction=firestore.Query.DESCENDING).limit(3).stream()
-                    weak_words = [doc.to_dict().get("word") for doc in weak_docs]
-                    if weak_words:
-                        print(f"🎯 Injectant punts febles al Prompt: {weak_words}")
-                except Exception as e:
-                    print(f"Error llegint vocabulari feble: {e}")
+            weak_words = get_weak_words(user_id, ex_type)
 
             # Li passem les weak_words a la funció de generar (que modificarem al Pas 3)
-            final_exercise = generate_and_save_exercise(request.level, request.exercise_type, is_public=True, weak_words=weak_words)
+            final_exercise = generate_on_demand(request.level, request.exercise_type, weak_words=weak_words)
 
         # --- 4. NETEJAR EL SENTINEL DE FIREBASE ---
         # (Aquí va la neteja, un cop final_exercise ja té l'exercici a dins!)
-        if isinstance(final_exercise, dict):
-            final_exercise = {k: v for k, v in final_exercise.items() if type(v).__name__ != 'Sentinel'}
+        final_exercise = strip_sentinels(final_exercise)
 
         # --- 5. RETORNAR AL FRONTEND ---
         return final_exercise
@@ -389,75 +385,93 @@ def get_exercise_data(request: ExerciseRequest, background_tasks: BackgroundTask
 @router.post("/preload_exercise/")
 def preload_exercise(request: ExerciseRequest):
     try:
+        seen = DatabaseService.get_user_seen_filter(request.user_id)
+        for ex_id in request.completed_ids:
+            seen.add(ex_id)
         existing = DatabaseService.get_existing_exercise(
             request.level, 
             request.exercise_type, 
-            request.completed_ids
+            seen
         )
         if existing:
+            depth = DatabaseService.estimate_unseen_depth(request.level, request.exercise_type, seen)
+            replenisher.notify(request.level, request.exercise_type, depth)
             return {"status": "buffered"}
 
         print("⚡ BACKGROUND: Buffer buit! Generant exercici complet...")
-        generate_and_save_exercise(request.level, request.exercise_type, is_public=True)
+        generate_on_demand(request.level, request.exercise_type)
         return {"status": "generated"}
 
     except Exception as e:
         print(f"⚠️ Background Error: {e}")
         return {"status": "error"}
 
+# --- STREAMING (SSE) ---
+# Mode alternatiu: el frontend pot pintar el text mentre el model encara escriu les preguntes.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+STREAMABLE_SPECIAL_TYPES = ("speaking1", "speaking2")
+
+@router.post("/generate/stream")
+async def generate_exercise_stream(request: GenerateRequest):
+    if request.type in STREAMABLE_SPECIAL_TYPES:
+        # Speaking 1/2 tenen el seu propi flux (imatges): enviem el resultat sencer d'un cop
+        async def single_event():
+            yield sse_event("done", await generate_exercise_endpoint(request))
+        return StreamingResponse(single_event(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    return StreamingResponse(
+        exercise_event_stream(request.type, request.level),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.post("/get_exercise/stream")
+async def get_exercise_stream(request: ExerciseRequest):
+    """Com /get_exercise/, però si la Pool és buida enviem l'exercici en streaming (SSE)."""
+    ex_type = request.exercise_type
+    await asyncio.to_thread(consume_daily_quota, request.user_id, ex_type)
+
+    seen = await asyncio.to_thread(DatabaseService.get_user_seen_filter, request.user_id)
+    for ex_id in request.completed_ids:
+        seen.add(ex_id)
+    existing = await asyncio.to_thread(DatabaseService.get_existing_exercise, request.level, ex_type, seen)
+
+    if existing:
+        depth = DatabaseService.estimate_unseen_depth(request.level, ex_type, seen)
+        replenisher.notify(request.level, ex_type, depth)
+
+        async def cached_event():
+            yield sse_event("done", strip_sentinels(existing))
+        return StreamingResponse(cached_event(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    weak_words = await asyncio.to_thread(get_weak_words, request.user_id, ex_type)
+
+    async def save_generated(exercise_data: dict) -> dict:
+        # El text ja ha arribat en streaming: el pipeline només fa els recursos i el guardat
+        saved = await asyncio.to_thread(
+            generation_pipeline.run, request.level, ex_type, True, None, exercise_data
+        )
+        return strip_sentinels(saved)
+
+    return StreamingResponse(
+        exercise_event_stream(ex_type, request.level, weak_words, on_complete=save_generated),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @router.post("/submit_result/")
 def submit_exercise_result(result: SubmitResultRequest, background_tasks: BackgroundTasks): # 👈 AQUÍ ESTÀ LA SOLUCIÓ
     try:
-        user_ref = db.collection("users").document(result.user_id)
-        user_doc_snap = user_ref.get()
-        user_data = user_doc_snap.to_dict() if user_doc_snap.exists else {}
-        
-        # 1. Actualitzacions generals
-        updates = {
-            "total_score": firestore.Increment(result.score),
-            "exercises_completed": firestore.Increment(1)
-        }
-        
-        current_pool = user_data.get("mistakes_pool", [])
-        new_wrong_stems = [m.get("stem") or m.get("question") for m in result.mistakes] if result.mistakes else []
+        # 1-3. Resultat, totals, XP i errors (regla del 2 als repassos) en un sol commit
+        DatabaseService.submit_result(
+            result.user_id, result.exercise_type, result.exercise_id,
+            result.score, result.total, result.mistakes
+        )
         
-        # 2. LÒGICA DE LA REGLA DEL 2
-        if result.exercise_type == "review_exam":
-            active_review = user_data.get("active_review_mistakes", [])
-            updated_pool = []
-            
-            for mistake in current_pool:
-                stem = mistake.get("stem") or mistake.get("question")
-                
-                if stem in active_review:
-                    if stem not in new_wrong_stems:
-                        mistake["mastery"] = mistake.get("mastery", 0) + 1
-                    else:
-                        mistake["mastery"] = 0
-                        
-                if mistake.get("mastery", 0) < 2:
-                    updated_pool.append(mistake)
-                    
-            updates["active_review_mistakes"] = firestore.DELETE_FIELD
-            updates["mistakes_pool"] = updated_pool
-            
-        else:
-            updated_pool = list(current_pool)
-            for new_m in (result.mistakes or []):
-                stem = new_m.get("stem") or new_m.get("question")
-                existing = next((m for m in updated_pool if (m.get("stem") or m.get("question")) == stem), None)
-                
-                if existing:
-                    existing["mastery"] = 0 
-                else:
-                    new_m["mastery"] = 0
-                    updated_pool.append(new_m)
-                    
-            updates["mistakes_pool"] = updated_pool
+        # 3b. Marquem l'exercici com a vist (filtre compacte) sense fer esperar l'usuari
+        if result.exercise_id:
+            background_tasks.add_task(DatabaseService.mark_exercise_seen, result.user_id, result.exercise_id)
 
-        # 3. Guardem el perfil d'usuari
-        user_ref.set(updates, merge=True)
-        
         # 4. VOCAB VAULT (Enriquiment intel·ligent en segon pla)
         if result.exercise_type in ["reading_and_use_of_language1", "reading_and_use_of_language4"]:
             if result.mistakes:
@@ -471,14 +485,75 @@ def submit_exercise_result(result: SubmitResultRequest, background_tasks: Backgr
 
 @router.post("/generate_full_exam/")
 def generate_full_exam(request: ExamRequest):
+    if not quota_engine.check_and_consume(request.user_id, "full_exam"):
+         raise HTTPException(status_code=429, detail="Daily limit reached.")
     try:
-        if not DatabaseService.check_user_quota(request.user_id, cost=5):
-             raise HTTPException(status_code=429, detail="Daily limit reached.")
         return ExamGenerator.generate_full_exam(request.user_id, request.level)
-    except HTTPException as he: raise he
     except Exception as e:
+        # La generació ha fallat: no la cobrem
+        quota_engine.refund(request.user_id, "full_exam")
+        if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/llm_status/")
+def llm_status():
+    return llm.status()
+
+@router.get("/prompt_cache_status/")
+def prompt_cache_status():
+    # Tokens (i cached_tokens) per tipus d'exercici + mida del prefix estàtic de cada plantilla
+    return {
+        "usage": llm.usage_status(),
+        "templates": registry_report()
+    }
+
+@router.get("/audio_cache_status/")
+def audio_cache_status():
+    # Encerts de la cache de trossos de TTS (veu + text) i de la de /generate_audio/ (disc + Storage)
+    return {
+        "segments": audio_cache.status(),
+        "responses": tts_cache.status(),
+    }
+
+@router.get("/image_library_status/")
+def image_library_status():
+    # Encerts de la biblioteca d'imatges de Speaking Part 2 (= imatges de DALL-E estalviades)
+    return image_library.status()
+
+@router.get("/quota_status/")
+def quota_status():
+    # Buckets en memòria, consum pendent d'escriure i decisions (permeses / denegades / VIP)
+    return quota_engine.status()
+
+@router.get("/user_cache_status/")
+def user_cache_status():
+    # Encerts de la cache de perfils (= lectures de 'users/{id}' estalviades) i de la d'errors
+    return {**user_cache.status(), "mistakes": mistakes_cache.status()}
+
+@router.get("/pool_status/")
+def pool_status():
+    return {
+        "pools": exercise_pool.sizes(),
+        "replenisher": replenisher.status(),
+        "single_flight": generation_flight.status(),
+        "pipeline": generation_pipeline.status()
+    }
+
+@router.get("/generation_jobs/{job_id}")
+def get_generation_job(job_id: str):
+    job = DatabaseService.get_generation_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {key: job.get(key) for key in ("id", "level", "type", "status", "stages", "exercise_id")}
+
+@router.post("/generation_jobs/{job_id}/retry")
+def retry_generation_job(job_id: str):
+    """Reintenta les etapes de recursos fallides (imatges, pujades, àudio) sense regenerar el text."""
+    exercise = generation_pipeline.retry(job_id)
+    if exercise is None:
+        raise HTTPException(status_code=404, detail="Job not found or without text")
+    return {"status": "retried", "exercise_id": exercise.get("id")}
+
 @router.get("/user_stats/{user_id}")
 def get_user_stats(user_id: str):
     return DatabaseService.get_user_stats(user_id)
@@ -490,26 +565,25 @@ def report_issue(report: ReportRequest):
 
 @router.post("/generate_review/{user_id}")
 def generate_review(user_id: str):
-    # Respectem la teva comprovació de quota si existeix
-    if hasattr(DatabaseService, 'check_user_quota'):
-        if not DatabaseService.check_user_quota(user_id, cost=1):
-            raise HTTPException(status_code=429, detail="Daily limit reached.")
-            
-    user_ref = db.collection("users").document(user_id)
-    user_doc = user_ref.get()
-    user_data = user_doc.to_dict() if user_doc.exists else {}
-
-    mistakes = user_data.get("mistakes_pool", [])
+    mistakes = DatabaseService.get_user_mistakes(user_id)
     if not mistakes: 
         raise HTTPException(status_code=404, detail="NO_MISTAKES")
+
+    # Només cobrem quan hi ha alguna cosa a repassar
+    if not quota_engine.check_and_consume(user_id, "review"):
+        raise HTTPException(status_code=429, detail="Daily limit reached.")
         
     # 1. Generem l'examen híbrid
     gen = ReviewGenerator(mistakes)
-    ex = gen.generate("C1").model_dump()
+    try:
+        ex = gen.generate("C1").model_dump()
+    except Exception:
+        quota_engine.refund(user_id, "review")
+        raise
     
     # 2. TRACKING INTEL·LIGENT: Guardem a Firestore QUINS errors concrets estem avaluant ara mateix
-    active_stems = [m.get("stem") or m.get("question") for m in gen.selected_mistakes]
-    user_ref.set({"active_review_mistakes": active_stems}, merge=True)
+    active_ids = [m.get("id") or DatabaseService.mistake_id(m.get("stem") or m.get("question")) for m in gen.selected_mistakes]
+    DatabaseService.update_user_profile(user_id, {"active_review_mistakes": active_ids})
     
     ex['id'] = DatabaseService.save_exercise(ex, is_public=False)
     return ex
@@ -518,17 +592,23 @@ def generate_review(user_id: str):
 def get_flashcards(user_id: str):
     existing = DatabaseService.get_user_flashcards(user_id)
     if len(existing) >= 5: return {"flashcards": existing}
-    if not DatabaseService.check_user_quota(user_id, cost=1):
-         return {"flashcards": existing}
     stats = DatabaseService.get_user_stats(user_id)
     mistakes = stats.get("mistakes_pool", [])
     if not mistakes: return {"flashcards": []}
+    if not quota_engine.check_and_consume(user_id, "flashcards"):
+         return {"flashcards": existing}
     gen = VocabularyGenerator()
-    data = gen.generate_flashcards(mistakes)
+    try:
+        data = gen.generate_flashcards(mistakes)
+    except Exception:
+        quota_engine.refund(user_id, "flashcards")
+        raise
     new = data.get("flashcards", [])
     if new:
         DatabaseService.save_generated_flashcards(user_id, new)
         return {"flashcards": DatabaseService.get_user_flashcards(user_id)}
+    # Cap targeta nova: no la cobrem
+    quota_engine.refund(user_id, "flashcards")
     return {"flashcards": []}
 
 @router.post("/update_flashcard/{user_id}")
@@ -537,28 +617,112 @@ def update_flashcard(user_id: str, update: FlashcardUpdate):
     return {"status": "updated"}
 
 @router.post("/grade_writing/")
-def grade_writing(request: WritingSubmission):
-    return CorrectionService.grade_writing(request.user_text, request.task_text, request.level)
+async def grade_writing(request: WritingSubmission):
+    return await CorrectionService.agrade_writing(task_prompt=request.task_text, user_text=request.user_text, level=request.level)
 
 @router.post("/grade_speaking/")
-def grade_speaking(request: WritingSubmission):
-    return CorrectionService.grade_speaking(request.user_text, request.task_text, request.level)
+async def grade_speaking(request: WritingSubmission):
+    return await CorrectionService.agrade_speaking(task_prompt=request.task_text, transcript_text=request.user_text, level=request.level)
 
 @router.post("/transcribe_audio/")
-def transcribe_audio(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
-        tmp.write(file.file.read())
-        path = tmp.name
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    with open(path, "rb") as f:
-        t = client.audio.transcriptions.create(model="whisper-1", file=f)
-    os.unlink(path)
-    return {"text": t.text}
+async def transcribe_audio(file: UploadFile = File(...)):
+    # Pujada a disc per blocs (límit de mida), trossos solapats en paral·lel i cache per hash
+    try:
+        result = await transcription_service.transcribe_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"text": result["text"]}
+
+@router.get("/transcription_status/")
+def transcription_status():
+    return transcription_service.status()
+
+def _parse_range(range_header: str, size: int):
+    """
+    Interpreta una capçalera 'Range: bytes=...' (un sol rang).
+    Retorna (start, end) inclusius, o None si s'ha de servir el fitxer sencer.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            # 'bytes=-500': els últims 500 bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+@router.get("/audio/{audio_hash}")
+def get_audio(audio_hash: str, range_header: Optional[str] = Header(None, alias="Range"), if_none_match: Optional[str] = Header(None)):
+    """
+    Serveix l'àudio d'un exercici des de Storage amb suport de Range (el reproductor pot saltar
+    a qualsevol 'timestamp' sense baixar-ho tot). És adreçat per contingut: immutable.
+    """
+    if audio_hash.endswith(".mp3"):
+        audio_hash = audio_hash[:-4]
+    if len(audio_hash) != 64 or any(c not in "0123456789abcdef" for c in audio_hash):
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{audio_hash}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and audio_hash in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    # Una sola petició a Storage per a les metadades; el mateix blob serveix per llegir
+    blob = StorageService.get_audio_blob(audio_hash)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    size = blob.size
+
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(StorageService.stream_audio(blob), media_type="audio/mpeg", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(
+        content=blob.download_as_bytes(start=start, end=end),
+        status_code=206,
+        media_type="audio/mpeg",
+        headers=headers,
+    )
 
 @router.post("/generate_audio/")
-def generate_audio_endpoint(request: AudioRequest):
-    b = AudioService.generate_audio(request.text)
-    return Response(content=b, media_type="audio/mpeg")
+async def generate_audio_endpoint(request: AudioRequest):
+    """
+    Assegura que l'àudio del text és a la cache i retorna la URL GET on es pot descarregar.
+    El POST no es pot cachejar: el navegador i els CDN cachegen el GET (adreçat per contingut).
+    """
+    cached = await tts_cache.aget_or_render(request.text, "alloy", AudioService.agenerate_audio)
+    return {"key": cached["key"], "audio_url": f"/generate_audio/{cached['key']}", "source": cached["source"]}
+
+@router.get("/generate_audio/{key}")
+async def get_generated_audio(key: str, if_none_match: Optional[str] = Header(None)):
+    # La clau (hash de model + veu + text) determina el contingut: si el client ja el té, 304
+    if len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    headers = {"ETag": f'"{key}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and key in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    cached = await tts_cache.aget(key)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    headers["X-Cache"] = cached["source"]
+    if cached["file"] is not None:
+        # Fitxer ja obert: encara que el desallotgin del disc ara mateix, el handle el llegeix sencer
+        headers["Content-Length"] = str(os.fstat(cached["file"].fileno()).st_size)
+        return StreamingResponse(iter_file(cached["file"]), media_type="audio/mpeg", headers=headers)
+    return Response(content=cached["audio"], media_type="audio/mpeg", headers=headers)
 
 @router.post("/download_pdf")
 async def download_pdf(exercise_data: dict = Body(...)):
@@ -582,20 +746,22 @@ def generate_pdf(level: str="C1", exercise_type: str="reading_and_use_of_languag
     return Response(content=c, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename=ex.pdf"})
 
 @router.get("/analyze_weaknesses/{user_id}")
-def analyze_weaknesses(user_id: str):
-    stats = DatabaseService.get_user_stats(user_id)
+async def analyze_weaknesses(user_id: str):
+    # Firestore és síncron: el llegim en un thread a part per no bloquejar el bucle
+    stats = await asyncio.to_thread(DatabaseService.get_user_stats, user_id)
     mistakes = stats.get("mistakes_pool", [])
     if len(mistakes) < 3:
         return {"analysis": "Keep practicing! I need a few more mistakes to analyze your weak points.", "tags": []}
     mistakes_text = "\n".join([f"- Type: {m['type']}, Q: {m['question']}, User said: {m['user_answer']}, Correct: {m['correct_answer']}" for m in mistakes[-10:]])
     prompt = f"""You are an expert Cambridge C1 Tutor. Analyze these recent student mistakes:\n{mistakes_text}\n1. Identify the top 3 linguistic weaknesses.\n2. Give 1 short paragraph of advice.\nOUTPUT JSON: {{ "weaknesses": [...], "advice": "..." }}"""
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": prompt}], response_format={"type": "json_object"})
+    response = await llm.achat(model="gpt-4o", messages=[{"role": "system", "content": prompt}], response_format={"type": "json_object"})
     return json.loads(response.choices[0].message.content)
 
 @router.post("/ad_reward/")
 def ad_reward(request: AdRewardRequest):
-    DatabaseService.reward_ad_view(request.user_id)
+    # Gasta un dels anuncis del dia i torna una generació (atòmic: o les dues coses o cap)
+    if not quota_engine.check_and_consume(request.user_id, "ad_reward"):
+        raise HTTPException(status_code=429, detail="AD_LIMIT")
     return {"status": "rewarded"}
 
 @router.get("/vocabulary/{user_id}")
@@ -630,7 +796,6 @@ def process_and_save_vocabulary(user_id: str, mistakes: list):
         
         if not words_to_process: return
 
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
         prompt = f"""
         You are a Cambridge C1 English expert. A student failed to answer these words/phrases correctly: {words_to_process}.
         For each item, extract the core vocabulary target (e.g., if it's "has been called off", extract "call off").
@@ -648,7 +813,7 @@ def process_and_save_vocabulary(user_id: str, mistakes: list):
             ]
         }}
         """
-        response = client.chat.completions.create(
+        response = llm.chat(
             model="gpt-4o",
             messages=[{"role": "system", "content": "Output valid JSON only."}, {"role": "user", "content": prompt}],
             response_format={"type": "json_object"}
@@ -11,6 +11,57 @@ class Settings(BaseSettings):
     # AFEGEIX AIXÒ:
     STRIPE_SECRET_KEY: str 
     STRIPE_WEBHOOK_SECRET: str
+
+    # Gateway d'OpenAI: connexions HTTP reutilitzades i reintents
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_MAX_RETRIES: int = 3
+
+    # Generació offline (Batch API): URL alternativa, p.ex. el servidor local 'batch_server.py'
+    OPENAI_BATCH_BASE_URL: str = ""
+    BATCH_POLL_SECONDS: float = 30.0
+
+    # Filtre d'exercicis vistos per usuari (Bloom): capacitat inicial i taxa de falsos positius
+    SEEN_FILTER_CAPACITY: int = 2000
+    SEEN_FILTER_FP_RATE: float = 0.01
+
+    # Reposició de la Pool: només generem quan la profunditat 'unseen' baixa del mínim
+    POOL_LOW_WATERMARK: int = 3
+    POOL_TARGET_DEPTH: int = 6
+    REPLENISH_MAX_CONCURRENCY: int = 2
+    # Exercicis per crida quan generem en lot (tipus curts: grammar_*, reading 1-4, speaking1)
+    GENERATION_BATCH_SIZE: int = 4
+    # Feines del pipeline que han acabat 'partial'/'failed' (per reintentar): dies abans que el TTL les esborri
+    GENERATION_JOB_TTL_DAYS: int = 7
+
+    # Cache de trossos de TTS (hash de veu + text), en memòria
+    AUDIO_SEGMENT_CACHE_MB: int = 64
+    # Cache de respostes de /generate_audio/: disc local (LRU) + Storage. Directori buit = temporal del sistema
+    TTS_DISK_CACHE_DIR: str = ""
+    TTS_DISK_CACHE_MB: int = 512
+
+    # /transcribe_audio/: mida màxima de la pujada (Whisper accepta fins a 25 MB) i trossos de les gravacions llargues
+    TRANSCRIBE_MAX_MB: int = 25
+    TRANSCRIBE_SEGMENT_SECONDS: int = 120
+
+    # Biblioteca d'imatges de Speaking Part 2: semblança mínima de tema (0-1) per reutilitzar una imatge
+    IMAGE_LIBRARY_THRESHOLD: float = 0.6
+
+    # Cache de perfils 'users/{id}' (write-through): el TTL limita el desfasament entre workers
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 30.0
+    # Errors guardats per usuari (subcol·lecció 'mistakes'): els més antics s'esborren
+    MISTAKES_RETENTION: int = 200
+    # Usuaris amb la llista d'errors en memòria (cache pròpia, separada de la de perfils)
+    MISTAKES_CACHE_MAX_ENTRIES: int = 1000
+
+    # Quotes diàries (usuaris no VIP): exercicis per tipus, unitats de generació (examen = 5) i anuncis recompensats
+    DAILY_EXERCISE_LIMIT: int = 3
+    DAILY_GENERATION_LIMIT: int = 10
+    DAILY_AD_REWARDS: int = 3
+    # El consum es guarda a memòria i s'escriu a Firestore (Increment) cada N segons
+    QUOTA_FLUSH_SECONDS: float = 5.0
+    QUOTA_RESYNC_SECONDS: float = 60.0
+
     class Config:
         env_file = ".env"
         # Això fa que no importi si al .env està en minúscules o majúscules
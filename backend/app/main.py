@@ -29,6 +29,8 @@ if not firebase_admin._apps:
 # ==========================================
 from app.api.router import router as exercises_router 
 from app.routers.payment import payment_router 
+from app.services.storage import StorageService
+from app.services.quota import quota_engine
 
 # 4. Inicialitzem l'App
 app = FastAPI(title="English C1 Generator API")
@@ -52,6 +54,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def warm_storage():
+    # Resolem el bucket una sola vegada a l'arrencada: totes les pujades reutilitzen el mateix handle
+    try:
+        StorageService.bucket()
+    except Exception as e:
+        print(f"⚠️ ALERTA: No s'ha pogut preparar el bucket de Storage: {e}")
+
+@app.on_event("startup")
+def start_quota_flush():
+    # Fil que escriu a Firestore el consum de quotes acumulat a memòria
+    quota_engine.start()
+
+@app.on_event("shutdown")
+def flush_quota():
+    # No perdem el consum pendent en un reinici o desplegament
+    quota_engine.stop()
+
 # ==========================================
 # 3. ENDPOINT DE SALUT (Healthcheck)
 # ==========================================
@@ -143,6 +143,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
                                 "subscription_id": subscription_id,
                                 "subscription_status": "active"
                             })
+                            DatabaseService.invalidate_user_profile(user_id)
                     else:
                         DatabaseService.add_credits_only(user_id, product_info['credits'])
                         
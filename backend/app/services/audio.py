@@ -1,22 +1,258 @@
-from openai import OpenAI
-from app.core.config import settings
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from app.services.llm import llm
+from app.services import mp3
+from app.services.audio_cache import audio_cache
+
+# tts-1 accepta fins a 4096 caràcters; amb trossos més petits el TTS va en paral·lel
+# i la latència queda limitada pel tros més llarg, no pel guió sencer.
+TTS_CHUNK_CHARS = 1200
+
+# Fils per sintetitzar trossos (el gateway ja limita les crides simultànies a tts-1)
+TTS_WORKERS = 6
+
+# Fronteres naturals del guió, de més forta a més feble
+EXTRACT_PATTERN = re.compile(r"\n\s*\n|(?=\bExtract\s+\w+\b[:.])|(?=\bSpeaker\s+\d+\s*:)", re.IGNORECASE)
+SPEAKER_PATTERN = re.compile(r"(?m)(?=^\s*[A-Z][\w .'-]{0,30}:)")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"[a-z']{3,}")
+# Etiqueta de torn al principi de línia: "Man:", "Speaker 2:", "Dr Evans:" (màxim 4 paraules)
+TURN_PATTERN = re.compile(r"^\s*([A-Z][\w.'-]*(?: [\w.'-]+){0,3})\s*:\s*(.*)$")
+
+# Veus de tts-1. 'alloy' queda per al narrador (instruccions, "Extract 1"...)
+NARRATOR_VOICE = "alloy"
+MALE_VOICES = ["onyx", "echo", "fable"]
+FEMALE_VOICES = ["nova", "shimmer"]
+MALE_HINTS = {"man", "male", "boy", "mr", "he", "father", "husband", "son", "brother", "sir"}
+FEMALE_HINTS = {"woman", "female", "girl", "mrs", "ms", "miss", "she", "mother", "wife", "daughter", "sister"}
+
+_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+
+
+def split_transcript(text: str, max_chars: int = TTS_CHUNK_CHARS) -> list:
+    """
+    Talla el guió en trossos de fins a 'max_chars' respectant (per ordre) els extractes,
+    els torns de paraula i les frases. Només talla per paraules si una frase sola no hi cap.
+    """
+    pieces = [text.strip()]
+    for pattern in (EXTRACT_PATTERN, SPEAKER_PATTERN, SENTENCE_PATTERN):
+        refined = []
+        for piece in pieces:
+            if len(piece) <= max_chars:
+                refined.append(piece)
+            else:
+                refined.extend(part.strip() for part in pattern.split(piece) if part and part.strip())
+        pieces = refined
+
+    # Últim recurs: frases monstruoses, per paraules
+    final = []
+    for piece in pieces:
+        while len(piece) > max_chars:
+            cut = piece.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            final.append(piece[:cut].strip())
+            piece = piece[cut:].strip()
+        if piece:
+            final.append(piece)
+
+    # Reagrupem trossos petits consecutius fins a omplir cada crida
+    chunks = []
+    for piece in final:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]}\n{piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def parse_turns(text: str) -> list:
+    """
+    Separa el guió en torns [(parlant, text)]. Les línies sense etiqueta continuen el torn
+    anterior; les que van abans de cap etiqueta o després d'una línia en blanc són del narrador (None).
+    """
+    turns = []
+    speaker, lines = None, []
+
+    def close():
+        body = " ".join(line for line in lines if line)
+        if body:
+            turns.append((speaker, body))
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        match = TURN_PATTERN.match(line)
+        if match and match.group(2):
+            close()
+            speaker, lines = match.group(1).strip(), [match.group(2).strip()]
+        elif not line:
+            close()
+            speaker, lines = None, []
+        else:
+            lines.append(line)
+    close()
+
+    # Torns consecutius del mateix parlant: una sola crida
+    merged = []
+    for speaker, body in turns:
+        if merged and merged[-1][0] == speaker:
+            merged[-1] = (speaker, f"{merged[-1][1]} {body}")
+        else:
+            merged.append((speaker, body))
+    return merged
+
+
+def assign_voices(speakers: list, default_voice: str = NARRATOR_VOICE) -> dict:
+    """
+    Veu per a cada parlant, estable dins el guió: primer per pistes de gènere de l'etiqueta
+    ("Man", "Mrs Lee"...), i la resta alternant veus que encara no s'hagin fet servir.
+    """
+    voices = {None: default_voice}
+    male, female = list(MALE_VOICES), list(FEMALE_VOICES)
+    pending = []
+    for speaker in speakers:
+        if speaker in voices:
+            continue
+        words = set(re.findall(r"[a-z]+", speaker.lower()))
+        if words & FEMALE_HINTS and female:
+            voices[speaker] = female.pop(0)
+        elif words & MALE_HINTS and male:
+            voices[speaker] = male.pop(0)
+        else:
+            voices[speaker] = None
+            pending.append(speaker)
+
+    # Sense pistes (Host, Speaker 1, Dr Evans...): alternem home/dona per distingir-los
+    spare = [voice for pair in zip(male, female) for voice in pair] + male[len(female):] + female[len(male):]
+    for i, speaker in enumerate(pending):
+        voices[speaker] = spare[i % len(spare)] if spare else default_voice
+    return voices
+
+
+def plan_units(text: str, voice: str = NARRATOR_VOICE, max_chars: int = TTS_CHUNK_CHARS) -> list:
+    """
+    Unitats de síntesi [{speaker, voice, text}]. Si hi ha dos parlants o més, un torn = una veu
+    (l'etiqueta no es llegeix); si no, trossos per mida amb la veu per defecte.
+    """
+    turns = parse_turns(text)
+    speakers = [speaker for speaker, _ in turns if speaker is not None]
+    if len(set(speakers)) < 2:
+        return [{"speaker": None, "voice": voice, "text": chunk} for chunk in split_transcript(text, max_chars)]
+
+    voices = assign_voices(speakers, voice)
+    units = []
+    for speaker, body in turns:
+        for chunk in split_transcript(body, max_chars):
+            units.append({"speaker": speaker, "voice": voices[speaker], "text": chunk})
+    return units
+
+
+def build_segments(units: list, audios: list) -> list:
+    """Offsets reals de cada unitat dins l'àudio final (segons), a partir de les capçaleres MP3."""
+    segments = []
+    offset = 0.0
+    for i, (unit, audio) in enumerate(zip(units, audios)):
+        duration = mp3.duration_seconds(audio)
+        segments.append({
+            "index": i,
+            "start": round(offset, 3),
+            "end": round(offset + duration, 3),
+            "speaker": unit["speaker"],
+            "voice": unit["voice"],
+            "text": unit["text"],
+        })
+        offset += duration
+    return segments
+
+
+def _speech(text: str, voice: str) -> bytes:
+    return llm.speech(text, model="tts-1", voice=voice)
+
+
+def synthesize_segment(text: str, voice: str = NARRATOR_VOICE) -> bytes:
+    """Un tros de TTS passant per la cache (veu + text): mai sintetitzem dues vegades el mateix."""
+    return audio_cache.get_or_render(voice, text, _speech)
+
+
+async def _aspeech(text: str, voice: str) -> bytes:
+    return await llm.aspeech(text, model="tts-1", voice=voice)
+
+
+async def asynthesize_segment(text: str, voice: str = NARRATOR_VOICE) -> bytes:
+    return await audio_cache.aget_or_render(voice, text, _aspeech)
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = max(0, int(round(seconds)))
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def align_timestamps(questions: list, segments: list) -> list:
+    """
+    Recalcula el 'timestamp' de cada pregunta amb l'àudio real: busquem la frase del guió
+    que més s'assembla a la pregunta (+ resposta i explicació) i n'interpolem l'inici dins el seu tros.
+    """
+    sentences = []
+    for segment in segments:
+        text = segment["text"]
+        duration = segment["end"] - segment["start"]
+        for match in re.finditer(r"[^.!?\n]+[.!?]?", text):
+            words = set(WORD_PATTERN.findall(match.group(0).lower()))
+            if words:
+                at = segment["start"] + duration * match.start() / max(1, len(text))
+                sentences.append((words, at))
+
+    for question in questions:
+        if not isinstance(question, dict) or not sentences:
+            continue
+        probe = " ".join(str(question.get(field, "")) for field in ("question", "stem", "answer", "explanation"))
+        words = set(WORD_PATTERN.findall(probe.lower()))
+        if not words:
+            continue
+        best_words, best_at = max(sentences, key=lambda sentence: len(sentence[0] & words))
+        if best_words & words:
+            question["timestamp"] = format_timestamp(best_at)
+    return questions
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
 
 class AudioService:
     @staticmethod
-    def generate_audio(text: str):
+    def generate_audio(text: str, voice: str = NARRATOR_VOICE):
         """
         Converteix text a àudio MP3 usant OpenAI TTS-1.
-        Retorna els bytes de l'àudio.
+        Retorna els bytes de l'àudio. Els diàlegs i els textos llargs es renderitzen per trossos en paral·lel.
         """
         try:
-            response = client.audio.speech.create(
-                model="tts-1",
-                voice="alloy", # Opcions: alloy, echo, fable, onyx, nova, shimmer
-                input=text
-            )
-            return response.content
+            return AudioService.render_transcript(text, voice)["audio"]
+        except Exception as e:
+            print(f"Error generating audio: {e}")
+            raise e
+
+    @staticmethod
+    def render_transcript(text: str, voice: str = NARRATOR_VOICE) -> dict:
+        """
+        Renderitza un guió per torns (una veu per parlant) o per trossos, EN PARAL·LEL i amb cache,
+        i concatena els frames MP3.
+        Retorna {"audio": bytes, "segments": [{index, start, end, speaker, voice, text}], "duration": segons}.
+        """
+        units = plan_units(text, voice)
+        if len(units) > 1:
+            print(f"🔊 AUDIO: {len(units)} trossos de TTS en paral·lel ({len(text)} caràcters, {len({u['voice'] for u in units})} veus).")
+        audios = list(_executor.map(lambda unit: synthesize_segment(unit["text"], unit["voice"]), units))
+        segments = build_segments(units, audios)
+        return {
+            "audio": mp3.concat(audios) if len(audios) != 1 else audios[0],
+            "segments": segments,
+            "duration": segments[-1]["end"] if segments else 0.0,
+        }
+
+    @staticmethod
+    async def agenerate_audio(text: str, voice: str = NARRATOR_VOICE):
+        """Versió async de generate_audio (no ocupa cap thread mentre esperem el TTS)."""
+        try:
+            units = plan_units(text, voice)
+            audios = await asyncio.gather(*[asynthesize_segment(unit["text"], unit["voice"]) for unit in units])
+            return mp3.concat(audios) if len(audios) != 1 else audios[0]
         except Exception as e:
             print(f"Error generating audio: {e}")
-            raise e
\ No newline at end of file
+            raise e
@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from app.core.config import settings
+from app.services.singleflight import SingleFlight, AsyncSingleFlight
+from app.services.storage import StorageService
+
+
+def segment_key(voice: str, text: str, model: str = "tts-1") -> str:
+    """Adreça de contingut d'un tros d'àudio: el mateix (model, veu, text) sempre sona igual."""
+    return hashlib.sha256(f"{model}\x00{voice}\x00{text.strip()}".encode("utf-8")).hexdigest()
+
+
+class SegmentAudioCache:
+    """
+    Cache LRU en memòria de trossos de TTS, indexada per hash de (model, veu, text) i
+    limitada en bytes. Les regeneracions i les frases repetides no tornen a passar pel TTS,
+    i dues peticions simultànies del mateix tros comparteixen una sola crida (SingleFlight als
+    fils, AsyncSingleFlight a l'event loop; entre tots dos camins no es comparteix la crida).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> bytes (l'últim és el més recent)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        self._counters = {"hits": 0, "misses": 0, "shared": 0, "evictions": 0}
+
+    def get(self, key: str):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is None:
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return audio
+
+    def put(self, key: str, audio: bytes):
+        if not audio or len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = audio
+            self._bytes += len(audio)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counters["evictions"] += 1
+
+    def get_or_render(self, voice: str, text: str, render, model: str = "tts-1") -> bytes:
+        """Retorna l'àudio del tros des de la cache o el renderitza amb render(text, voice) una sola vegada."""
+        key = segment_key(voice, text, model)
+        audio = self.get(key)
+        if audio is not None:
+            return audio
+
+        def miss():
+            with self._lock:
+                self._counters["misses"] += 1
+            rendered = render(text, voice)
+            self.put(key, rendered)
+            return rendered
+
+        audio, followers = self._flight.do(key, miss)
+        if followers < 0:
+            with self._lock:
+                self._counters["shared"] += 1
+        return audio
+
+    async def aget_or_render(self, voice: str, text: str, render, model: str = "tts-1") -> bytes:
+        """Com get_or_render, però 'render' és una coroutine render(text, voice)."""
+        key = segment_key(voice, text, model)
+        audio = self.get(key)
+        if audio is not None:
+            return audio
+
+        async def miss():
+            with self._lock:
+                self._counters["misses"] += 1
+            rendered = await render(text, voice)
+            self.put(key, rendered)
+            return rendered
+
+        audio, followers = await self._aflight.do(key, miss)
+        if followers < 0:
+            with self._lock:
+                self._counters["shared"] += 1
+        return audio
+
+    def status(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            entries, size = len(self._entries), self._bytes
+        lookups = counters["hits"] + counters["misses"] + counters["shared"]
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "counters": counters,
+            # Els 'shared' tampoc han anat al TTS: compten com a encert
+            "hit_rate": round((counters["hits"] + counters["shared"]) / lookups, 3) if lookups else 0.0,
+        }
+
+
+def iter_file(f, chunk_size: int = 256 * 1024):
+    """Llegeix un fitxer obert per blocs (per a StreamingResponse) i el tanca en acabar."""
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+class DiskLRU:
+    """
+    Fitxers MP3 en un directori local, limitat en bytes (s'esborren els menys usats).
+    L'ordre d'ús es reconstrueix a l'arrencada amb la data de modificació; cada encert la renova.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> mida
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".mp3"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def open(self, key: str):
+        """
+        Fitxer obert ('rb') si és a la cache (i el marca com a usat), o None. L'obrim sota el lock:
+        un put() concurrent pot desallotjar-lo, però el handle obert el continua llegint sencer.
+        """
+        path = self.path(key)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                # Algú l'ha esborrat per fora: l'oblidem
+                self._bytes -= self._entries.pop(key, 0)
+                return None
+            self._entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return f
+
+    def put(self, key: str, data: bytes) -> str:
+        """Escriu el fitxer de manera atòmica (tmp + rename) i desallotja fins a tornar al límit."""
+        path = self.path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.unlink(self.path(old_key))
+            except FileNotFoundError:
+                pass
+        return path
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class TTSResponseCache:
+    """
+    Cache de dos nivells per a /generate_audio/, amb clau = hash de (model, veu, text):
+        1. disc local (DiskLRU): una repetició és una lectura de fitxer
+        2. Storage: compartida entre workers i reinicis
+    Si no hi és enlloc, es renderitza una sola vegada per clau (AsyncSingleFlight), es desa al
+    disc i es puja a Storage en segon pla.
+    """
+
+    def __init__(self, disk: DiskLRU):
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._flight = AsyncSingleFlight()
+        self._counters = {"disk_hits": 0, "storage_hits": 0, "misses": 0, "shared": 0, "bytes_saved": 0, "errors": 0}
+
+    async def aget_or_render(self, text: str, voice: str, render, model: str = "tts-1") -> dict:
+        """
+        Assegura que l'àudio és a la cache (el renderitza si cal) i retorna {"key", "source"}.
+        'render' és una coroutine render(text, voice) -> bytes.
+        """
+        key = segment_key(voice, text, model)
+        cached = await self.aget(key)
+        if cached is None:
+            cached, followers = await self._flight.do(key, self._render, key, text, voice, render)
+            if followers < 0:
+                self._count("shared")
+        if cached["file"] is not None:
+            cached["file"].close()
+        return {"key": key, "source": cached["source"]}
+
+    async def aget(self, key: str):
+        """
+        Àudio de la clau sense renderitzar: {"key", "file", "audio", "source"} o None si no és ni
+        al disc ni a Storage. 'file' és un fitxer obert del disc (qui el rep l'ha de tancar);
+        si no, 'audio' porta els bytes.
+        """
+        f = self.disk.open(key)
+        if f is not None:
+            self._hit("disk_hits", os.fstat(f.fileno()).st_size)
+            return {"key": key, "file": f, "audio": None, "source": "disk"}
+
+        try:
+            audio = await asyncio.to_thread(StorageService.load_tts_cache, key)
+        except Exception as e:
+            print(f"⚠️ TTS CACHE: No s'ha pogut llegir de Storage: {e}")
+            self._count("errors")
+            audio = None
+
+        if audio is None:
+            return None
+        self._hit("storage_hits", len(audio))
+        return await self._store(key, audio, "storage")
+
+    async def _render(self, key: str, text: str, voice: str, render) -> dict:
+        self._count("misses")
+        audio = await render(text, voice)
+        asyncio.get_running_loop().run_in_executor(None, self._upload, key, audio)
+        return await self._store(key, audio, "tts")
+
+    async def _store(self, key: str, audio: bytes, source: str) -> dict:
+        # Ja tenim els bytes a memòria: els servim d'aquí, el disc és per a les properes peticions
+        try:
+            await asyncio.to_thread(self.disk.put, key, audio)
+        except OSError as e:
+            print(f"⚠️ TTS CACHE: No s'ha pogut escriure al disc: {e}")
+            self._count("errors")
+        return {"key": key, "file": None, "audio": audio, "source": source}
+
+    def _upload(self, key: str, audio: bytes):
+        try:
+            StorageService.save_tts_cache(key, audio)
+        except Exception as e:
+            print(f"⚠️ TTS CACHE: No s'ha pogut pujar a Storage: {e}")
+            self._count("errors")
+
+    def _hit(self, field: str, size: int):
+        with self._lock:
+            self._counters[field] += 1
+            self._counters["bytes_saved"] += size
+
+    def _count(self, field: str):
+        with self._lock:
+            self._counters[field] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters["disk_hits"] + counters["storage_hits"] + counters["shared"]
+        lookups = hits + counters["misses"]
+        return {
+            "disk": self.disk.status(),
+            "counters": counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+audio_cache = SegmentAudioCache(settings.AUDIO_SEGMENT_CACHE_MB * 1024 * 1024)
+
+tts_cache = TTSResponseCache(DiskLRU(
+    settings.TTS_DISK_CACHE_DIR or os.path.join(tempfile.gettempdir(), "prepai_tts_cache"),
+    settings.TTS_DISK_CACHE_MB * 1024 * 1024,
+))
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from firebase_admin import firestore
+from openai import OpenAI
+from app.core.config import settings
+from app.services.generators.factory import ExerciseFactory
+
+# Estats finals d'un batch d'OpenAI
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Finestra de lliurament (l'única que accepta la Batch API)
+COMPLETION_WINDOW = "24h"
+
+
+class BatchGenerationPipeline:
+    """
+    Generació OFFLINE d'exercicis amb la Batch API d'OpenAI:
+    JSONL de peticions -> pujar i crear el batch -> esperar -> llegir resultats -> guardar en bloc.
+    Fa servir un client propi (no el gateway 'llm'): els batches tenen una quota apart
+    i no competeixen amb les crides en directe dels usuaris.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None, poll_seconds: float = None):
+        self.client = OpenAI(
+            api_key=api_key or settings.OPENAI_API_KEY,
+            base_url=base_url or settings.OPENAI_BATCH_BASE_URL or None,
+        )
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.BATCH_POLL_SECONDS
+
+    # ==========================================
+    # 1. PETICIONS (JSONL)
+    # ==========================================
+
+    @staticmethod
+    def build_requests(jobs: list, level: str = "C1") -> list:
+        """
+        'jobs' és [(tipus, exercicis per crida), ...]. El custom_id porta tipus, nivell
+        i mida perquè els resultats es puguin interpretar sense cap estat extra.
+        """
+        requests = []
+        for i, (exercise_type, count) in enumerate(jobs):
+            custom_id = f"{exercise_type}|{level}|{count}|{i}"
+            requests.append(ExerciseFactory.batch_api_request(custom_id, exercise_type, level, count))
+        return requests
+
+    @staticmethod
+    def write_jsonl(requests: list, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        return path
+
+    # ==========================================
+    # 2. ENVIAR I ESPERAR
+    # ==========================================
+
+    def submit(self, jsonl_path: str, metadata: dict = None) -> str:
+        with open(jsonl_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=COMPLETION_WINDOW,
+            metadata=metadata or {},
+        )
+        print(f"📤 BATCH: {batch.id} creat ({jsonl_path}).")
+        return batch.id
+
+    def wait(self, batch_id: str, timeout: float = None):
+        """Consulta l'estat cada 'poll_seconds' fins que el batch acaba (o se supera 'timeout')."""
+        started = time.monotonic()
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            done = f"{counts.completed}/{counts.total}" if counts else "?"
+            print(f"⏳ BATCH: {batch_id} -> {batch.status} ({done})")
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"El batch {batch_id} encara és '{batch.status}' després de {timeout}s")
+            time.sleep(self.poll_seconds)
+
+    # ==========================================
+    # 3. RESULTATS
+    # ==========================================
+
+    def download_results(self, batch) -> str:
+        """
+        JSONL de sortida + JSONL d'errors. La Batch API deixa les peticions fallides a 'error_file_id'
+        (no a la sortida): sense llegir-lo no les comptaríem com a errors ni les tornaríem a demanar.
+        """
+        texts = []
+        for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+            if file_id:
+                texts.append(self.client.files.content(file_id).text)
+        return "\n".join(texts)
+
+    @staticmethod
+    def parse_results(output_text: str) -> dict:
+        """
+        Converteix el JSONL de resultats (sortida i errors) en exercicis llestos per guardar.
+        Retorna {"exercises": [...], "failures": {tipus: n}, "usage": {...}}.
+        """
+        exercises = []
+        failures = {}
+        usage = {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+        for line in output_text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            exercise_type, level, count, _ = result["custom_id"].split("|")
+            count = int(count)
+
+            response = result.get("response") or {}
+            body = response.get("body") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                failures[exercise_type] = failures.get(exercise_type, 0) + count
+                continue
+
+            body_usage = body.get("usage") or {}
+            usage["prompt_tokens"] += body_usage.get("prompt_tokens", 0)
+            usage["completion_tokens"] += body_usage.get("completion_tokens", 0)
+            usage["cached_tokens"] += (body_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+
+            try:
+                content = body["choices"][0]["message"]["content"]
+                parsed = ExerciseFactory._split_batch(exercise_type, content)
+            except (KeyError, IndexError, ValueError) as e:
+                print(f"⚠️ BATCH: Resultat {result['custom_id']} il·legible: {e}")
+                parsed = []
+
+            if len(parsed) < count:
+                failures[exercise_type] = failures.get(exercise_type, 0) + count - len(parsed)
+            for exercise_object in parsed[:count]:
+                data = exercise_object.model_dump()
+                data["type"] = exercise_type
+                data["level"] = level
+                data["is_pregenerated"] = True
+                data["created_at"] = firestore.SERVER_TIMESTAMP
+                exercises.append(data)
+
+        return {"exercises": exercises, "failures": failures, "usage": usage}
+
+    @staticmethod
+    def ingest(exercises: list) -> list:
+        """Guarda els exercicis amb escriptures agrupades."""
+        # Import tardà: db.py necessita Firebase inicialitzat
+        from app.services.db import DatabaseService
+        return DatabaseService.save_exercises_batch(exercises)
@@ -1,8 +1,14 @@
 from firebase_admin import firestore
 from datetime import datetime, timedelta
+import hashlib
+import re
 import os
 from dotenv import load_dotenv
 import random
+from app.services.pool import exercise_pool
+from app.services.seen import SeenFilter
+from app.services.user_cache import user_cache, mistakes_cache
+from app.core.config import settings
 
 load_dotenv()
 
@@ -32,6 +38,10 @@ class DatabaseService:
             # 4. Guardem a la col·lecció
             doc_ref = db.collection("exercises").document()
             doc_ref.set(exercise_data)
+
+            # 5. Mantenim l'índex en memòria al dia (sense tornar a llegir Firestore)
+            if is_public and exercise_data.get("level") and exercise_data.get("type"):
+                exercise_pool.add(exercise_data["level"], exercise_data["type"], doc_ref.id, {"is_public": True})
             
             print(f"✅ BACKGROUND: Exercici guardat correctament a la DB! ID: {doc_ref.id}")
             return doc_ref.id
@@ -41,31 +51,134 @@ class DatabaseService:
             return None
 
     @staticmethod
-    def get_existing_exercise(level: str, exercise_type: str, completed_ids: list):
+    def update_exercise_fields(exercise_id: str, fields: dict):
+        db.collection("exercises").document(exercise_id).update(fields)
+
+    # ==========================================
+    # 1b. FEINES DE GENERACIÓ (estat del pipeline per reintentar etapes)
+    # ==========================================
+
+    @staticmethod
+    def save_generation_job(job_id: str, job_data: dict):
+        job_data = dict(job_data)
+        job_data["updated_at"] = firestore.SERVER_TIMESTAMP
+        # Política TTL de Firestore sobre 'expires_at' (col·lecció 'generation_jobs'):
+        #   gcloud firestore fields ttls update expires_at --collection-group=generation_jobs --enable-ttl
+        job_data["expires_at"] = datetime.now() + timedelta(days=settings.GENERATION_JOB_TTL_DAYS)
+        db.collection("generation_jobs").document(job_id).set(job_data)
+
+    @staticmethod
+    def delete_generation_job(job_id: str):
+        db.collection("generation_jobs").document(job_id).delete()
+
+    @staticmethod
+    def get_generation_job(job_id: str):
+        doc = db.collection("generation_jobs").document(job_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    # ==========================================
+    # 1c. BIBLIOTECA D'IMATGES (Speaking Part 2)
+    # ==========================================
+
+    @staticmethod
+    def save_library_image(image_data: dict) -> str:
+        image_data = dict(image_data)
+        image_data["created_at"] = firestore.SERVER_TIMESTAMP
+        doc_ref = db.collection("image_library").document()
+        doc_ref.set(image_data)
+        return doc_ref.id
+
+    @staticmethod
+    def get_image_library() -> list:
+        """[(id, dades)] de totes les imatges. Només els camps que fa servir l'índex."""
+        docs = db.collection("image_library").select(["topic", "slot", "url", "variants"]).stream()
+        return [(doc.id, doc.to_dict()) for doc in docs]
+
+    # Màxim d'operacions per WriteBatch de Firestore
+    MAX_BATCH_WRITES = 500
+
+    @staticmethod
+    def save_exercises_batch(exercises: list, is_public: bool = True) -> list:
         """
-        Busca a Firestore un exercici d'un nivell i tipus específic 
-        que l'usuari encara no hagi completat (Cache Hit).
+        Guarda molts exercicis amb escriptures agrupades (un commit per cada 500).
+        Retorna els IDs guardats, en el mateix ordre; cada exercici guardat queda amb el seu 'id'
+        (els d'un commit fallit no en tenen).
         """
-        try:
-            # 1. Busquem tots els exercicis d'aquest tipus i nivell
+        saved_ids = []
+        for start in range(0, len(exercises), DatabaseService.MAX_BATCH_WRITES):
+            chunk = exercises[start:start + DatabaseService.MAX_BATCH_WRITES]
+            batch = db.batch()
+            refs = []
+            for exercise_data in chunk:
+                exercise_data.pop("id", None)
+                exercise_data.pop("audio_base64", None)
+                exercise_data["is_public"] = is_public
+                doc_ref = db.collection("exercises").document()
+                batch.set(doc_ref, exercise_data)
+                refs.append((doc_ref, exercise_data))
+
+            try:
+                batch.commit()
+            except Exception as e:
+                print(f"❌ ERROR CRÍTIC GUARDANT EL LOT A FIREBASE: {e}")
+                continue
+
+            for doc_ref, exercise_data in refs:
+                exercise_data["id"] = doc_ref.id
+                if is_public and exercise_data.get("level") and exercise_data.get("type"):
+                    exercise_pool.add(exercise_data["level"], exercise_data["type"], doc_ref.id, {"is_public": True})
+                saved_ids.append(doc_ref.id)
+
+        print(f"✅ BACKGROUND: Lot de {len(saved_ids)} exercicis guardat a la DB.")
+        return saved_ids
+
+    @staticmethod
+    def _get_pool(level: str, exercise_type: str):
+        """
+        Retorna l'índex en memòria de la pool (level, type).
+        Si és buit o massa antic, el recarreguem llegint NOMÉS els IDs i metadades lleugeres.
+        """
+        pool = exercise_pool.get(level, exercise_type)
+        if pool.is_stale():
             docs = db.collection("exercises")\
                      .where("level", "==", level)\
                      .where("type", "==", exercise_type)\
+                     .select(["is_public"])\
                      .stream()
-            
-            available_exercises = []
-            
-            # 2. Filtrem els que l'usuari ja ha fet
+            entries = []
             for doc in docs:
-                if doc.id not in completed_ids:
-                    ex_data = doc.to_dict()
-                    ex_data["id"] = doc.id
-                    available_exercises.append(ex_data)
-            
-            # 3. Si en tenim de disponibles, en retornem un a l'atzar
-            if available_exercises:
-                import random
-                selected = random.choice(available_exercises)
+                meta = doc.to_dict() or {}
+                if meta.get("is_public", True) is False:
+                    continue
+                entries.append((doc.id, meta))
+            pool.reset(entries)
+            print(f"📚 POOL: Índex {level}/{exercise_type} carregat ({len(entries)} exercicis).")
+        return pool
+
+    @staticmethod
+    def get_existing_exercise(level: str, exercise_type: str, completed_ids):
+        """
+        Busca a la Pool un exercici d'un nivell i tipus específic 
+        que l'usuari encara no hagi completat (Cache Hit).
+        Només llegim de Firestore el document triat.
+        """
+        try:
+            pool = DatabaseService._get_pool(level, exercise_type)
+            excluded = set(completed_ids) if isinstance(completed_ids, (list, tuple)) else (completed_ids or set())
+
+            # Si el document triat ja no existeix (esborrat), el traiem i provem un altre cop
+            for _ in range(3):
+                ex_id = pool.sample(excluded)
+                if ex_id is None:
+                    break
+
+                doc = db.collection("exercises").document(ex_id).get()
+                if not doc.exists:
+                    pool.remove(ex_id)
+                    continue
+
+                selected = doc.to_dict()
+                selected["id"] = doc.id
                 print(f"✅ CACHE HIT: Trobat exercici {selected['id']} a la Pool.")
                 return selected
                 
@@ -77,6 +190,15 @@ class DatabaseService:
             print(f"❌ Error a get_existing_exercise: {e}")
             return None
 
+    @staticmethod
+    def estimate_unseen_depth(level: str, exercise_type: str, completed_ids) -> int:
+        """Exercicis de la Pool que l'usuari encara té disponibles (estimació en memòria)."""
+        try:
+            return DatabaseService._get_pool(level, exercise_type).estimate_unseen(completed_ids)
+        except Exception as e:
+            print(f"❌ Error estimant la profunditat de la Pool: {e}")
+            return 0
+
     @staticmethod
     def get_random_exercise(exercise_type: str, level: str = "C1"):
         """Busca un exercici aleatori a la BD que coincideixi amb tipus i nivell"""
@@ -106,7 +228,32 @@ class DatabaseService:
             return None
 
     # ==========================================
-    # 2. GESTIÓ DE VIP, CRÈDITS I ANUNCIS
+    # 2. PERFIL D'USUARI (cache write-through de 'users/{id}')
+    # ==========================================
+
+    @staticmethod
+    def _load_user(user_id: str):
+        doc = db.collection('users').document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    @staticmethod
+    def get_user_profile(user_id: str) -> dict:
+        """Document de l'usuari ({} si no existeix). Servit de la cache si és recent."""
+        return user_cache.get(user_id, DatabaseService._load_user)
+
+    @staticmethod
+    def update_user_profile(user_id: str, updates: dict):
+        """set(merge=True) a Firestore i el mateix canvi a la cache (Increment i DELETE_FIELD inclosos)."""
+        db.collection('users').document(user_id).set(updates, merge=True)
+        user_cache.apply(user_id, updates)
+
+    @staticmethod
+    def invalidate_user_profile(user_id: str):
+        # Per a escriptures que no passen per update_user_profile (transaccions, update() directes)
+        user_cache.invalidate(user_id)
+
+    # ==========================================
+    # 2b. GESTIÓ DE VIP, CRÈDITS I ANUNCIS
     # ==========================================
 
     @staticmethod
@@ -131,6 +278,8 @@ class DatabaseService:
                 'vip_expiry': new_expiry,
                 'correction_credits': (data.get('correction_credits', 0) + correction_credits)
             }, merge=True)
+            # Pagament: la pròxima lectura ha de venir de Firestore
+            DatabaseService.invalidate_user_profile(user_id)
             
             return True
         except Exception as e:
@@ -142,6 +291,7 @@ class DatabaseService:
         try:
             user_ref = db.collection('users').document(user_id)
             user_ref.update({'correction_credits': firestore.Increment(credits)})
+            user_cache.apply(user_id, {'correction_credits': firestore.Increment(credits)})
             return True
         except: return False
 
@@ -158,62 +308,54 @@ class DatabaseService:
                     transaction.update(ref, {'correction_credits': credits - 1})
                     return True
                 return False
-            return consume_credit(db.transaction(), user_ref)
-        except: return False
-
-    @staticmethod
-    def reward_ad_view(user_id: str):
-        try:
-            user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            if not user_doc.exists: return False
-            
-            data = user_doc.to_dict()
-            ads_today = data.get('ads_watched_today', 0)
-            if ads_today >= 3: return False
-            
-            batch = db.batch()
-            batch.update(user_ref, {'daily_gen_count': firestore.Increment(-1)})
-            batch.update(user_ref, {'ads_watched_today': firestore.Increment(1)})
-            batch.commit()
-            return True
+            consumed = consume_credit(db.transaction(), user_ref)
+            if consumed:
+                user_cache.apply(user_id, {'correction_credits': firestore.Increment(-1)})
+            return consumed
         except: return False
 
     # ==========================================
     # 3. GAMIFICACIÓ I STATS
     # ==========================================
 
+    XP_PER_EXERCISE = 10
+    XP_PER_LEVEL = 500
+
+    @staticmethod
+    def level_for_xp(xp) -> int:
+        return int((xp or 0) / DatabaseService.XP_PER_LEVEL) + 1
+
+    @staticmethod
+    def _gamification_updates(user_data: dict, score: int) -> dict:
+        """
+        XP amb Increment al servidor (no es perd cap suma entre peticions concurrents).
+        El 'level' desat és orientatiu (XP de la cache + el guany): get_user_stats el deriva sempre de l'XP.
+        """
+        xp_gain = DatabaseService.XP_PER_EXERCISE + score
+        return {
+            'last_active_date': datetime.now().strftime('%Y-%m-%d'),
+            'xp': firestore.Increment(xp_gain),
+            'level': DatabaseService.level_for_xp(user_data.get('xp', 0) + xp_gain)
+        }
+
     @staticmethod
     def update_user_gamification(user_id: str, score: int):
         try:
-            user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            now = datetime.now()
-            today_str = now.strftime('%Y-%m-%d')
-            
-            data = user_doc.to_dict() if user_doc.exists else {}
-            current_xp = data.get('xp', 0)
-            new_xp = current_xp + 10 + score
-            
-            user_ref.set({
-                'last_active_date': today_str,
-                'xp': new_xp,
-                'level': int(new_xp / 500) + 1
-            }, merge=True)
+            data = DatabaseService.get_user_profile(user_id)
+            DatabaseService.update_user_profile(user_id, DatabaseService._gamification_updates(data, score))
             return True
         except: return False
 
     @staticmethod
     def get_user_stats(user_id: str):
         try:
-            u_doc = db.collection('users').document(user_id).get()
-            if not u_doc.exists:
+            u_data = DatabaseService.get_user_profile(user_id)
+            if not u_data:
                 return {
                     "xp": 0, "streak": 0, "level": 1, "is_vip": False, 
                     "exercises_completed": 0, "mistakes_pool": []
                 }
-            
-            u_data = u_doc.to_dict()
+
             vip_expiry = u_data.get('vip_expiry')
             is_vip_active = False
             if vip_expiry:
@@ -228,34 +370,227 @@ class DatabaseService:
             return {
                 "xp": u_data.get('xp', 0),
                 "streak": u_data.get('streak', 0),
-                "level": u_data.get('level', 1),
+                "level": DatabaseService.level_for_xp(u_data.get('xp', 0)),
                 "is_vip": is_vip_active,
                 "correction_credits": u_data.get('correction_credits', 0),
                 "daily_gen_count": u_data.get('daily_gen_count', 0),
                 # 🔥 ELS NOUS CAMPS CRÍTICS PER AL PERFIL:
                 "exercises_completed": completed,
                 "average_score": min(avg, 100), # Limitem a 100%
-                "mistakes_pool": u_data.get('mistakes_pool', []) 
+                "mistakes_pool": DatabaseService.get_user_mistakes(user_id, u_data)
             }
         except Exception as e:
             print(f"Error a get_user_stats: {e}")
             return None
 
+    @staticmethod
+    def submit_result(user_id: str, exercise_type: str, exercise_id: str, score: int, total: int = None,
+                      mistakes: list = None, user_data: dict = None) -> dict:
+        """
+        Desa un resultat en UN sol commit: el document de 'user_results', els totals i l'XP
+        (Increment al servidor), i els errors (nous, o la regla del 2 si és un repàs).
+        L'únic viatge previ és un get_all dels errors afectats, i només si n'hi ha.
+        """
+        mistakes = mistakes or []
+        if user_data is None:
+            user_data = DatabaseService.get_user_profile(user_id)
+        if user_data.get('mistakes_pool') is not None:
+            DatabaseService._migrate_mistakes_pool(user_id, user_data['mistakes_pool'])
+            user_data = DatabaseService.get_user_profile(user_id)
+
+        now = datetime.now()
+        batch = db.batch()
+        batch.set(db.collection('user_results').document(), {
+            'user_id': user_id,
+            'exercise_id': exercise_id,
+            'exercise_type': exercise_type,
+            'score': score,
+            'total': total,
+            'mistakes': [DatabaseService._mistake_doc(m, exercise_id) for m in mistakes],
+            'timestamp': now
+        })
+
+        updates = {
+            'total_score': firestore.Increment(score),
+            'exercises_completed': firestore.Increment(1),
+            **DatabaseService._gamification_updates(user_data, score)
+        }
+        if exercise_type == "review_exam":
+            wrong_stems = [m.get('stem') or m.get('question') for m in mistakes]
+            delta = DatabaseService._stage_review(batch, user_id, user_data.get('active_review_mistakes', []), wrong_stems)
+            updates['active_review_mistakes'] = firestore.DELETE_FIELD
+        else:
+            delta = DatabaseService._stage_mistakes(batch, user_id, mistakes, exercise_id, now)
+        if delta:
+            updates['mistakes_count'] = firestore.Increment(delta)
+
+        batch.set(db.collection('users').document(user_id), updates, merge=True)
+        batch.commit()
+        user_cache.apply(user_id, updates)
+        if mistakes or exercise_type == "review_exam":
+            mistakes_cache.invalidate(user_id)
+
+        count = user_data.get('mistakes_count', 0) + delta
+        if count > settings.MISTAKES_RETENTION:
+            DatabaseService._trim_mistakes(user_id, count - settings.MISTAKES_RETENTION)
+        return {"xp_gained": DatabaseService.XP_PER_EXERCISE + score, "mistakes_delta": delta}
+
     @staticmethod
     def save_user_result(user_id: str, exercise_data: dict, score: int, total: int, mistakes: list):
         try:
-            db.collection('user_results').add({
-                'user_id': user_id,
-                'exercise_id': exercise_data.get('id'),
-                'exercise_type': exercise_data.get('type'),
-                'score': score,
-                'total': total,
-                'mistakes': mistakes,
-                'timestamp': datetime.now()
-            })
-            return DatabaseService.update_user_gamification(user_id, score)
+            DatabaseService.submit_result(
+                user_id, exercise_data.get('type'), exercise_data.get('id'), score, total, mistakes
+            )
+            DatabaseService.mark_exercise_seen(user_id, exercise_data.get('id'))
+            return True
         except: return None
 
+    # ==========================================
+    # 3b. ERRORS ('users/{id}/mistakes/{hash de l'enunciat}')
+    # ==========================================
+
+    # Camps que guardem de cada error (res de còpies senceres de preguntes)
+    MISTAKE_FIELDS = ("type", "question", "stem", "user_answer", "correct_answer")
+    MISTAKE_TEXT_LIMIT = 300
+
+    @staticmethod
+    def mistake_id(stem: str) -> str:
+        """Clau de l'error: hash de l'enunciat normalitzat (majúscules i espais no compten)."""
+        normalized = re.sub(r"\s+", " ", (stem or "").strip().lower())
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _mistake_doc(mistake: dict, exercise_id: str = None) -> dict:
+        doc = {
+            field: str(mistake[field])[:DatabaseService.MISTAKE_TEXT_LIMIT]
+            for field in DatabaseService.MISTAKE_FIELDS if mistake.get(field) is not None
+        }
+        # Referència a la pregunta original (quan la tenim) en lloc de copiar-la
+        doc["exercise_id"] = mistake.get("exercise_id") or exercise_id
+        doc["question_index"] = mistake.get("question_index")
+        return doc
+
+    @staticmethod
+    def _mistakes_ref(user_id: str):
+        return db.collection('users').document(user_id).collection('mistakes')
+
+    @staticmethod
+    def get_user_mistakes(user_id: str, user_data: dict = None) -> list:
+        """
+        Errors de l'usuari, del més antic al més recent (el mateix ordre que l'antic 'mistakes_pool').
+        Cada error porta 'id' (la clau del document). Passa per la cache d'errors; si l'usuari
+        encara té l'array antic, el migra.
+        """
+        if user_data is None:
+            user_data = DatabaseService.get_user_profile(user_id)
+        if user_data.get('mistakes_pool') is not None:
+            DatabaseService._migrate_mistakes_pool(user_id, user_data['mistakes_pool'])
+
+        def load(_):
+            docs = DatabaseService._mistakes_ref(user_id).order_by('updated_at').stream()
+            return {"items": [{**doc.to_dict(), "id": doc.id} for doc in docs]}
+
+        items = mistakes_cache.get(user_id, load).get("items", [])
+        for item in items:
+            item.pop('updated_at', None)
+        return items
+
+    @staticmethod
+    def _migrate_mistakes_pool(user_id: str, pool: list):
+        """Migració mandrosa: l'array 'mistakes_pool' del document passa a la subcol·lecció."""
+        print(f"🔁 MIGRACIÓ: {len(pool)} errors de {user_id} a la subcol·lecció 'mistakes'.")
+        user_ref = db.collection('users').document(user_id)
+        col = DatabaseService._mistakes_ref(user_id)
+        docs = {}
+        for mistake in pool:
+            stem = mistake.get('stem') or mistake.get('question')
+            doc = DatabaseService._mistake_doc(mistake)
+            doc['mastery'] = mistake.get('mastery', 0)
+            docs[DatabaseService.mistake_id(stem)] = doc
+
+        items = list(docs.items())
+        for start in range(0, max(1, len(items)), DatabaseService.MAX_BATCH_WRITES - 1):
+            batch = db.batch()
+            for offset, (mistake_id, doc) in enumerate(items[start:start + DatabaseService.MAX_BATCH_WRITES - 1]):
+                # Conservem l'ordre de l'array a 'updated_at'
+                doc['updated_at'] = datetime.now() + timedelta(microseconds=start + offset)
+                batch.set(col.document(mistake_id), doc)
+            if start + DatabaseService.MAX_BATCH_WRITES - 1 >= len(items):
+                batch.set(user_ref, {'mistakes_pool': firestore.DELETE_FIELD, 'mistakes_count': len(docs)}, merge=True)
+            batch.commit()
+        user_cache.apply(user_id, {'mistakes_pool': firestore.DELETE_FIELD, 'mistakes_count': len(docs)})
+        mistakes_cache.invalidate(user_id)
+
+    @staticmethod
+    def _stage_mistakes(batch, user_id: str, mistakes: list, exercise_id: str, now: datetime) -> int:
+        """
+        Afegeix al 'batch' els errors nous o torna a posar a 0 el 'mastery' dels que ja hi eren.
+        Només llegeix els documents d'aquests errors (un sol get_all): el cost no depèn de l'historial.
+        Retorna quants errors nous hi ha.
+        """
+        if not mistakes:
+            return 0
+        col = DatabaseService._mistakes_ref(user_id)
+        incoming = {}
+        for mistake in mistakes:
+            incoming[DatabaseService.mistake_id(mistake.get('stem') or mistake.get('question'))] = mistake
+        refs = {mistake_id: col.document(mistake_id) for mistake_id in incoming}
+        existing = {snap.id for snap in db.get_all(list(refs.values())) if snap.exists}
+
+        for mistake_id, mistake in incoming.items():
+            if mistake_id in existing:
+                batch.update(refs[mistake_id], {'mastery': 0, 'updated_at': now})
+            else:
+                doc = DatabaseService._mistake_doc(mistake, exercise_id)
+                doc.update({'mastery': 0, 'updated_at': now})
+                batch.set(refs[mistake_id], doc)
+        return len(incoming) - len(existing)
+
+    @staticmethod
+    def _trim_mistakes(user_id: str, excess: int):
+        """Retenció per usuari: esborrem els errors més antics que passen del límit."""
+        oldest = DatabaseService._mistakes_ref(user_id).order_by('updated_at').limit(excess).stream()
+        batch = db.batch()
+        deleted = 0
+        for doc in oldest:
+            batch.delete(doc.reference)
+            deleted += 1
+        if deleted:
+            batch.set(db.collection('users').document(user_id), {'mistakes_count': firestore.Increment(-deleted)}, merge=True)
+            batch.commit()
+            user_cache.apply(user_id, {'mistakes_count': firestore.Increment(-deleted)})
+            mistakes_cache.invalidate(user_id)
+
+    @staticmethod
+    def _stage_review(batch, user_id: str, active_ids: list, wrong_stems: list) -> int:
+        """
+        Regla del 2 per als errors avaluats en un repàs: si s'encerta suma 'mastery',
+        si es falla torna a 0, i amb 2 encerts seguits l'error surt de la llista.
+        'active_ids' són les claus dels documents (l'enunciat guardat està retallat i no
+        sempre dona la mateixa clau). Retorna el canvi en el nombre d'errors (0 o negatiu).
+        """
+        if not active_ids:
+            return 0
+        col = DatabaseService._mistakes_ref(user_id)
+        wrong = {DatabaseService.mistake_id(stem) for stem in wrong_stems}
+        # Repassos començats abans de guardar claus: encara hi ha enunciats
+        refs = [
+            col.document(key if re.fullmatch(r"[0-9a-f]{40}", key or "") else DatabaseService.mistake_id(key))
+            for key in active_ids
+        ]
+
+        removed = 0
+        for snap in db.get_all(refs):
+            if not snap.exists:
+                continue
+            mastery = 0 if snap.id in wrong else (snap.to_dict().get('mastery', 0) + 1)
+            if mastery >= 2:
+                batch.delete(snap.reference)
+                removed += 1
+            else:
+                batch.update(snap.reference, {'mastery': mastery})
+        return -removed
+
     # ==========================================
     # 4. FLASHCARDS I REPORTS
     # ==========================================
@@ -294,6 +629,69 @@ class DatabaseService:
             return [doc.to_dict().get('exercise_id') for doc in docs if doc.to_dict().get('exercise_id')]
         except: return []
 
+    @staticmethod
+    def _new_seen_filter() -> SeenFilter:
+        return SeenFilter(settings.SEEN_FILTER_CAPACITY, settings.SEEN_FILTER_FP_RATE)
+
+    @staticmethod
+    def _build_seen_filter_from_history(user_id: str) -> SeenFilter:
+        """Migració: el primer cop omplim el filtre amb l'historial antic de 'user_results'."""
+        seen = DatabaseService._new_seen_filter()
+        for ex_id in DatabaseService.get_user_completed_ids(user_id):
+            seen.add(ex_id)
+        return seen
+
+    @staticmethod
+    def get_user_seen_filter(user_id: str) -> SeenFilter:
+        """
+        Retorna el conjunt compacte d'exercicis vistos per l'usuari (1 sola lectura).
+        Substitueix el 'stream' de tots els 'user_results' a cada petició.
+        """
+        try:
+            ref = db.collection("user_seen").document(user_id)
+            doc = ref.get()
+            if doc.exists:
+                return SeenFilter.from_dict(
+                    doc.to_dict().get("filter"),
+                    settings.SEEN_FILTER_CAPACITY,
+                    settings.SEEN_FILTER_FP_RATE
+                )
+
+            seen = DatabaseService._build_seen_filter_from_history(user_id)
+            ref.set({"filter": seen.to_dict(), "updated_at": datetime.now()})
+            return seen
+        except Exception as e:
+            print(f"❌ Error llegint el filtre d'exercicis vistos: {e}")
+            return DatabaseService._new_seen_filter()
+
+    @staticmethod
+    def mark_exercise_seen(user_id: str, exercise_id: str) -> bool:
+        """Afegeix un exercici al filtre de vistos de l'usuari (transacció per no perdre escriptures)."""
+        if not user_id or not exercise_id:
+            return False
+        try:
+            ref = db.collection("user_seen").document(user_id)
+
+            @firestore.transactional
+            def add_seen(transaction, ref):
+                snapshot = ref.get(transaction=transaction)
+                if snapshot.exists:
+                    seen = SeenFilter.from_dict(
+                        snapshot.to_dict().get("filter"),
+                        settings.SEEN_FILTER_CAPACITY,
+                        settings.SEEN_FILTER_FP_RATE
+                    )
+                else:
+                    seen = DatabaseService._build_seen_filter_from_history(user_id)
+                seen.add(exercise_id)
+                transaction.set(ref, {"filter": seen.to_dict(), "updated_at": datetime.now()})
+
+            add_seen(db.transaction(), ref)
+            return True
+        except Exception as e:
+            print(f"❌ Error actualitzant exercicis vistos: {e}")
+            return False
+
     @staticmethod
     def save_enriched_vocabulary(user_id: str, enriched_words: list):
         """
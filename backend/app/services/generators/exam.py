@@ -12,9 +12,9 @@ class ExamGenerator:
         2. Si no en troba, els genera amb IA al moment.
         """
         
-        # 1. Recuperem l'historial de l'usuari per no repetir preguntes
-        # Assumim que DatabaseService té un mètode per obtenir això, o ho fem manual:
-        completed_ids = DatabaseService.get_user_completed_ids(user_id)
+        # 1. Recuperem el filtre compacte d'exercicis vistos per no repetir preguntes
+        # (1 lectura, no creix amb l'historial de l'usuari)
+        completed_ids = DatabaseService.get_user_seen_filter(user_id)
         
         exam_structure = [
             "reading_and_use_of_language1",
@@ -44,10 +44,12 @@ class ExamGenerator:
                 print(f"   ⚙️ GENERANT (IA): {etype}...")
                 exercise_obj = ExerciseFactory.create_exercise(etype, level)
                 exercise_data = exercise_obj.model_dump()
+                exercise_data.setdefault("level", level)
+                exercise_data.setdefault("type", etype)
                 
                 # IMPORTANT: Guardem el nou exercici a la DB per al futur!
                 # Així el pròxim usuari se'l trobarà al Pool.
-                new_id = DatabaseService.save_exercise(exercise_data, level, etype, is_public=True)
+                new_id = DatabaseService.save_exercise(exercise_data, is_public=True)
                 exercise_data['_id'] = new_id # Assegurem que té ID
                 
                 return etype, exercise_data
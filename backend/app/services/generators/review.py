@@ -1,39 +1,18 @@
 import random
-from openai import OpenAI
-import os
 import json
 from dotenv import load_dotenv
+from app.services.llm import llm
 
 load_dotenv()
 
 class ReviewGenerator:
-    def __init__(self, mistakes: list):
-        self.mistakes = mistakes
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.selected_mistakes = []
-
-    def generate(self, level: str):
-        print(f"🔄 ReviewGenerator: Creant examen de diagnòstic híbrid...")
-        
-        # 1. Seleccionem un màxim de 6 errors per evitar fatiga cognitiva
-        self.selected_mistakes = random.sample(self.mistakes, min(6, len(self.mistakes)))
-        
-        # 2. Construïm el context rigorós pel Prompt
-        mistakes_context = ""
-        for i, m in enumerate(self.selected_mistakes):
-            m_type = m.get('type', 'Unknown')
-            m_stem = m.get('stem') or m.get('question', 'Unknown context')
-            m_correct = m.get('correct_answer', 'Unknown')
-            mistakes_context += f"- MISTAKE {i+1} (Original Type: {m_type}):\n  Original Context: {m_stem}\n  Target Answer Needed: {m_correct}\n\n"
-
-        prompt = f"""
+    # Prompt estàtic (idèntic a totes les crides) perquè OpenAI en pugui reaprofitar el prefix
+    SYSTEM_PROMPT = """
         You are an elite Cambridge C1/C2 tutor. Your task is to generate a "Dynamic Diagnostic Exam" for a student based on their past mistakes.
-        
-        PAST MISTAKES TO TARGET:
-        {mistakes_context}
+        The student's PAST MISTAKES and the exact number of questions are given in the user message.
         
         INSTRUCTIONS:
-        1. Generate EXACTLY {len(self.selected_mistakes)} questions. Each question must target ONE of the mistakes above.
+        1. Generate EXACTLY the requested number of questions. Each question must target ONE of the past mistakes.
         2. CRITICAL: Do NOT reuse the 'Original Context'. You must create a COMPLETELY NEW sentence/context that forces the student to use the exact same grammar rule or vocabulary word ('Target Answer Needed').
         
         QUESTION FORMATTING RULES:
@@ -44,28 +23,56 @@ class ReviewGenerator:
           "Rewrite using the keyword: [KEYWORD]. Original: [Sentence]. -> [New sentence with ________]"
           
         OUTPUT VALID JSON STRUCTURE:
-        {{
+        {
             "type": "review_exam",
             "title": "Targeted Diagnostic Exam",
             "instructions": "Answer these questions specifically tailored to target your historical weak points.",
             "text": "",
             "questions": [
-                {{
+                {
                     "question": "[The new sentence containing the gap ________]",
                     "options": ["Option A", "Option B", "Option C", "Option D"], 
                     "answer": "[The exact correct word/phrase]",
                     "explanation": "[Brief pedagogical explanation of the underlying rule]"
-                }}
+                }
             ]
-        }}
+        }
         """
+
+    def __init__(self, mistakes: list):
+        self.mistakes = mistakes
+        self.selected_mistakes = []
+
+    def generate(self, level: str):
+        print(f"🔄 ReviewGenerator: Creant examen de diagnòstic híbrid...")
+        
+        # 1. Seleccionem un màxim de 6 errors per evitar fatiga cognitiva
+        self.selected_mistakes = random.sample(self.mistakes, min(6, len(self.mistakes)))
         
+        # 2. Construïm el context rigorós pel Prompt
+        mistakes_context = ""
+        for i, m in enumerate(self.selected_mistakes):
+            m_type = m.get('type', 'Unknown')
+            m_stem = m.get('stem') or m.get('question', 'Unknown context')
+            m_correct = m.get('correct_answer', 'Unknown')
+            mistakes_context += f"- MISTAKE {i+1} (Original Type: {m_type}):\n  Original Context: {m_stem}\n  Target Answer Needed: {m_correct}\n\n"
+
+        # 3. Dades de la petició AL FINAL: el prompt estàtic queda com a prefix cacheable
+        request = (
+            f"PAST MISTAKES TO TARGET:\n{mistakes_context}"
+            f"Generate EXACTLY {len(self.selected_mistakes)} questions. Each question must target ONE of the mistakes above."
+        )
+
         try:
-            response = self.client.chat.completions.create(
+            response = llm.chat(
                 model="gpt-4o", # Utilitzem el model superior per garantir el format JSON híbrid
-                messages=[{"role": "system", "content": prompt}],
+                messages=[
+                    {"role": "system", "content": ReviewGenerator.SYSTEM_PROMPT},
+                    {"role": "user", "content": request},
+                ],
                 temperature=0.7,
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                label="review"
             )
             
             content = response.choices[0].message.content
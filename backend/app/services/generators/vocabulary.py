@@ -1,14 +1,10 @@
-from openai import OpenAI
-import os
 import json
 from dotenv import load_dotenv
+from app.services.llm import llm
 
 load_dotenv()
 
 class VocabularyGenerator:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
     def generate_flashcards(self, mistakes):
         # Limitem a 12 errors recents
         recent_mistakes = mistakes[-12:] 
@@ -56,7 +52,7 @@ class VocabularyGenerator:
         
         try:
             print(f"🃏 Generant flashcards estructurades per a {len(error_context)} errors...")
-            response = self.client.chat.completions.create(
+            response = llm.chat(
                 model="gpt-4o-mini",
                 messages=[{"role": "system", "content": prompt}],
                 temperature=0.6,
@@ -1,19 +1,28 @@
 import json
-from openai import OpenAI
-from app.core.config import settings
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from app.services.llm import llm
 
 class CorrectionService:  # 👈 ABANS ES DEIA 'Grader'
     
     @staticmethod
     def grade_writing(task_prompt: str, user_text: str, level: str = "C1"):
-        # --- MODIFICACIÓ PAS 2.1: DEMANAR MODEL ANSWER ---
-        prompt = f"""
-        You are a strict Cambridge English {level} examiner.
-        
-        TASK INSTRUCTIONS: "{task_prompt}"
-        STUDENT ESSAY: "{user_text}"
+        return CorrectionService._call_ai(CorrectionService._writing_prompt(task_prompt, user_text, level), "grade:writing")
+
+    @staticmethod
+    def grade_speaking(task_prompt: str, transcript_text: str, level: str = "C1"):
+        return CorrectionService._call_ai(CorrectionService._speaking_prompt(task_prompt, transcript_text, level), "grade:speaking")
+
+    @staticmethod
+    async def agrade_writing(task_prompt: str, user_text: str, level: str = "C1"):
+        return await CorrectionService._acall_ai(CorrectionService._writing_prompt(task_prompt, user_text, level), "grade:writing")
+
+    @staticmethod
+    async def agrade_speaking(task_prompt: str, transcript_text: str, level: str = "C1"):
+        return await CorrectionService._acall_ai(CorrectionService._speaking_prompt(task_prompt, transcript_text, level), "grade:speaking")
+
+    # --- PROMPTS ESTÀTICS (prefix cacheable per OpenAI: no hi posem res de l'alumne) ---
+    # --- MODIFICACIÓ PAS 2.1: DEMANAR MODEL ANSWER ---
+    WRITING_SYSTEM_PROMPT = """
+        You are a strict Cambridge English examiner. The target level (C1/C2) is given in the user message.
         
         ACTION:
         1. Grade the essay based on the official Cambridge scale (0-5 per criteria): 
@@ -22,10 +31,10 @@ class CorrectionService:  # 👈 ABANS ES DEIA 'Grader'
            - Organization
            - Language
         2. Provide specific feedback and corrections.
-        3. CRITICAL: Write a "MODEL ANSWER". This should be a perfect {level} level essay (approx 220-260 words) responding to the same task, so the student can learn by example.
+        3. CRITICAL: Write a "MODEL ANSWER". This should be a perfect essay at the target level (approx 220-260 words) responding to the same task, so the student can learn by example.
         
         Output valid JSON only:
-        {{
+        {
             "content_score": 0-5,
             "communicative_score": 0-5,
             "organization_score": 0-5,
@@ -33,63 +42,90 @@ class CorrectionService:  # 👈 ABANS ES DEIA 'Grader'
             "score": 0-20,  <-- Sum of the above
             "feedback": "General feedback on strengths and weaknesses...",
             "corrections": [
-                {{
+                {
                     "original": "error phrase",
                     "correction": "corrected phrase",
                     "explanation": "Grammar/Vocab reason"
-                }}
+                }
             ],
             "model_answer": "Here write the full text of the perfect example essay..."
-        }}
+        }
         """
-        return CorrectionService._call_ai(prompt)
 
-    @staticmethod
-    def grade_speaking(task_prompt: str, transcript_text: str, level: str = "C1"):
-        prompt = f"""
-        You are a Cambridge English {level} ORAL examiner.
-        
-        TASK: "{task_prompt}"
-        STUDENT TRANSCRIPT (Speech-to-text): "{transcript_text}"
+    SPEAKING_SYSTEM_PROMPT = """
+        You are a Cambridge English ORAL examiner. The target level (C1/C2) is given in the user message.
         
-        Analyze this spoken response. 
+        Analyze the student's spoken response. 
         NOTE: Since this is a transcript, ignore minor punctuation errors. Focus on:
         - Grammatical range and accuracy.
         - Vocabulary diversity.
         - Discourse management (coherence, connectors).
         
         Output valid JSON only:
-        {{
+        {
             "score": 14, 
             "feedback": "Feedback on fluency and vocabulary usage...",
             "corrections": [
-                {{
+                {
                     "original": "unnatural phrasing",
                     "correction": "more natural C1 phrasing",
                     "explanation": "Why this sounds better"
-                }}
+                }
             ],
             "model_answer": "Write a short paragraph of how a native speaker would answer this question perfectly."
-        }}
+        }
         """
-        return CorrectionService._call_ai(prompt)
 
     @staticmethod
-    def _call_ai(prompt):
+    def _writing_prompt(task_prompt: str, user_text: str, level: str = "C1") -> list:
+        # Les dades de l'alumne van SEMPRE al final
+        return [
+            {"role": "system", "content": CorrectionService.WRITING_SYSTEM_PROMPT},
+            {"role": "user", "content": f'LEVEL: Cambridge English {level}\n\nTASK INSTRUCTIONS: "{task_prompt}"\nSTUDENT ESSAY: "{user_text}"'},
+        ]
+
+    @staticmethod
+    def _speaking_prompt(task_prompt: str, transcript_text: str, level: str = "C1") -> list:
+        return [
+            {"role": "system", "content": CorrectionService.SPEAKING_SYSTEM_PROMPT},
+            {"role": "user", "content": f'LEVEL: Cambridge English {level}\n\nTASK: "{task_prompt}"\nSTUDENT TRANSCRIPT (Speech-to-text): "{transcript_text}"'},
+        ]
+
+    # Estructura d'error segura per no trencar el frontend
+    ERROR_RESPONSE = {
+        "score": 0,
+        "feedback": "There was an error processing the correction. Please try again.",
+        "corrections": [],
+        "model_answer": "Error generating model answer."
+    }
+
+    @staticmethod
+    async def _acall_ai(messages: list, label: str = None):
+        try:
+            response = await llm.achat(
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.4,
+                response_format={"type": "json_object"},
+                label=label
+            )
+            return json.loads(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error calling AI Grader: {e}")
+            return dict(CorrectionService.ERROR_RESPONSE)
+
+    @staticmethod
+    def _call_ai(messages: list, label: str = None):
         try:
-            response = client.chat.completions.create(
+            response = llm.chat(
                 model="gpt-4o",  # Recomano gpt-4o per corregir millor, si vols estalviar posa gpt-4o-mini
-                messages=[{"role": "system", "content": prompt}],
+                messages=messages,
                 temperature=0.4, # Temperatura baixa per a correccions consistents
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                label=label
             )
             return json.loads(response.choices[0].message.content)
         except Exception as e:
             print(f"Error calling AI Grader: {e}")
             # Retornem una estructura d'error segura per no trencar el frontend
-            return {
-                "score": 0,
-                "feedback": "There was an error processing the correction. Please try again.",
-                "corrections": [],
-                "model_answer": "Error generating model answer."
-            }
\ No newline at end of file
+            return dict(CorrectionService.ERROR_RESPONSE)
\ No newline at end of file
@@ -1,7 +1,4 @@
-from openai import OpenAI
-from app.core.config import settings
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from app.services.llm import llm
 
 class ImageService:
     @staticmethod
@@ -12,14 +9,12 @@ class ImageService:
         """
         try:
             print(f"🎨 Pintant imatge: {description[:30]}...")
-            response = client.images.generate(
+            return llm.image(
+                f"Realistic photo for a Cambridge English exam task. Scene: {description}. Clear, neutral lighting, photorealistic style.",
                 model="dall-e-3",
-                prompt=f"Realistic photo for a Cambridge English exam task. Scene: {description}. Clear, neutral lighting, photorealistic style.",
                 size="1024x1024",
-                quality="standard",
-                n=1,
+                quality="standard"
             )
-            return response.data[0].url
         except Exception as e:
             print(f"⚠️ Error generant imatge: {e}")
             # Retornem una imatge placeholder per si falla (o per estalviar diners)
@@ -0,0 +1,158 @@
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from app.core.config import settings
+from app.services.db import DatabaseService
+
+# Cada quant tornem a llegir la biblioteca de Firestore (imatges desades per altres workers)
+LIBRARY_REFRESH_SECONDS = 600
+
+# Preferim una imatge guardada per a la mateixa variació (individual / grup / contrast)
+SAME_SLOT_BONUS = 0.1
+
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "into", "about", "their", "them", "they", "this", "that",
+    "are", "was", "were", "has", "have", "its", "our", "your", "how", "why", "what", "who",
+    "vs", "versus", "between", "around", "different", "various", "people", "speaking", "part", "topic", "general",
+}
+WORD_PATTERN = re.compile(r"[a-z]{3,}")
+
+
+def _stem(word: str) -> str:
+    # Arrel molt lleugera: 'celebrations' ~ 'celebration', 'working' ~ 'work'
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: len(word) - len(suffix)] + replacement
+    return word
+
+
+def topic_tokens(topic: str) -> set:
+    return {_stem(word) for word in WORD_PATTERN.findall(topic.lower()) if word not in STOPWORDS}
+
+
+class ImageLibrary:
+    """
+    Biblioteca persistent d'imatges de Speaking Part 2 (col·lecció 'image_library'), indexada
+    per tema i variació. Un índex lèxic en memòria (paraules -> imatges, pesades per IDF) troba
+    imatges guardades per a temes semblants: només cridem DALL-E si cap passa del llindar.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._entries = {}                  # id -> {"topic", "slot", "url", "tokens"}
+        self._index = defaultdict(set)      # token -> ids
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "misses": 0, "images_avoided": 0, "added": 0}
+
+    # ==========================================
+    # CONSULTA
+    # ==========================================
+
+    def choose(self, topic: str, count: int) -> list:
+        """
+        Una imatge diferent per a cada variació (0..count-1), o None on no n'hi ha cap de prou semblant.
+        """
+        chosen = []
+        for slot in range(count):
+            match = self.find(topic, slot, exclude={entry["url"] for entry in chosen if entry})
+            chosen.append(match)
+        return chosen
+
+    def find(self, topic: str, slot: int, exclude: set = frozenset()):
+        self._ensure_loaded()
+        tokens = topic_tokens(topic)
+        with self._lock:
+            self._counters["lookups"] += 1
+            best, best_score = None, 0.0
+            candidates = set().union(*(self._index.get(token, ()) for token in tokens)) if tokens else set()
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry["url"] in exclude:
+                    continue
+                similarity = self._similarity_locked(tokens, entry["tokens"])
+                if similarity < self.threshold:
+                    continue
+                score = similarity + (SAME_SLOT_BONUS if entry["slot"] == slot else 0.0)
+                if score > best_score:
+                    best, best_score = entry, score
+
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            self._counters["images_avoided"] += 1
+            return {"url": best["url"], "variants": best["variants"], "topic": best["topic"], "similarity": round(best_score, 3)}
+
+    def _similarity_locked(self, a: set, b: set) -> float:
+        """Cosinus entre conjunts de paraules pesades per IDF (les paraules rares pesen més)."""
+        total = len(self._entries) + 1
+
+        def weight(token):
+            return math.log(total / (1 + len(self._index.get(token, ())))) + 1.0
+
+        shared = sum(weight(token) ** 2 for token in a & b)
+        if not shared:
+            return 0.0
+        norm_a = math.sqrt(sum(weight(token) ** 2 for token in a))
+        norm_b = math.sqrt(sum(weight(token) ** 2 for token in b))
+        return shared / (norm_a * norm_b)
+
+    # ==========================================
+    # ALTA I CÀRREGA
+    # ==========================================
+
+    def add(self, topic: str, slot: int, prompt: str, url: str, variants: dict = None):
+        """Desa una imatge ja pujada a Storage (mai URLs temporals de DALL-E, caduquen)."""
+        data = {"topic": topic, "slot": slot, "prompt": prompt, "url": url, "variants": variants}
+        try:
+            entry_id = DatabaseService.save_library_image(data)
+        except Exception as e:
+            print(f"⚠️ IMAGE LIBRARY: No s'ha pogut desar la imatge: {e}")
+            return
+        with self._lock:
+            self._add_locked(entry_id, data)
+            self._counters["added"] += 1
+
+    def _add_locked(self, entry_id: str, data: dict):
+        if entry_id in self._entries or not data.get("url"):
+            return
+        tokens = topic_tokens(data.get("topic", ""))
+        self._entries[entry_id] = {
+            "topic": data.get("topic", ""),
+            "slot": data.get("slot"),
+            "url": data["url"],
+            "variants": data.get("variants"),
+            "tokens": tokens,
+        }
+        for token in tokens:
+            self._index[token].add(entry_id)
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < LIBRARY_REFRESH_SECONDS:
+            return
+        try:
+            entries = DatabaseService.get_image_library()
+        except Exception as e:
+            print(f"⚠️ IMAGE LIBRARY: No s'ha pogut carregar la biblioteca: {e}")
+            entries = []
+        with self._lock:
+            for entry_id, data in entries:
+                self._add_locked(entry_id, data)
+            self._loaded_at = time.monotonic()
+
+    def status(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        return {
+            "images": size,
+            "threshold": self.threshold,
+            "counters": counters,
+            "hit_rate": round(counters["hits"] / counters["lookups"], 3) if counters["lookups"] else 0.0,
+        }
+
+
+image_library = ImageLibrary(settings.IMAGE_LIBRARY_THRESHOLD)
@@ -0,0 +1,74 @@
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow és opcional: sense ell només guardem l'original
+    Image = None
+
+# Variants WebP que guardem al costat de l'original (amplades en píxels)
+VARIANT_WIDTHS = (1024, 640, 320)
+WEBP_QUALITY = 80
+# Variant per defecte ('src'): prou per a mòbil i ~10x més lleugera que el PNG original
+DEFAULT_WIDTH = 640
+
+# Processos per codificar: els workers de l'API no paguen la CPU de la compressió
+VARIANT_PROCESSES = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def encode_variants(path: str, widths: tuple = VARIANT_WIDTHS, quality: int = WEBP_QUALITY) -> dict:
+    """
+    Llegeix la imatge de 'path' i retorna {amplada: bytes WebP}. S'executa en un altre procés
+    (ha de ser una funció de mòdul perquè es pugui serialitzar).
+    """
+    variants = {}
+    with Image.open(path) as original:
+        original = original.convert("RGB")
+        for width in widths:
+            image = original
+            if original.width > width:
+                height = round(original.height * width / original.width)
+                image = original.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="WEBP", quality=quality, method=4)
+            variants[width] = buffer.getvalue()
+    return variants
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # 'spawn': no copiem l'estat del procés de l'API (threads, clients gRPC de Firestore)
+                _pool = ProcessPoolExecutor(max_workers=VARIANT_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def render_variants(path: str) -> dict:
+    """Variants de la imatge en un procés a part. {} si no tenim Pillow."""
+    global _pool
+    if not available():
+        return {}
+    try:
+        return _get_pool().submit(encode_variants, path).result()
+    except BrokenProcessPool:
+        # Un procés ha mort (p.ex. per memòria): el pròxim intent crearà una pool nova
+        with _pool_lock:
+            _pool = None
+        raise
+
+
+def srcset(variant_urls: dict) -> str:
+    """{amplada: url} -> "url 320w, url 640w, url 1024w" (per a <img srcset>)."""
+    return ", ".join(f"{url} {width}w" for width, url in sorted(variant_urls.items()))
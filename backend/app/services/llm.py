@@ -0,0 +1,340 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from app.core.config import settings
+
+# Errors que val la pena reintentar (la resta, p.ex. BadRequest, fallen de seguida)
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Crides simultànies màximes per model (la resta s'esperen al semàfor)
+MODEL_CONCURRENCY = {
+    "gpt-4o": 8,
+    "gpt-4o-mini": 16,
+    "dall-e-3": 3,
+    "tts-1": 6,
+    "whisper-1": 4,
+}
+DEFAULT_CONCURRENCY = 4
+# Threads que esperen un semàfor ple per a les crides async (el bucle d'esdeveniments no es bloqueja)
+ASYNC_WAIT_WORKERS = 32
+
+# Timeouts per tipus de crida (segons)
+DEFAULT_TIMEOUTS = {
+    "chat": 120.0,
+    "speech": 90.0,
+    "image": 120.0,
+    "transcription": 180.0,
+}
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+
+
+class LLMGateway:
+    """
+    Porta d'entrada ÚNICA a OpenAI per a tot el backend.
+    - Un sol client amb connexions HTTP reutilitzades (pool de keep-alive).
+    - Semàfors de concurrència per model, compartits per les crides sync i async (un sol límit).
+    - Reintents amb backoff exponencial + jitter i timeout per crida.
+    Té variants 'a*' (async) perquè milers d'esperes a OpenAI siguin corrutines, no threads.
+    """
+
+    def __init__(self, api_key: str, max_connections: int = 50, max_retries: int = 3):
+        self.max_retries = max_retries
+        self._http = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(max(DEFAULT_TIMEOUTS.values()), connect=10.0),
+        )
+        # Els reintents els fem nosaltres (amb jitter i alliberant el semàfor mentre esperem)
+        self.client = OpenAI(api_key=api_key, http_client=self._http, max_retries=0)
+
+        self._async_http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(max(DEFAULT_TIMEOUTS.values()), connect=10.0),
+        )
+        self.async_client = AsyncOpenAI(api_key=api_key, http_client=self._async_http, max_retries=0)
+
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._wait_executor = ThreadPoolExecutor(max_workers=ASYNC_WAIT_WORKERS, thread_name_prefix="llm-wait")
+        self._stats = {}
+        self._usage = {}    # label -> tokens (i cached_tokens) i temps de les crides de chat
+
+    def _semaphore(self, model: str) -> threading.BoundedSemaphore:
+        sem = self._semaphores.get(model)
+        if sem is None:
+            with self._lock:
+                sem = self._semaphores.setdefault(
+                    model, threading.BoundedSemaphore(MODEL_CONCURRENCY.get(model, DEFAULT_CONCURRENCY))
+                )
+        return sem
+
+    @contextlib.asynccontextmanager
+    async def _async_slot(self, model: str):
+        """
+        El mateix semàfor que les crides sync: si no hi ha lloc, l'esperem en un thread a part
+        perquè el bucle d'esdeveniments continuï.
+        """
+        sem = self._semaphore(model)
+        if not sem.acquire(blocking=False):
+            future = asyncio.get_running_loop().run_in_executor(self._wait_executor, sem.acquire)
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # El thread l'acabarà obtenint igualment: el tornem tan bon punt el tingui
+                future.add_done_callback(lambda _: sem.release())
+                raise
+        try:
+            yield
+        finally:
+            sem.release()
+
+    def _record(self, model: str, field: str, amount: float = 1):
+        with self._lock:
+            stats = self._stats.setdefault(model, {"calls": 0, "retries": 0, "errors": 0, "in_flight": 0, "seconds": 0.0})
+            stats[field] += amount
+
+    def _record_usage(self, label: str, usage, seconds: float):
+        """Guarda els tokens d'una resposta de chat (inclosos els servits des de la cache de prompts)."""
+        if not label:
+            return
+        details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+        with self._lock:
+            stats = self._usage.setdefault(label, {
+                "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "seconds": 0.0
+            })
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            if usage is not None:
+                stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+                stats["cached_tokens"] += (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # "Full jitter": esperem un temps aleatori entre 0 i el límit exponencial
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    def _call(self, fn, **kwargs):
+        model = kwargs["model"]
+        for attempt in range(self.max_retries + 1):
+            with self._semaphore(model):
+                self._record(model, "in_flight", 1)
+                started = time.monotonic()
+                try:
+                    result = fn(**kwargs)
+                    self._record(model, "calls", 1)
+                    return result
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        self._record(model, "errors", 1)
+                        raise
+                    print(f"🔁 LLM: {model} ha fallat ({type(e).__name__}). Reintent {attempt + 1}/{self.max_retries}...")
+                    self._record(model, "retries", 1)
+                except Exception:
+                    self._record(model, "errors", 1)
+                    raise
+                finally:
+                    self._record(model, "in_flight", -1)
+                    self._record(model, "seconds", time.monotonic() - started)
+            # Esperem FORA del semàfor perquè altres crides puguin avançar
+            time.sleep(self._backoff(attempt))
+
+    async def _acall(self, fn, **kwargs):
+        model = kwargs["model"]
+        for attempt in range(self.max_retries + 1):
+            async with self._async_slot(model):
+                self._record(model, "in_flight", 1)
+                started = time.monotonic()
+                try:
+                    result = await fn(**kwargs)
+                    self._record(model, "calls", 1)
+                    return result
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        self._record(model, "errors", 1)
+                        raise
+                    print(f"🔁 LLM: {model} ha fallat ({type(e).__name__}). Reintent {attempt + 1}/{self.max_retries}...")
+                    self._record(model, "retries", 1)
+                except Exception:
+                    self._record(model, "errors", 1)
+                    raise
+                finally:
+                    self._record(model, "in_flight", -1)
+                    self._record(model, "seconds", time.monotonic() - started)
+            await asyncio.sleep(self._backoff(attempt))
+
+    # ==========================================
+    # API PÚBLICA
+    # ==========================================
+
+    def chat(self, model: str, messages: list, timeout: float = None, label: str = None, **kwargs):
+        """
+        Chat completion. Retorna la resposta sencera (per poder llegir 'usage').
+        'label' (p.ex. "exercise:listening1") agrupa els tokens i cached_tokens a usage_status().
+        """
+        started = time.monotonic()
+        response = self._call(
+            self.client.chat.completions.create,
+            model=model,
+            messages=messages,
+            timeout=timeout or DEFAULT_TIMEOUTS["chat"],
+            **kwargs
+        )
+        self._record_usage(label, getattr(response, "usage", None), time.monotonic() - started)
+        return response
+
+    def speech(self, text: str, model: str = "tts-1", voice: str = "alloy", timeout: float = None) -> bytes:
+        """Text a àudio (MP3). Retorna els bytes."""
+        response = self._call(
+            self.client.audio.speech.create,
+            model=model,
+            voice=voice,
+            input=text,
+            timeout=timeout or DEFAULT_TIMEOUTS["speech"],
+        )
+        return response.content
+
+    def image(self, prompt: str, model: str = "dall-e-3", size: str = "1024x1024", quality: str = "standard", timeout: float = None) -> str:
+        """Genera una imatge i retorna la URL temporal."""
+        response = self._call(
+            self.client.images.generate,
+            model=model,
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            n=1,
+            timeout=timeout or DEFAULT_TIMEOUTS["image"],
+        )
+        return response.data[0].url
+
+    def transcribe(self, file, model: str = "whisper-1", timeout: float = None) -> str:
+        """Transcriu un fitxer d'àudio obert en mode binari."""
+        def create(**kwargs):
+            # Si és un reintent, tornem a llegir el fitxer des del principi
+            file.seek(0)
+            return self.client.audio.transcriptions.create(**kwargs)
+
+        response = self._call(
+            create,
+            model=model,
+            file=file,
+            timeout=timeout or DEFAULT_TIMEOUTS["transcription"],
+        )
+        return response.text
+
+    # ==========================================
+    # API PÚBLICA (ASYNC)
+    # ==========================================
+
+    async def achat(self, model: str, messages: list, timeout: float = None, label: str = None, **kwargs):
+        started = time.monotonic()
+        response = await self._acall(
+            self.async_client.chat.completions.create,
+            model=model,
+            messages=messages,
+            timeout=timeout or DEFAULT_TIMEOUTS["chat"],
+            **kwargs
+        )
+        self._record_usage(label, getattr(response, "usage", None), time.monotonic() - started)
+        return response
+
+    async def astream_chat(self, model: str, messages: list, timeout: float = None, label: str = None, **kwargs):
+        """
+        Chat completion en streaming: va retornant els fragments de text a mesura que arriben.
+        Només reintentem si falla ABANS del primer token (després ja n'hem enviat al client).
+        """
+        for attempt in range(self.max_retries + 1):
+            started_output = False
+            async with self._async_slot(model):
+                self._record(model, "in_flight", 1)
+                started = time.monotonic()
+                try:
+                    stream = await self.async_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        # L'últim fragment porta 'usage' (i els cached_tokens)
+                        stream_options={"include_usage": True},
+                        timeout=timeout or DEFAULT_TIMEOUTS["chat"],
+                        **kwargs
+                    )
+                    usage = None
+                    async for chunk in stream:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            started_output = True
+                            yield chunk.choices[0].delta.content
+                    self._record(model, "calls", 1)
+                    self._record_usage(label, usage, time.monotonic() - started)
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if started_output or attempt >= self.max_retries:
+                        self._record(model, "errors", 1)
+                        raise
+                    print(f"🔁 LLM: {model} (stream) ha fallat ({type(e).__name__}). Reintent {attempt + 1}/{self.max_retries}...")
+                    self._record(model, "retries", 1)
+                except Exception:
+                    self._record(model, "errors", 1)
+                    raise
+                finally:
+                    self._record(model, "in_flight", -1)
+                    self._record(model, "seconds", time.monotonic() - started)
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def aspeech(self, text: str, model: str = "tts-1", voice: str = "alloy", timeout: float = None) -> bytes:
+        response = await self._acall(
+            self.async_client.audio.speech.create,
+            model=model,
+            voice=voice,
+            input=text,
+            timeout=timeout or DEFAULT_TIMEOUTS["speech"],
+        )
+        return response.content
+
+    async def aimage(self, prompt: str, model: str = "dall-e-3", size: str = "1024x1024", quality: str = "standard", timeout: float = None) -> str:
+        response = await self._acall(
+            self.async_client.images.generate,
+            model=model,
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            n=1,
+            timeout=timeout or DEFAULT_TIMEOUTS["image"],
+        )
+        return response.data[0].url
+
+    async def atranscribe(self, file, model: str = "whisper-1", timeout: float = None) -> str:
+        async def create(**kwargs):
+            file.seek(0)
+            return await self.async_client.audio.transcriptions.create(**kwargs)
+
+        response = await self._acall(
+            create,
+            model=model,
+            file=file,
+            timeout=timeout or DEFAULT_TIMEOUTS["transcription"],
+        )
+        return response.text
+
+    def status(self) -> dict:
+        with self._lock:
+            return {model: dict(stats) for model, stats in self._stats.items()}
+
+    def usage_status(self) -> dict:
+        """Per 'label': tokens, % servit de la cache de prompts i latència mitjana."""
+        with self._lock:
+            usage = {label: dict(stats) for label, stats in self._usage.items()}
+        for stats in usage.values():
+            stats["cache_hit_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+            stats["avg_seconds"] = round(stats["seconds"] / stats["calls"], 3) if stats["calls"] else 0.0
+        return usage
+
+
+llm = LLMGateway(settings.OPENAI_API_KEY, settings.LLM_MAX_CONNECTIONS, settings.LLM_MAX_RETRIES)
@@ -0,0 +1,97 @@
+# Utilitats mínimes per a MP3 (sense dependències): llegir capçaleres de frame,
+# calcular la durada real i concatenar fitxers a nivell de frame.
+# Només cal MPEG Layer III, que és el que retorna el TTS d'OpenAI.
+
+# Bitrates (kbps) per índex: MPEG-1 Layer III i MPEG-2/2.5 Layer III
+BITRATES_V1_L3 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0]
+BITRATES_V2_L3 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0]
+
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],   # MPEG-1
+    2: [22050, 24000, 16000],   # MPEG-2
+    0: [11025, 12000, 8000],    # MPEG-2.5
+}
+
+ID3V1_SIZE = 128
+
+
+def _id3v2_size(data: bytes, pos: int = 0) -> int:
+    """Mida de l'etiqueta ID3v2 que comença a 'pos' (0 si no n'hi ha)."""
+    if data[pos:pos + 3] != b"ID3" or len(data) < pos + 10:
+        return 0
+    size = 0
+    for byte in data[pos + 6:pos + 10]:
+        size = (size << 7) | (byte & 0x7F)     # enter "syncsafe" de 28 bits
+    footer = 10 if data[pos + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def parse_frame_header(data: bytes, pos: int):
+    """
+    Retorna (mida_frame, mostres, sample_rate) del frame a 'pos', o None si no és una capçalera vàlida.
+    """
+    if pos + 4 > len(data):
+        return None
+    b1, b2 = data[pos + 1], data[pos + 2]
+    if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03      # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = (b1 >> 1) & 0x03        # 1 = Layer III
+    if version == 1 or layer != 1:
+        return None
+
+    bitrate_index = (b2 >> 4) & 0x0F
+    rate_index = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = (BITRATES_V1_L3 if version == 3 else BITRATES_V2_L3)[bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 3 else 576
+    frame_size = (samples // 8) * bitrate // sample_rate + padding
+    return frame_size, samples, sample_rate
+
+
+def _is_info_frame(data: bytes, pos: int, frame_size: int) -> bool:
+    # El primer frame pot ser una capçalera Xing/Info/VBRI (metadades, no àudio)
+    frame = data[pos:pos + frame_size]
+    return b"Xing" in frame[:64] or b"Info" in frame[:64] or b"VBRI" in frame[:64]
+
+
+def iter_frames(data: bytes):
+    """Recorre els frames d'àudio: (inici, mida, mostres, sample_rate). Salta ID3 i Xing/Info."""
+    pos = _id3v2_size(data)
+    end = len(data)
+    if end - pos >= ID3V1_SIZE and data[end - ID3V1_SIZE:end - ID3V1_SIZE + 3] == b"TAG":
+        end -= ID3V1_SIZE
+
+    first = True
+    while pos + 4 <= end:
+        header = parse_frame_header(data, pos)
+        if header is None:
+            # Brossa entre frames: busquem la següent paraula de sincronia
+            pos += 1
+            continue
+        frame_size, samples, sample_rate = header
+        if pos + frame_size > end:
+            break
+        if not (first and _is_info_frame(data, pos, frame_size)):
+            yield pos, frame_size, samples, sample_rate
+        first = False
+        pos += frame_size
+
+
+def duration_seconds(data: bytes) -> float:
+    """Durada real de l'MP3 sumant les mostres de cada frame."""
+    return sum(samples / sample_rate for _, _, samples, sample_rate in iter_frames(data))
+
+
+def concat(parts: list) -> bytes:
+    """Concatena MP3 a nivell de frame (sense etiquetes ni frames Xing intermedis que confonen els reproductors)."""
+    out = bytearray()
+    for data in parts:
+        for pos, size, _, _ in iter_frames(data):
+            out += data[pos:pos + size]
+    return bytes(out)
@@ -0,0 +1,385 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from app.services.llm import llm
+from app.services.audio import AudioService, align_timestamps
+from app.services.storage import StorageService
+from app.services.image_library import image_library
+from app.services.db import DatabaseService
+from app.services.generators.factory import ExerciseFactory
+
+# Fils per a les etapes de recursos (imatges, pujades, àudio) de totes les generacions
+ASSET_WORKERS = 8
+
+SPEAKING2_IMAGES = 3
+# Variacions per als prompts per assegurar que les 3 fotos siguin diferents
+IMAGE_VARIATIONS = [
+    "focusing on an individual scenario",
+    "showing a group interaction",
+    "depicting a contrasting situation or outcome",
+]
+
+# Camps que NO desem a 'generation_jobs' (massa grans per a un document)
+TRANSIENT_OUTPUT_FIELDS = ("audio_base64",)
+
+# Les URLs de DALL-E caduquen al cap d'~1 h: passat aquest marge, reintentar la pujada no té sentit
+TEMP_URL_MAX_AGE_SECONDS = 50 * 60
+
+
+class Stage:
+    """Una etapa del pipeline: fn(exercise, outputs) -> dict amb el resultat. 'deps' són noms d'etapes."""
+
+    def __init__(self, name: str, fn, deps: tuple = ()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+# ==========================================
+# ETAPES DE RECURSOS
+# ==========================================
+
+def _speaking2_topic(exercise: dict) -> str:
+    return exercise.get("title", "General Topic").replace("Speaking Part 2: ", "")
+
+
+def audio_url(audio_hash: str) -> str:
+    """Ruta de l'API que serveix l'àudio (amb suport de Range)."""
+    return f"/audio/{audio_hash}"
+
+
+def _render_audio(exercise: dict, outputs: dict) -> dict:
+    # Per trossos en paral·lel: tenim els offsets reals per ajustar els 'timestamp'.
+    # L'MP3 va a Storage (per hash) i l'exercici només en guarda la URL: la Pool el reutilitza sense TTS.
+    rendered = AudioService.render_transcript(exercise["text"])
+    audio_hash = StorageService.save_audio(rendered["audio"])
+    return {
+        "audio_hash": audio_hash,
+        "audio_url": audio_url(audio_hash),
+        "segments": rendered["segments"],
+        "duration": rendered["duration"],
+    }
+
+
+def _library_stage(exercise: dict, outputs: dict) -> dict:
+    # Imatges ja guardades per a temes semblants: només les que no hi són van a DALL-E
+    matches = image_library.choose(_speaking2_topic(exercise), SPEAKING2_IMAGES)
+    hits = sum(1 for match in matches if match)
+    if hits:
+        print(f"   📚 Biblioteca d'imatges: {hits}/{SPEAKING2_IMAGES} reutilitzades.")
+    return {
+        "urls": [match["url"] if match else None for match in matches],
+        "variants": [match.get("variants") if match else None for match in matches],
+    }
+
+
+def _image_stage(i: int):
+    def render(exercise: dict, outputs: dict) -> dict:
+        library = outputs.get("library", {})
+        stored = library.get("urls") or []
+        if i < len(stored) and stored[i]:
+            variants = (library.get("variants") or [None] * len(stored))[i]
+            return {"temp_url": stored[i], "variants": variants, "library": True}
+
+        variation = IMAGE_VARIATIONS[i] if i < len(IMAGE_VARIATIONS) else "different perspective"
+        image_prompt = (
+            f"A photorealistic, candid photograph showing a scene related to '{_speaking2_topic(exercise)}', "
+            f"{variation}. Educational context, high detail. Image {i + 1} of {SPEAKING2_IMAGES}."
+        )
+        print(f"   ▶️ Generant imatge {i + 1}/{SPEAKING2_IMAGES}...")
+        return {
+            "temp_url": llm.image(image_prompt, model="dall-e-3", size="1024x1024"),
+            "prompt": image_prompt,
+            "created_at": time.time(),
+        }
+    return render
+
+
+def _upload_stage(i: int):
+    def upload(exercise: dict, outputs: dict) -> dict:
+        image = outputs[f"image_{i + 1}"]
+        temp_url = image["temp_url"]
+        if image.get("library"):
+            # Ja és a Storage
+            return {"url": temp_url, "variants": image.get("variants")}
+
+        print(f"   ▶️ Pujant imatge {i + 1} (i variants WebP)...")
+        saved = StorageService.save_image_with_variants(temp_url, folder="speaking_part2")
+        if saved["url"] == temp_url:
+            # StorageService retorna la URL temporal si la pujada falla: ho marquem com a etapa fallida
+            raise RuntimeError("upload failed, keeping temporary URL")
+        image_library.add(_speaking2_topic(exercise), i, image.get("prompt", ""), saved["url"], saved["variants"])
+        return saved
+    return upload
+
+
+def asset_stages(exercise_type: str, exercise: dict) -> list:
+    """Etapes que depenen només del text. Les que no depenen entre elles van en paral·lel."""
+    stages = []
+    if exercise_type.startswith("listening") and exercise.get("text") and not exercise.get("audio_hash"):
+        stages.append(Stage("audio", _render_audio))
+
+    if exercise_type == "speaking2" and len(exercise.get("image_urls") or []) < SPEAKING2_IMAGES:
+        # library -> image_i -> upload_i: tres cadenes independents després de consultar la biblioteca
+        stages.append(Stage("library", _library_stage))
+        for i in range(SPEAKING2_IMAGES):
+            stages.append(Stage(f"image_{i + 1}", _image_stage(i), deps=("library",)))
+            stages.append(Stage(f"upload_{i + 1}", _upload_stage(i), deps=(f"image_{i + 1}",)))
+    return stages
+
+
+def apply_outputs(exercise: dict, exercise_type: str, outputs: dict) -> dict:
+    """Incorpora a l'exercici el resultat de les etapes acabades."""
+    if "audio" in outputs:
+        audio = outputs["audio"]
+        if audio.get("audio_hash"):
+            exercise["audio_hash"] = audio["audio_hash"]
+            exercise["audio_url"] = audio["audio_url"]
+        if audio.get("segments"):
+            exercise["audio_segments"] = [
+                {key: segment.get(key) for key in ("index", "start", "end", "speaker")} for segment in audio["segments"]
+            ]
+            exercise["audio_duration"] = audio["duration"]
+            exercise["questions"] = align_timestamps(
+                [dict(q) if isinstance(q, dict) else q for q in exercise.get("questions") or []],
+                audio["segments"],
+            )
+
+    if exercise_type == "speaking2":
+        urls = list(exercise.get("image_urls") or [])
+        variants = list(exercise.get("image_variants") or [None] * len(urls))
+        for i in range(SPEAKING2_IMAGES):
+            upload = outputs.get(f"upload_{i + 1}")
+            image = outputs.get(f"image_{i + 1}")
+            if upload:
+                urls.append(upload["url"])
+                variants.append(upload.get("variants"))
+            elif image:
+                # Imatge generada però no pujada: millor la temporal que res
+                urls.append(image["temp_url"])
+                variants.append(None)
+        exercise["image_urls"] = urls
+        # Mateix ordre que 'image_urls': {"src", "srcset", "widths"} o None si només hi ha l'original
+        exercise["image_variants"] = variants
+        # Eliminem el camp singular antic per evitar confusions
+        exercise.pop("image_url", None)
+    return exercise
+
+
+class ExerciseGenerationPipeline:
+    """
+    Generació d'un exercici com a petit DAG d'etapes:
+        text -> [audio | library -> (image_1 -> upload_1 | image_2 -> upload_2 | image_3 -> upload_3)] -> save
+    Les etapes independents s'executen en paral·lel. Només les feines que acaben 'partial' o
+    'failed' es desen a 'generation_jobs' (amb 'expires_at' per a la política TTL), de manera
+    que una etapa de recursos fallida es pot reintentar sense tornar a generar el text.
+    """
+
+    def __init__(self, max_workers: int = ASSET_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self._counters = {"jobs": 0, "completed": 0, "partial": 0, "failed": 0, "retries": 0}
+        self._stage_seconds = {}
+
+    # ==========================================
+    # API PÚBLICA
+    # ==========================================
+
+    def run(self, level: str, exercise_type: str, is_public: bool = True, weak_words: list = None, exercise: dict = None) -> dict:
+        """
+        Executa el pipeline sencer i retorna l'exercici guardat (amb 'id').
+        Si ja tenim el text (p.ex. generat en streaming), el passem a 'exercise'.
+        """
+        job = self._new_job(level, exercise_type, is_public)
+        started = time.monotonic()
+
+        if exercise is None:
+            print(f"⚙️ PIPELINE {job['id']}: text ({exercise_type})...")
+            try:
+                exercise = self._timed("text", lambda: ExerciseFactory.create_exercise(exercise_type, level, weak_words=weak_words).model_dump())
+            except Exception as e:
+                job["status"] = "failed"
+                job["stages"]["text"] = {"status": "failed", "error": str(e)}
+                self._persist(job)
+                self._count("failed")
+                raise
+        # El nivell és el que fa servir la Pool per indexar (level, type)
+        exercise.setdefault("level", level)
+        exercise.setdefault("type", exercise_type)
+        job["exercise"] = exercise
+        job["stages"]["text"] = {"status": "done"}
+
+        self._run_stages(job, asset_stages(exercise_type, exercise))
+        result = self._save(job)
+        print(f"✅ PIPELINE {job['id']}: {exercise_type} en {time.monotonic() - started:.1f}s ({job['status']}).")
+        return result
+
+    def attach_assets(self, exercise: dict, exercise_type: str) -> dict:
+        """Només els recursos (en paral·lel), sense desar l'estat. Per a camins que ja gestionen el guardat."""
+        job = {"id": None, "type": exercise_type, "exercise": exercise, "stages": {}, "outputs": {}}
+        self._run_stages(job, asset_stages(exercise_type, exercise))
+        return apply_outputs(exercise, exercise_type, job["outputs"])
+
+    def retry(self, job_id: str) -> dict:
+        """Torna a executar les etapes de recursos fallides d'una feina desada (sense regenerar el text)."""
+        job = DatabaseService.get_generation_job(job_id)
+        if not job or not job.get("exercise"):
+            return None
+        self._count("retries")
+
+        exercise_type = job["type"]
+        self._expire_temp_images(job)
+        pending = [
+            stage for stage in asset_stages(exercise_type, job["exercise"])
+            if job["stages"].get(stage.name, {}).get("status") != "done"
+        ]
+        self._run_stages(job, pending)
+        return self._save(job)
+
+    def _expire_temp_images(self, job: dict):
+        """
+        Una pujada pendent d'una imatge de DALL-E ja caducada no es pot reintentar:
+        tornem a executar també la seva etapa 'image_i' (nova imatge i nova URL).
+        """
+        for name, stage in job["stages"].items():
+            if not name.startswith("upload_") or stage.get("status") == "done":
+                continue
+            image_name = "image_" + name.split("_", 1)[1]
+            image = job["outputs"].get(image_name) or {}
+            if image.get("library"):
+                continue
+            if time.time() - image.get("created_at", 0) > TEMP_URL_MAX_AGE_SECONDS:
+                job["outputs"].pop(image_name, None)
+                attempts = job["stages"].get(image_name, {}).get("attempts", 0)
+                job["stages"][image_name] = {"status": "expired", "attempts": attempts}
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "stage_avg_seconds": {
+                    name: round(total / calls, 3) for name, (total, calls) in self._stage_seconds.items()
+                },
+            }
+
+    # ==========================================
+    # EXECUCIÓ DEL DAG
+    # ==========================================
+
+    def _run_stages(self, job: dict, stages: list):
+        outputs = job.setdefault("outputs", {})
+        done = {name for name, stage in job["stages"].items() if stage.get("status") == "done"}
+        done.add("text")
+        failed = set()
+        pending = {stage.name: stage for stage in stages}
+        running = {}
+
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(dep in failed for dep in stage.deps):
+                    job["stages"][name] = {"status": "skipped", "error": "dependency failed"}
+                    failed.add(name)
+                    del pending[name]
+                elif all(dep in done for dep in stage.deps):
+                    # Conservem els intents d'execucions anteriors (reintents)
+                    previous = job["stages"].get(name, {})
+                    job["stages"][name] = {"status": "running", "attempts": previous.get("attempts", 0)}
+                    snapshot = dict(outputs)
+                    future = self._executor.submit(self._timed, name, stage.fn, job["exercise"], snapshot)
+                    running[future] = stage
+                    del pending[name]
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                attempts = job["stages"].get(stage.name, {}).get("attempts", 0) + 1
+                try:
+                    outputs[stage.name] = future.result()
+                    job["stages"][stage.name] = {"status": "done", "attempts": attempts}
+                    done.add(stage.name)
+                except Exception as e:
+                    print(f"⚠️ PIPELINE {job['id']}: etapa {stage.name} fallida: {e}")
+                    job["stages"][stage.name] = {"status": "failed", "attempts": attempts, "error": str(e)}
+                    failed.add(stage.name)
+
+    def _save(self, job: dict) -> dict:
+        exercise = apply_outputs(dict(job["exercise"]), job["type"], job["outputs"])
+        failed = [name for name, stage in job["stages"].items() if stage.get("status") in ("failed", "skipped")]
+
+        if job.get("exercise_id"):
+            # Reintent: actualitzem el document ja guardat
+            DatabaseService.update_exercise_fields(job["exercise_id"], {
+                key: value for key, value in exercise.items() if key not in TRANSIENT_OUTPUT_FIELDS
+            })
+        else:
+            # Guardem una còpia: save_exercise treu camps pesats (àudio) que el client sí que necessita
+            job["exercise_id"] = DatabaseService.save_exercise(dict(exercise), is_public=job["is_public"])
+
+        exercise["id"] = job["exercise_id"]
+        job["status"] = "partial" if failed or not job["exercise_id"] else "completed"
+        job["stages"]["save"] = {"status": "done" if job["exercise_id"] else "failed"}
+        if job["status"] == "completed":
+            # Res a reintentar: no deixem cap còpia de l'exercici a 'generation_jobs'
+            if job.get("persisted"):
+                self._delete(job)
+        else:
+            self._persist(job)
+        self._count(job["status"])
+        return exercise
+
+    # ==========================================
+    # ESTAT
+    # ==========================================
+
+    def _new_job(self, level: str, exercise_type: str, is_public: bool) -> dict:
+        self._count("jobs")
+        return {
+            "id": uuid.uuid4().hex,
+            "level": level,
+            "type": exercise_type,
+            "is_public": is_public,
+            "status": "running",
+            "stages": {},
+            "outputs": {},
+            "exercise": None,
+            "exercise_id": None,
+        }
+
+    def _persist(self, job: dict):
+        outputs = {
+            name: {key: value for key, value in output.items() if key not in TRANSIENT_OUTPUT_FIELDS}
+            for name, output in job.get("outputs", {}).items()
+        }
+        exercise = {key: value for key, value in (job.get("exercise") or {}).items() if key not in TRANSIENT_OUTPUT_FIELDS}
+        try:
+            DatabaseService.save_generation_job(job["id"], {**job, "outputs": outputs, "exercise": exercise, "persisted": True})
+        except Exception as e:
+            # L'estat és per poder reintentar; si no es pot desar, la generació continua igualment
+            print(f"⚠️ PIPELINE: No s'ha pogut desar l'estat de {job['id']}: {e}")
+
+    def _delete(self, job: dict):
+        try:
+            DatabaseService.delete_generation_job(job["id"])
+        except Exception as e:
+            # La política TTL ('expires_at') l'acabarà esborrant igualment
+            print(f"⚠️ PIPELINE: No s'ha pogut esborrar la feina {job['id']}: {e}")
+
+    def _timed(self, name: str, fn, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                total, calls = self._stage_seconds.get(name.split("_")[0], (0.0, 0))
+                self._stage_seconds[name.split("_")[0]] = (total + time.monotonic() - started, calls + 1)
+
+    def _count(self, field: str):
+        with self._lock:
+            self._counters[field] += 1
+
+
+generation_pipeline = ExerciseGenerationPipeline()
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+
+# Cada quant recarreguem l'índex des de Firestore per veure exercicis
+# que han guardat altres workers/processos.
+POOL_REFRESH_SECONDS = 300
+
+# Intents aleatoris abans de caure al filtrat lineal (usuaris que ja ho han fet quasi tot)
+MAX_RANDOM_PROBES = 8
+
+
+class TypePool:
+    """
+    Índex en memòria d'una pool (level, type): només IDs + metadades lleugeres.
+    'ids' és una llista densa i 'positions' el mapa id -> índex, així podem
+    afegir, treure (swap-remove) i triar a l'atzar en O(1).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.meta = {}
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_stale(self) -> bool:
+        return (time.monotonic() - self.loaded_at) > POOL_REFRESH_SECONDS
+
+    def reset(self, entries: list):
+        """Substitueix tot l'índex amb [(id, meta), ...] llegits de Firestore."""
+        with self.lock:
+            self.ids = []
+            self.positions = {}
+            self.meta = {}
+            for ex_id, meta in entries:
+                self._add_locked(ex_id, meta)
+            self.loaded_at = time.monotonic()
+
+    def add(self, ex_id: str, meta: dict = None):
+        with self.lock:
+            self._add_locked(ex_id, meta)
+
+    def _add_locked(self, ex_id: str, meta: dict = None):
+        if ex_id in self.positions:
+            self.meta[ex_id] = meta or {}
+            return
+        self.positions[ex_id] = len(self.ids)
+        self.ids.append(ex_id)
+        self.meta[ex_id] = meta or {}
+
+    def remove(self, ex_id: str):
+        with self.lock:
+            pos = self.positions.pop(ex_id, None)
+            if pos is None:
+                return
+            last_id = self.ids.pop()
+            if last_id != ex_id:
+                # Movem l'últim element al forat (swap-remove)
+                self.ids[pos] = last_id
+                self.positions[last_id] = pos
+            self.meta.pop(ex_id, None)
+
+    def sample(self, excluded=()):
+        """
+        Retorna un ID a l'atzar que no sigui a 'excluded' (qualsevol objecte amb 'in').
+        Primer provem uns quants índexs aleatoris (O(1) quan l'usuari ha fet poc);
+        només si tots xoquen filtrem la llista sencera.
+        """
+        with self.lock:
+            if not self.ids:
+                return None
+
+            for _ in range(min(MAX_RANDOM_PROBES, len(self.ids))):
+                candidate = self.ids[random.randrange(len(self.ids))]
+                if candidate not in excluded:
+                    return candidate
+
+            remaining = [ex_id for ex_id in self.ids if ex_id not in excluded]
+            return random.choice(remaining) if remaining else None
+
+    def estimate_unseen(self, excluded=(), probes: int = 32) -> int:
+        """
+        Quants exercicis de la pool NO ha vist l'usuari (profunditat 'unseen').
+        Exacte per pools petites; per a les grans fem un mostreig de 'probes' posicions.
+        """
+        with self.lock:
+            total = len(self.ids)
+            if total == 0:
+                return 0
+            if total <= probes:
+                return sum(1 for ex_id in self.ids if ex_id not in excluded)
+            unseen = sum(1 for _ in range(probes) if self.ids[random.randrange(total)] not in excluded)
+            return round(total * unseen / probes)
+
+
+class ExercisePoolIndex:
+    """Conjunt de TypePool indexades per (level, type)."""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, level: str, exercise_type: str) -> TypePool:
+        key = (level, exercise_type)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.setdefault(key, TypePool())
+        return pool
+
+    def add(self, level: str, exercise_type: str, ex_id: str, meta: dict = None):
+        pool = self._pools.get((level, exercise_type))
+        # Si la pool encara no s'ha carregat, ja el llegirem a la primera càrrega
+        if pool is not None and pool.loaded_at:
+            pool.add(ex_id, meta)
+
+    def remove(self, level: str, exercise_type: str, ex_id: str):
+        pool = self._pools.get((level, exercise_type))
+        if pool is not None:
+            pool.remove(ex_id)
+
+    def sizes(self) -> dict:
+        return {f"{level}/{etype}": len(pool) for (level, etype), pool in self._pools.items()}
+
+
+exercise_pool = ExercisePoolIndex()
@@ -0,0 +1,266 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from firebase_admin import firestore
+from app.core.config import settings
+from app.services.db import db, DatabaseService
+from app.services.user_cache import user_cache
+
+# feature -> [(comptador, cost)]. '{scope}' és el tipus d'exercici. Un cost negatiu retorna unitats:
+# veure un anunci gasta un dels anuncis del dia i torna una generació.
+FEATURE_COSTS = {
+    "exercise": [("exercise:{scope}", 1)],
+    "full_exam": [("generation", 5)],
+    "review": [("generation", 1)],
+    "flashcards": [("generation", 1)],
+    "ad_reward": [("ads", 1), ("generation", -1)],
+}
+# Els VIP no tenen límits, però els anuncis els comptem igual
+VIP_EXEMPT = {"exercise", "full_exam", "review", "flashcards"}
+
+
+def _limit(counter: str) -> int:
+    if counter.startswith("exercise:"):
+        return settings.DAILY_EXERCISE_LIMIT
+    return {"generation": settings.DAILY_GENERATION_LIMIT, "ads": settings.DAILY_AD_REWARDS}[counter]
+
+
+def _is_vip(user_data: dict) -> bool:
+    if user_data.get("is_vip"):
+        return True
+    expiry = user_data.get("vip_expiry")
+    if expiry is None:
+        return False
+    expiry = expiry.replace(tzinfo=None) if hasattr(expiry, "replace") else expiry
+    return expiry > datetime.now()
+
+
+class _Bucket:
+    """Ús d'un usuari en un dia: el que ja hi havia a Firestore + el que hem consumit aquí."""
+
+    def __init__(self):
+        self.used = defaultdict(int)        # comptador -> unitats gastades avui
+        self.pending = defaultdict(int)     # comptador -> unitats encara no escrites a Firestore
+        self.loaded = threading.Event()
+        self.error = None
+        self.synced_at = time.monotonic()
+
+
+class QuotaEngine:
+    """
+    Límits diaris sense lectures a Firestore a cada petició. Cada usuari té un bucket per dia
+    (carregat un sol cop de 'quota_usage/{usuari}_{dia}'); la comprovació i el consum són atòmics
+    sota un lock, i un fil escriu el consum pendent cada QUOTA_FLUSH_SECONDS amb Increment
+    (mai llegir-modificar-escriure). Amb diversos processos, cadascun torna a llegir el document
+    cada QUOTA_RESYNC_SECONDS: el que es pot passar del límit queda acotat a aquesta finestra.
+    """
+
+    def __init__(self, flush_seconds: float, resync_seconds: float):
+        self.flush_seconds = flush_seconds
+        self.resync_seconds = resync_seconds
+        self._buckets = {}      # (user_id, dia) -> _Bucket
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counters = {"allowed": 0, "denied": 0, "vip": 0, "refunds": 0, "loads": 0, "flushes": 0, "flushed_writes": 0, "flush_errors": 0}
+
+    # ==========================================
+    # CONSULTA I CONSUM
+    # ==========================================
+
+    def check_and_consume(self, user_id: str, feature: str, scope: str = None) -> bool:
+        """
+        Comprova i gasta la quota de 'feature' (costos a FEATURE_COSTS) en un sol pas.
+        False si algun comptador passaria del límit del dia; llavors no es gasta res.
+        """
+        if feature in VIP_EXEMPT and _is_vip(DatabaseService.get_user_profile(user_id)):
+            self._count("vip")
+            return True
+
+        return self._apply(user_id, self._effects(feature, scope), check=True)
+
+    def refund(self, user_id: str, feature: str, scope: str = None):
+        """Retorna el que ha gastat un check_and_consume de 'feature' (p.ex. si la generació ha fallat)."""
+        if feature in VIP_EXEMPT and _is_vip(DatabaseService.get_user_profile(user_id)):
+            return
+        self._apply(user_id, [(counter, -amount) for counter, amount in self._effects(feature, scope)], check=False)
+        self._count("refunds")
+
+    @staticmethod
+    def _effects(feature: str, scope: str = None) -> list:
+        return [(counter.format(scope=scope), amount) for counter, amount in FEATURE_COSTS[feature]]
+
+    def _apply(self, user_id: str, effects: list, check: bool) -> bool:
+        self._ensure_running()
+        key = (user_id, datetime.now().strftime("%Y-%m-%d"))
+        while True:
+            bucket = self._bucket(*key)
+            with self._lock:
+                if self._buckets.get(key) is not bucket:
+                    continue    # flush() l'acaba de treure de memòria: el tornem a carregar
+                if check:
+                    for counter, amount in effects:
+                        if amount > 0 and bucket.used[counter] + amount > _limit(counter):
+                            self._counters["denied"] += 1
+                            return False
+                    self._counters["allowed"] += 1
+                for counter, amount in effects:
+                    bucket.used[counter] += amount
+                    bucket.pending[counter] += amount
+                return True
+
+    def _bucket(self, user_id: str, day: str) -> _Bucket:
+        key = (user_id, day)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            is_loader = bucket is None
+            if is_loader:
+                bucket = self._buckets[key] = _Bucket()
+                self._counters["loads"] += 1
+
+        if not is_loader:
+            bucket.loaded.wait()
+            if bucket.error is None:
+                return bucket
+            return self._bucket(user_id, day)
+
+        # Una sola lectura per usuari i dia (la resta de peticions esperen aquesta)
+        try:
+            snapshot = self._usage_ref(user_id, day).get()
+            stored = snapshot.to_dict() if snapshot.exists else {}
+        except Exception as e:
+            with self._lock:
+                self._buckets.pop(key, None)
+            bucket.error = e
+            bucket.loaded.set()
+            raise
+        with self._lock:
+            for counter, value in stored.items():
+                if isinstance(value, (int, float)):
+                    bucket.used[counter] += value
+        bucket.loaded.set()
+        return bucket
+
+    @staticmethod
+    def _usage_ref(user_id: str, day: str):
+        return db.collection("quota_usage").document(f"{user_id}_{day}")
+
+    # ==========================================
+    # ESCRIPTURA PERIÒDICA
+    # ==========================================
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="quota-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Atura el fil i escriu el que quedi pendent (apagada de l'API)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+        self.flush()
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Escriu el consum pendent amb Increment al document del dia i copia l'ús a 'users/{id}'
+        (daily_usage, daily_gen_count, ads_watched_today) per al frontend.
+        """
+        with self._flush_lock:
+            today = datetime.now().strftime("%Y-%m-%d")
+            now = time.monotonic()
+            writes = []
+            with self._lock:
+                for (user_id, day), bucket in list(self._buckets.items()):
+                    if not bucket.loaded.is_set():
+                        continue
+                    # Buckets vells: quan no tinguin res pendent la pròxima petició tornarà a llegir
+                    # (dies passats fora de memòria, i el consum d'altres processos entra al bucket)
+                    stale = day != today or now - bucket.synced_at > self.resync_seconds
+                    if bucket.pending:
+                        writes.append((user_id, day, dict(bucket.pending), dict(bucket.used), stale))
+                        bucket.pending.clear()
+                    elif stale:
+                        del self._buckets[(user_id, day)]
+
+            # Dues escriptures per usuari (document del dia + mirall al perfil), 500 per batch
+            per_batch = DatabaseService.MAX_BATCH_WRITES // 2
+            for start in range(0, len(writes), per_batch):
+                chunk = writes[start:start + per_batch]
+                try:
+                    self._commit(chunk)
+                except Exception as e:
+                    print(f"⚠️ QUOTA: No s'ha pogut escriure el consum ({len(chunk)} usuaris): {e}")
+                    self._restore(chunk)
+                    self._count("flush_errors")
+                    continue
+                with self._lock:
+                    self._counters["flushes"] += 1
+                    self._counters["flushed_writes"] += len(chunk)
+                    for user_id, day, _, _, stale in chunk:
+                        if stale and not self._buckets[(user_id, day)].pending:
+                            del self._buckets[(user_id, day)]
+
+    def _commit(self, chunk: list):
+        batch = db.batch()
+        mirrors = []
+        for user_id, day, pending, used, _ in chunk:
+            batch.set(self._usage_ref(user_id, day), {
+                "user_id": user_id,
+                "date": day,
+                **{counter: firestore.Increment(amount) for counter, amount in pending.items()},
+            }, merge=True)
+            mirror = {
+                "daily_usage": {
+                    "date": day,
+                    "counts": {c[len("exercise:"):]: n for c, n in used.items() if c.startswith("exercise:")},
+                },
+                "daily_gen_count": used.get("generation", 0),
+                "ads_watched_today": used.get("ads", 0),
+            }
+            # merge per camps: 'daily_usage' es substitueix sencer (no arrossega els comptadors d'ahir)
+            batch.set(db.collection("users").document(user_id), mirror, merge=list(mirror))
+            mirrors.append((user_id, mirror))
+        batch.commit()
+        for user_id, mirror in mirrors:
+            user_cache.apply(user_id, {"daily_usage": firestore.DELETE_FIELD})
+            user_cache.apply(user_id, mirror)
+
+    def _restore(self, chunk: list):
+        # El batch no s'ha aplicat: tornem el consum a pendent per al pròxim intent
+        # (el bucket hi és segur: només flush() n'esborra, i no els que tenien consum pendent)
+        with self._lock:
+            for user_id, day, pending, _, _ in chunk:
+                bucket = self._buckets[(user_id, day)]
+                for counter, amount in pending.items():
+                    bucket.pending[counter] += amount
+
+    def _count(self, field: str):
+        with self._lock:
+            self._counters[field] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            pending = sum(1 for bucket in self._buckets.values() if bucket.pending)
+            return {
+                "buckets": len(self._buckets),
+                "pending_users": pending,
+                "flush_seconds": self.flush_seconds,
+                "counters": dict(self._counters),
+            }
+
+
+quota_engine = QuotaEngine(settings.QUOTA_FLUSH_SECONDS, settings.QUOTA_RESYNC_SECONDS)
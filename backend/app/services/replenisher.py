@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+
+
+class PoolReplenisher:
+    """
+    Planificador de reposició de la Pool.
+    En lloc de generar un exercici nou a CADA cache hit, només generem quan la
+    profunditat 'unseen' d'una (level, type) baixa del 'low_watermark', i fins
+    arribar a 'target_depth'. Tot passa per un pressupost global de concurrència
+    (crides en curs). Els tipus de 'batch_types' es generen en lots de fins a
+    'batch_size' exercicis per crida.
+    """
+
+    def __init__(self, generate_fn, low_watermark: int = None, target_depth: int = None, max_concurrency: int = None,
+                 batch_generate_fn=None, batch_types=(), batch_size: int = None):
+        self._generate = generate_fn
+        self._generate_batch = batch_generate_fn
+        self.batch_types = set(batch_types) if batch_generate_fn else set()
+        self.batch_size = batch_size or settings.GENERATION_BATCH_SIZE
+        self.low_watermark = low_watermark if low_watermark is not None else settings.POOL_LOW_WATERMARK
+        self.target_depth = target_depth if target_depth is not None else settings.POOL_TARGET_DEPTH
+        self.max_concurrency = max_concurrency or settings.REPLENISH_MAX_CONCURRENCY
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="replenish")
+        self._lock = threading.Lock()
+        self._inflight = {}      # (level, type) -> exercicis pendents o en curs
+        self._jobs = 0           # crides (individuals o de lot) pendents o en curs
+        self._last_depth = {}    # (level, type) -> última profunditat observada
+        self._counters = {
+            "notified": 0,
+            "above_watermark": 0,
+            "scheduled": 0,
+            "skipped_budget": 0,
+            "completed": 0,
+            "failed": 0,
+            "batch_calls": 0,
+        }
+        self._last_event = None
+
+    def total_inflight(self) -> int:
+        with self._lock:
+            return sum(self._inflight.values())
+
+    def notify(self, level: str, exercise_type: str, depth: int) -> int:
+        """
+        Informa de la profunditat 'unseen' observada en servir un exercici.
+        Retorna quantes generacions s'han encuat.
+        """
+        key = (level, exercise_type)
+        with self._lock:
+            self._counters["notified"] += 1
+            self._last_depth[key] = depth
+
+            if depth >= self.low_watermark:
+                self._counters["above_watermark"] += 1
+                return 0
+
+            wanted = max(0, self.target_depth - depth - self._inflight.get(key, 0))
+            to_schedule = self._reserve_locked(key, wanted, reason=f"profunditat {depth}")
+
+        return self._submit(key, to_schedule)
+
+    def request_refill(self, level: str, exercise_type: str, count: int) -> int:
+        """Encua 'count' generacions explícites (p.ex. demanda extra agrupada pel single-flight)."""
+        key = (level, exercise_type)
+        with self._lock:
+            to_schedule = self._reserve_locked(key, count, reason=f"demanda extra {count}")
+        return self._submit(key, to_schedule)
+
+    def _reserve_locked(self, key, wanted: int, reason: str) -> list:
+        """Reserva pressupost i retorna la mida de cada crida a fer (1 o un lot)."""
+        wanted = max(0, wanted)
+        per_call = self.batch_size if key[1] in self.batch_types else 1
+        budget = max(0, self.max_concurrency - self._jobs)
+
+        calls = []
+        remaining = wanted
+        while remaining > 0 and len(calls) < budget:
+            calls.append(min(per_call, remaining))
+            remaining -= calls[-1]
+        to_schedule = wanted - remaining
+
+        if remaining:
+            self._counters["skipped_budget"] += remaining
+        if to_schedule == 0:
+            return []
+
+        self._inflight[key] = self._inflight.get(key, 0) + to_schedule
+        self._jobs += len(calls)
+        self._counters["scheduled"] += to_schedule
+        self._last_event = {
+            "key": f"{key[0]}/{key[1]}",
+            "reason": reason,
+            "scheduled": to_schedule,
+            "calls": len(calls),
+            "at": time.time(),
+        }
+        return calls
+
+    def _submit(self, key, calls: list) -> int:
+        to_schedule = sum(calls)
+        if to_schedule:
+            level, exercise_type = key
+            print(f"🔁 REPLENISH: {level}/{exercise_type}. Encuant {to_schedule} generacions en {len(calls)} crides.")
+            for count in calls:
+                self._executor.submit(self._run, key, count)
+        return to_schedule
+
+    def _run(self, key, count: int = 1):
+        level, exercise_type = key
+        produced = 0
+        try:
+            if key[1] in self.batch_types:
+                with self._lock:
+                    self._counters["batch_calls"] += 1
+                produced = len(self._generate_batch(level, exercise_type, count) or [])
+            else:
+                produced = 1 if self._generate(level, exercise_type) is not None else 0
+        except Exception as e:
+            print(f"❌ REPLENISH ERROR ({level}/{exercise_type}): {e}")
+        finally:
+            with self._lock:
+                self._inflight[key] = max(0, self._inflight.get(key, 0) - count)
+                if not self._inflight[key]:
+                    del self._inflight[key]
+                self._jobs = max(0, self._jobs - 1)
+                produced = min(produced, count)
+                self._counters["completed"] += produced
+                self._counters["failed"] += count - produced
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "low_watermark": self.low_watermark,
+                "target_depth": self.target_depth,
+                "max_concurrency": self.max_concurrency,
+                "batch_size": self.batch_size,
+                "jobs": self._jobs,
+                "inflight": {f"{l}/{t}": n for (l, t), n in self._inflight.items()},
+                "last_depth": {f"{l}/{t}": d for (l, t), d in self._last_depth.items()},
+                "counters": dict(self._counters),
+                "last_event": self._last_event,
+            }
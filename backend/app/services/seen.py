@@ -0,0 +1,86 @@
+import hashlib
+import math
+
+# Cada capa nova dobla la capacitat i fa més estricte el fals positiu,
+# així el total es manté per sota del 'fp_rate' configurat (Scalable Bloom Filter).
+GROWTH_FACTOR = 2
+TIGHTENING_RATIO = 0.5
+
+
+class BloomLayer:
+    def __init__(self, capacity: int, fp_rate: float, bits: bytes = None, count: int = 0):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        # Mida òptima: m = -n·ln(p) / ln(2)^2, k = (m/n)·ln(2)
+        self.m = max(8, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.k = max(1, int(round((self.m / capacity) * math.log(2))))
+        self.bits = bytearray(bits) if bits else bytearray((self.m + 7) // 8)
+        self.count = count
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class SeenFilter:
+    """
+    Conjunt compacte d'exercicis vistos per un usuari (Bloom filter escalable).
+    Un 'in' costa k hashes independentment de quants resultats tingui l'usuari.
+    Un fals positiu només vol dir que saltem un exercici que no havia fet mai.
+    """
+
+    def __init__(self, capacity: int = 2000, fp_rate: float = 0.01, layers: list = None):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.layers = layers or [BloomLayer(capacity, fp_rate * (1 - TIGHTENING_RATIO))]
+
+    def add(self, item: str):
+        if not item or item in self:
+            return
+        layer = self.layers[-1]
+        if layer.is_full():
+            layer = BloomLayer(layer.capacity * GROWTH_FACTOR, layer.fp_rate * TIGHTENING_RATIO)
+            self.layers.append(layer)
+        layer.add(item)
+
+    def __contains__(self, item) -> bool:
+        if not item:
+            return False
+        return any(item in layer for layer in self.layers)
+
+    def __len__(self):
+        return sum(layer.count for layer in self.layers)
+
+    def to_dict(self) -> dict:
+        """Format per guardar a Firestore (els bits van com a bytes)."""
+        return {
+            "capacity": self.capacity,
+            "fp_rate": self.fp_rate,
+            "layers": [
+                {"capacity": l.capacity, "fp_rate": l.fp_rate, "count": l.count, "bits": bytes(l.bits)}
+                for l in self.layers
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, capacity: int = 2000, fp_rate: float = 0.01):
+        if not data or not data.get("layers"):
+            return cls(capacity, fp_rate)
+        layers = [
+            BloomLayer(l["capacity"], l["fp_rate"], bits=l.get("bits"), count=l.get("count", 0))
+            for l in data["layers"]
+        ]
+        return cls(data.get("capacity", capacity), data.get("fp_rate", fp_rate), layers)
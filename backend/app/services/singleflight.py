@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Agrupa crides concurrents amb la mateixa clau: només la primera ('leader')
+    executa la funció i la resta ('followers') esperen el mateix resultat.
+    Evita N generacions idèntiques quan la Pool és buida en un pic de trànsit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}    # key -> (Future, nombre de followers)
+        self._counters = {"leaders": 0, "followers": 0, "errors": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Executa fn(*args, **kwargs) una sola vegada per clau en vol.
+        Retorna (resultat, followers): 'followers' és quanta demanda extra s'ha
+        agrupat (només el leader el rep > 0; els followers reben -1).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                future, followers = call
+                self._calls[key] = (future, followers + 1)
+                self._counters["followers"] += 1
+                is_leader = False
+            else:
+                future = Future()
+                self._calls[key] = (future, 0)
+                self._counters["leaders"] += 1
+                is_leader = True
+
+        if not is_leader:
+            return future.result(), -1
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                _, followers = self._calls.pop(key, (None, 0))
+
+        return result, followers
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "counters": dict(self._counters),
+            }
+
+
+class AsyncSingleFlight:
+    """
+    El mateix que SingleFlight per a coroutines: les crides concurrents amb la mateixa clau
+    esperen el mateix asyncio.Future. Tot passa dins d'un sol event loop (no cal lock).
+    """
+
+    def __init__(self):
+        self._calls = {}    # key -> (asyncio.Future, nombre de followers)
+        self._counters = {"leaders": 0, "followers": 0, "errors": 0}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Com SingleFlight.do, però 'fn' és una coroutine function i el resultat s'espera amb await."""
+        call = self._calls.get(key)
+        if call is not None:
+            future, followers = call
+            self._calls[key] = (future, followers + 1)
+            self._counters["followers"] += 1
+            # shield: si cancel·len un follower, el leader i la resta continuen
+            return await asyncio.shield(future), -1
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = (future, 0)
+        self._counters["leaders"] += 1
+        try:
+            result = await fn(*args, **kwargs)
+            future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self._counters["errors"] += 1
+            future.set_exception(e)
+            # Marquem l'excepció com a llegida: sense followers ningú més la recull
+            future.exception()
+            raise
+        finally:
+            _, followers = self._calls.pop(key, (None, 0))
+
+        return result, followers
+
+    def status(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "counters": dict(self._counters),
+        }
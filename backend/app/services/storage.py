@@ -1,44 +1,176 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from firebase_admin import storage
 import uuid
+from app.services import image_variants
 
 # 👇 DEFINEIX EL TEU BUCKET AQUÍ DIRECTAMENT
 BUCKET_NAME = "english-c1-app.firebasestorage.app"
 
+# Àudio adreçat per contingut: el nom és el sha256 de l'MP3, així no el pugem mai dues vegades
+AUDIO_FOLDER = "audio"
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Segon nivell de la cache de TTS de /generate_audio/ (clau = hash de model + veu + text)
+TTS_CACHE_FOLDER = "tts_cache"
+# Blocs de lectura en servir un àudio sencer des de Storage
+AUDIO_STREAM_CHUNK_BYTES = 256 * 1024
+
+# Sessió HTTP compartida: connexions keep-alive reutilitzades entre descàrregues (i reintents en errors 5xx)
+HTTP_POOL_SIZE = 16
+http = requests.Session()
+http.mount("https://", HTTPAdapter(
+    pool_connections=HTTP_POOL_SIZE,
+    pool_maxsize=HTTP_POOL_SIZE,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=["GET"]),
+))
+
+# Descàrrega i pujada per blocs: com a molt un bloc a memòria (múltiple de 256 KB, ho exigeix GCS)
+TRANSFER_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+# Les variants WebP tenen nom únic i no canvien mai
+VARIANT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Transferències simultànies (les versions async de les pujades)
+TRANSFER_WORKERS = 8
+_transfer_executor = ThreadPoolExecutor(max_workers=TRANSFER_WORKERS, thread_name_prefix="storage")
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
 class StorageService:
     @staticmethod
-    def save_image_from_url(temp_url: str, folder: str = "generated_exercises") -> str:
+    def bucket():
+        """Handle del bucket, resolt una sola vegada (es reaprofita a totes les pujades)."""
+        global _bucket
+        if _bucket is None:
+            with _bucket_lock:
+                if _bucket is None:
+                    _bucket = storage.bucket(name=BUCKET_NAME)
+        return _bucket
+
+    @staticmethod
+    def save_image_with_variants(temp_url: str, folder: str = "generated_exercises") -> dict:
         """
-        Descarrega una imatge d'una URL temporal i la puja a Firebase Storage.
+        Descarrega una imatge d'una URL temporal (p.ex. DALL-E), la puja a Firebase Storage i hi guarda
+        variants WebP (1024/640/320 px) al costat de l'original, codificades en un procés a part.
+        Retorna {"url": original, "variants": {"src", "srcset", "widths"}}.
+        Si la pujada falla retorna la URL temporal i cap variant; si només fallen les variants, l'original.
         """
-        print(f"🔵 STORAGE: Iniciant procés de guardat per a: {temp_url[:30]}...")
-        
+        print(f"🔵 STORAGE: Iniciant procés de guardat (amb variants) per a: {temp_url[:30]}...")
+        fd, path = tempfile.mkstemp(suffix=".png")
         try:
-            # 1. Descarregar
-            response = requests.get(temp_url, timeout=30)
-            if response.status_code != 200:
-                print(f"❌ STORAGE ERROR: No s'ha pogut descarregar ({response.status_code})")
-                return temp_url
-            
-            image_data = response.content
-            print(f"📦 Imatge descarregada ({len(image_data)} bytes). Pujant a Firebase...")
-
-            # 2. Nom únic
-            filename = f"{folder}/{uuid.uuid4()}.png"
-            
-            # 3. Pujar a Firebase (AMB EL NOM EXPLÍCIT DEL BUCKET)
-            # 👇 AQUI ESTÀ LA CLAU DE LA SOLUCIÓ
-            bucket = storage.bucket(name=BUCKET_NAME) 
-            blob = bucket.blob(filename)
-            blob.upload_from_string(image_data, content_type="image/png")
-            
-            # 4. Fer pública
+            # 1. Descarregar a disc per blocs (la codificació necessita el fitxer sencer, la memòria no)
+            with os.fdopen(fd, "wb") as f, http.get(temp_url, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+                if response.status_code != 200:
+                    print(f"❌ STORAGE ERROR: No s'ha pogut descarregar ({response.status_code})")
+                    return {"url": temp_url, "variants": None}
+                for chunk in response.iter_content(TRANSFER_CHUNK_BYTES):
+                    f.write(chunk)
+
+            # 2. Original
+            name = f"{folder}/{uuid.uuid4()}"
+            blob = StorageService.bucket().blob(f"{name}.png", chunk_size=TRANSFER_CHUNK_BYTES)
+            blob.upload_from_filename(path, content_type="image/png")
             blob.make_public()
-            
-            public_url = blob.public_url
-            print(f"✅ STORAGE SUCCESS: Imatge disponible a: {public_url}")
-            return public_url
+            result = {"url": blob.public_url, "variants": None}
+            print(f"✅ STORAGE SUCCESS: Imatge disponible a: {blob.public_url}")
+
+            # 3. Variants WebP (procés a part) al costat de l'original
+            try:
+                widths = {}
+                for width, data in image_variants.render_variants(path).items():
+                    variant = StorageService.bucket().blob(f"{name}_{width}.webp")
+                    variant.cache_control = VARIANT_CACHE_CONTROL
+                    variant.upload_from_string(data, content_type="image/webp")
+                    variant.make_public()
+                    widths[str(width)] = variant.public_url
+                if widths:
+                    default = str(image_variants.DEFAULT_WIDTH) if str(image_variants.DEFAULT_WIDTH) in widths else max(widths, key=int)
+                    result["variants"] = {
+                        "src": widths[default],
+                        "srcset": image_variants.srcset({int(width): url for width, url in widths.items()}),
+                        "widths": widths,
+                    }
+            except Exception as e:
+                print(f"⚠️ STORAGE: No s'han pogut generar les variants: {e}")
+            return result
 
         except Exception as e:
             print(f"❌ CRITICAL STORAGE FAILURE: {str(e)}")
-            return temp_url
\ No newline at end of file
+            return {"url": temp_url, "variants": None}
+        finally:
+            os.unlink(path)
+
+    @staticmethod
+    async def asave_image_with_variants(temp_url: str, folder: str = "generated_exercises") -> dict:
+        return await asyncio.get_running_loop().run_in_executor(
+            _transfer_executor, StorageService.save_image_with_variants, temp_url, folder
+        )
+
+    # ==========================================
+    # ÀUDIO (adreçat per contingut)
+    # ==========================================
+
+    @staticmethod
+    def audio_hash(audio_data: bytes) -> str:
+        return hashlib.sha256(audio_data).hexdigest()
+
+    @staticmethod
+    def _audio_blob(audio_hash: str):
+        return StorageService.bucket().blob(f"{AUDIO_FOLDER}/{audio_hash}.mp3")
+
+    @staticmethod
+    def save_audio(audio_data: bytes) -> str:
+        """
+        Puja un MP3 sota el seu hash de contingut (si encara no hi és) i retorna el hash.
+        El mateix àudio (p.ex. una regeneració idèntica) no es torna a pujar.
+        """
+        audio_hash = StorageService.audio_hash(audio_data)
+        blob = StorageService._audio_blob(audio_hash)
+        if blob.exists():
+            print(f"♻️ STORAGE: Àudio {audio_hash[:12]} ja existeix, no el tornem a pujar.")
+            return audio_hash
+
+        blob.cache_control = AUDIO_CACHE_CONTROL
+        blob.upload_from_string(audio_data, content_type="audio/mpeg")
+        print(f"✅ STORAGE SUCCESS: Àudio {audio_hash[:12]} guardat ({len(audio_data)} bytes).")
+        return audio_hash
+
+    @staticmethod
+    def get_audio_blob(audio_hash: str):
+        """Blob de l'àudio amb les metadades (mida inclosa) en una sola petició, o None si no existeix."""
+        return StorageService.bucket().get_blob(f"{AUDIO_FOLDER}/{audio_hash}.mp3")
+
+    @staticmethod
+    def stream_audio(blob):
+        """Llegeix l'àudio per blocs (per a StreamingResponse): mai el tenim sencer a memòria."""
+        with blob.open("rb", chunk_size=AUDIO_STREAM_CHUNK_BYTES) as f:
+            while chunk := f.read(AUDIO_STREAM_CHUNK_BYTES):
+                yield chunk
+
+    @staticmethod
+    def _tts_cache_blob(key: str):
+        return StorageService.bucket().blob(f"{TTS_CACHE_FOLDER}/{key}.mp3")
+
+    @staticmethod
+    def load_tts_cache(key: str):
+        """Àudio de TTS guardat sota 'key', o None si no hi és."""
+        blob = StorageService._tts_cache_blob(key)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+    @staticmethod
+    def save_tts_cache(key: str, audio_data: bytes):
+        blob = StorageService._tts_cache_blob(key)
+        blob.cache_control = AUDIO_CACHE_CONTROL
+        blob.upload_from_string(audio_data, content_type="audio/mpeg")
+
@@ -0,0 +1,163 @@
+import json
+from app.services.generators.factory import ExerciseFactory
+
+# Arrays del JSON que emetem element a element (la resta de camps, sencers)
+STREAMED_ARRAYS = ("questions",)
+
+
+class IncrementalExerciseParser:
+    """
+    Parser incremental del JSON que escriu el model.
+    Li anem passant fragments i retorna esdeveniments quan un camp de primer nivell
+    ja és complet ('title', 'instructions', 'text'...) o quan acaba cada pregunta.
+    No valida res: només talla el text quan les claus/cometes estan tancades.
+    """
+
+    def __init__(self, streamed_arrays=STREAMED_ARRAYS):
+        self.streamed_arrays = streamed_arrays
+        self.text = ""
+        self.pos = 0
+        self.stack = []           # '{' / '[' oberts
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.state = "start"      # start, key, colon, value, in_value, after, done
+        self.current_key = None
+        self.value_start = None
+        self.item_start = None
+        self.item_index = 0
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        events = []
+        while self.pos < len(self.text):
+            i = self.pos
+            ch = self.text[i]
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    self._on_string_end(i, events)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+                if len(self.stack) == 1 and self.state == "value":
+                    self.value_start = i
+                    self.state = "in_value"
+                continue
+
+            if not self.stack:
+                if ch == "{" and self.state == "start":
+                    self.stack.append(ch)
+                    self.state = "key"
+            elif len(self.stack) == 1:
+                self._on_root_char(i, ch, events)
+            elif ch in "{[":
+                if ch == "{" and self._in_streamed_array():
+                    self.item_start = i
+                self.stack.append(ch)
+            elif ch in "}]":
+                self.stack.pop()
+                if ch == "}" and self.item_start is not None and self._in_streamed_array():
+                    self._emit_item(i, events)
+                if len(self.stack) == 1 and self.state == "in_value":
+                    self._emit_field(self.text[self.value_start:i + 1], events)
+                    self.state = "after"
+
+        return events
+
+    def _in_streamed_array(self) -> bool:
+        return self.stack == ["{", "["] and self.current_key in self.streamed_arrays
+
+    def _on_string_end(self, i: int, events: list):
+        if len(self.stack) != 1:
+            return
+        if self.state == "key":
+            self.current_key = json.loads(self.text[self.string_start:i + 1])
+            self.state = "colon"
+        elif self.state == "in_value" and self.value_start == self.string_start:
+            self._emit_field(self.text[self.value_start:i + 1], events)
+            self.state = "after"
+
+    def _on_root_char(self, i: int, ch: str, events: list):
+        if ch.isspace():
+            return
+        if self.state == "colon" and ch == ":":
+            self.state = "value"
+        elif self.state == "value":
+            self.value_start = i
+            self.state = "in_value"
+            if ch in "{[":
+                self.stack.append(ch)
+        elif self.state == "in_value" and ch in ",}":
+            # Final d'un valor escalar (número, true/false/null)
+            self._emit_field(self.text[self.value_start:i].strip(), events)
+            self.state = "key"
+            if ch == "}":
+                self.stack.pop()
+                self.state = "done"
+        elif self.state in ("after", "key") and ch == ",":
+            self.state = "key"
+        elif ch == "}":
+            self.stack.pop()
+            self.state = "done"
+
+    def _emit_field(self, raw: str, events: list):
+        key = self.current_key
+        self.value_start = None
+        if key in self.streamed_arrays:
+            # Les preguntes ja s'han emès una a una
+            return
+        try:
+            events.append(("field", {"name": key, "value": json.loads(raw)}))
+        except json.JSONDecodeError:
+            pass
+
+    def _emit_item(self, i: int, events: list):
+        raw = self.text[self.item_start:i + 1]
+        self.item_start = None
+        try:
+            events.append(("question", {"index": self.item_index, "question": json.loads(raw)}))
+            self.item_index += 1
+        except json.JSONDecodeError:
+            pass
+
+
+def sse_event(event: str, data) -> str:
+    """Format Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def exercise_event_stream(exercise_type: str, level: str = "C1", weak_words: list = None, on_complete=None):
+    """
+    Genera un exercici en streaming i retorna esdeveniments SSE:
+    - 'token': fragment de text cru del model
+    - 'field': camp de primer nivell complet (title, instructions, text...)
+    - 'question': cada pregunta tan bon punt està tancada
+    - 'done': l'exercici sencer (ja processat per la Factory)
+    'on_complete' (async) pot guardar l'exercici i retornar-lo amb l'ID.
+    """
+    parser = IncrementalExerciseParser()
+    chunks = []
+    try:
+        async for delta in ExerciseFactory.astream_exercise(exercise_type, level, weak_words):
+            chunks.append(delta)
+            yield sse_event("token", {"delta": delta})
+            for event, payload in parser.feed(delta):
+                yield sse_event(event, payload)
+
+        exercise_data = ExerciseFactory._parse_response(exercise_type, "".join(chunks)).model_dump()
+        if on_complete is not None:
+            exercise_data = await on_complete(exercise_data)
+        yield sse_event("done", exercise_data)
+
+    except Exception as e:
+        print(f"❌ STREAM ERROR ({exercise_type}): {e}")
+        yield sse_event("error", {"detail": str(e)})
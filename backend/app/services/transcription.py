@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from app.core.config import settings
+from app.services.llm import llm
+
+# Lectura de la pujada per blocs: mai tenim la gravació sencera a memòria
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Gravacions llargues: trossos de N segons amb solapament, transcrits en paral·lel
+SEGMENT_OVERLAP_SECONDS = 4
+# Paraules que comparem al solapament per cosir dos trossos
+MAX_STITCH_WORDS = 40
+MIN_STITCH_WORDS = 3
+
+# Resultats per hash de l'àudio (els reintents del client no tornen a passar per Whisper)
+RESULT_CACHE_ENTRIES = 512
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def stitch(texts: list) -> str:
+    """
+    Cus transcripcions de trossos que es solapen: busquem la seqüència de paraules més llarga
+    que acaba un tros i comença el següent i la deixem una sola vegada.
+    """
+    if not texts:
+        return ""
+    words = texts[0].split()
+    for text in texts[1:]:
+        following = text.split()
+        tail = [_normalize(w) for w in words[-MAX_STITCH_WORDS:]]
+        head = [_normalize(w) for w in following[:MAX_STITCH_WORDS]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), MIN_STITCH_WORDS - 1, -1):
+            if tail[-size:] == head[:size]:
+                overlap = size
+                break
+        words.extend(following[overlap:])
+    return " ".join(words)
+
+
+class TranscriptionService:
+    """
+    /transcribe_audio/ amb memòria acotada: la pujada va a disc per blocs (amb límit de mida i hash
+    calculat al vol), les gravacions llargues es parteixen amb ffmpeg en trossos solapats que
+    es transcriuen en paral·lel, i el resultat queda en cache per hash.
+    """
+
+    def __init__(self, max_bytes: int, segment_seconds: int):
+        self.max_bytes = max_bytes
+        self.segment_seconds = segment_seconds
+        self._results = OrderedDict()   # hash -> text
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "cache_hits": 0, "segmented": 0, "segments": 0, "rejected": 0, "fallbacks": 0}
+
+    async def save_upload(self, upload, suffix: str = ".webm") -> tuple:
+        """Escriu l'UploadFile a un fitxer temporal per blocs. Retorna (ruta, sha256, bytes)."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        self._count("rejected")
+                        raise UploadTooLarge(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path, digest.hexdigest(), size
+
+    async def transcribe_upload(self, upload) -> dict:
+        self._count("requests")
+        suffix = os.path.splitext(upload.filename or "")[1] or ".webm"
+        path, audio_hash, size = await self.save_upload(upload, suffix)
+        try:
+            cached = self._get(audio_hash)
+            if cached is not None:
+                self._count("cache_hits")
+                return {"text": cached, "hash": audio_hash, "cached": True}
+
+            text = await self.transcribe_file(path)
+            self._put(audio_hash, text)
+            return {"text": text, "hash": audio_hash, "cached": False}
+        finally:
+            os.unlink(path)
+
+    async def transcribe_file(self, path: str) -> str:
+        workdir = tempfile.mkdtemp(prefix="transcribe_")
+        try:
+            try:
+                source, duration = await asyncio.to_thread(self._probe, path, workdir)
+                if not FFMPEG or duration is None or duration <= self.segment_seconds + SEGMENT_OVERLAP_SECONDS:
+                    return await self._transcribe_path(source)
+
+                # Un inici dins dels últims segons de solapament ja el cobreix sencer el tros anterior
+                starts = [
+                    start for start in range(0, int(duration), self.segment_seconds)
+                    if start == 0 or start < duration - SEGMENT_OVERLAP_SECONDS
+                ]
+                segments = await asyncio.gather(*[
+                    asyncio.to_thread(self._cut, source, workdir, i, start) for i, start in enumerate(starts)
+                ])
+            except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+                # ffmpeg encallat o fallit: millor una sola crida a Whisper que cap transcripció
+                print(f"⚠️ TRANSCRIPCIÓ: ffmpeg ha fallat ({e}); transcrivim el fitxer sencer.")
+                self._count("fallbacks")
+                return await self._transcribe_path(path)
+
+            print(f"🎙️ TRANSCRIPCIÓ: {duration:.0f}s en {len(starts)} trossos solapats (en paral·lel).")
+            self._count("segmented")
+            texts = await asyncio.gather(*[self._transcribe_path(segment) for segment in segments])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        with self._lock:
+            self._counters["segments"] += len(starts)
+        return stitch([text for text in texts if text])
+
+    async def _transcribe_path(self, path: str) -> str:
+        with open(path, "rb") as f:
+            return await llm.atranscribe(f, model="whisper-1")
+
+    def _probe(self, path: str, workdir: str) -> tuple:
+        """
+        Retorna (fitxer a transcriure, durada). Els webm de MediaRecorder no porten durada al
+        contenidor: els descodifiquem un sol cop a MP3, en llegim la durada i tallem d'aquest.
+        """
+        duration = self._duration(path)
+        if duration is not None or not FFMPEG:
+            return path, duration
+        source = os.path.join(workdir, "full.mp3")
+        subprocess.run(
+            [FFMPEG, "-v", "error", "-y", "-i", path, "-ac", "1", "-ar", "16000", "-b:a", "48k", source],
+            check=True, capture_output=True, timeout=300,
+        )
+        return source, self._duration(source)
+
+    def _duration(self, path: str):
+        """Durada en segons amb ffprobe (None si no hi és o no la sap llegir)."""
+        if not FFPROBE:
+            return None
+        result = subprocess.run(
+            [FFPROBE, "-v", "quiet", "-print_format", "json", "-show_format", path],
+            capture_output=True, timeout=30,
+        )
+        try:
+            return float(json.loads(result.stdout)["format"]["duration"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _cut(self, path: str, workdir: str, index: int, start: int) -> str:
+        # Recodifiquem a MP3 mono 16 kHz: tall exacte (no depèn dels keyframes del webm) i fitxers petits
+        out = os.path.join(workdir, f"segment_{index:03d}.mp3")
+        subprocess.run(
+            [FFMPEG, "-v", "error", "-y", "-ss", str(start), "-t", str(self.segment_seconds + SEGMENT_OVERLAP_SECONDS),
+             "-i", path, "-ac", "1", "-ar", "16000", "-b:a", "48k", out],
+            check=True, capture_output=True, timeout=120,
+        )
+        return out
+
+    def _get(self, audio_hash: str):
+        with self._lock:
+            text = self._results.get(audio_hash)
+            if text is not None:
+                self._results.move_to_end(audio_hash)
+            return text
+
+    def _put(self, audio_hash: str, text: str):
+        with self._lock:
+            self._results[audio_hash] = text
+            self._results.move_to_end(audio_hash)
+            while len(self._results) > RESULT_CACHE_ENTRIES:
+                self._results.popitem(last=False)
+
+    def _count(self, field: str):
+        with self._lock:
+            self._counters[field] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ffmpeg": bool(FFMPEG and FFPROBE),
+                "cached_results": len(self._results),
+                "counters": dict(self._counters),
+            }
+
+
+transcription_service = TranscriptionService(
+    settings.TRANSCRIBE_MAX_MB * 1024 * 1024,
+    settings.TRANSCRIBE_SEGMENT_SECONDS,
+)
@@ -0,0 +1,136 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from firebase_admin import firestore
+from app.core.config import settings
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _merge_into(target: dict, updates: dict):
+    """
+    Aplica 'updates' a 'target' amb la mateixa semàntica que set(..., merge=True) de Firestore:
+    mapes niuats es fusionen, Increment suma, DELETE_FIELD esborra. Qualsevol altre sentinel
+    (SERVER_TIMESTAMP, ArrayUnion...) no el sabem reproduir: _Unsupported.
+    """
+    for key, value in updates.items():
+        if isinstance(value, firestore.Increment):
+            current = target.get(key, 0)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif value is firestore.DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            nested = target.get(key)
+            if not isinstance(nested, dict):
+                nested = target[key] = {}
+            _merge_into(nested, value)
+        elif type(value).__module__.startswith("google.cloud.firestore"):
+            raise _Unsupported(key)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class UserProfileCache:
+    """
+    Cache write-through dels documents 'users/{id}': LRU acotada i amb TTL.
+    Les lectures es serveixen de memòria; les escriptures que fem nosaltres s'apliquen també
+    a la còpia en memòria (o la invaliden si no les sabem reproduir). El TTL limita com de
+    desfasada pot estar respecte d'escriptures d'altres processos.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # user_id -> (expira_a, dades o None si no existeix)
+        self._loading = {}              # user_id -> True si hi ha hagut una escriptura mentre el llegíem
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "write_through": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, user_id: str, loader) -> dict:
+        """
+        Perfil de l'usuari (una còpia: el podem modificar sense tocar la cache), o {} si no existeix.
+        'loader(user_id)' llegeix de Firestore i retorna el dict o None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > now:
+                    self._entries.move_to_end(user_id)
+                    self._counters["hits"] += 1
+                    return copy.deepcopy(data) if data is not None else {}
+                del self._entries[user_id]
+                self._counters["expired"] += 1
+            self._counters["misses"] += 1
+            self._loading.setdefault(user_id, False)
+
+        try:
+            data = loader(user_id)
+        except Exception:
+            with self._lock:
+                self._loading.pop(user_id, None)
+            raise
+        self._store(user_id, data)
+        return copy.deepcopy(data) if data is not None else {}
+
+    def apply(self, user_id: str, updates: dict):
+        """Write-through d'un set(merge=True) / update ja fet a Firestore."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self._mark_dirty_locked(user_id)
+                return
+            expires_at, data = entry
+            merged = copy.deepcopy(data) if data is not None else {}
+            try:
+                _merge_into(merged, updates)
+            except _Unsupported:
+                del self._entries[user_id]
+                self._counters["invalidations"] += 1
+                return
+            self._entries[user_id] = (expires_at, merged)
+            self._counters["write_through"] += 1
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._mark_dirty_locked(user_id)
+            if self._entries.pop(user_id, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def _mark_dirty_locked(self, user_id: str):
+        # Una lectura en curs pot haver vist l'estat d'abans de l'escriptura: no la desarem
+        if user_id in self._loading:
+            self._loading[user_id] = True
+
+    def _store(self, user_id: str, data):
+        with self._lock:
+            if self._loading.pop(user_id, False):
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, data)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        reads = counters["hits"] + counters["misses"]
+        return {
+            "entries": size,
+            "ttl_seconds": self.ttl_seconds,
+            "counters": counters,
+            "hit_rate": round(counters["hits"] / reads, 3) if reads else 0.0,
+            # Cada encert és una lectura de Firestore que no hem fet
+            "firestore_reads_saved": counters["hits"],
+        }
+
+
+user_cache = UserProfileCache(settings.USER_CACHE_MAX_ENTRIES, settings.USER_CACHE_TTL_SECONDS)
+# Llistes d'errors (subcol·lecció 'mistakes'): cache a part i més petita, no competeix amb els perfils
+mistakes_cache = UserProfileCache(settings.MISTAKES_CACHE_MAX_ENTRIES, settings.USER_CACHE_TTL_SECONDS)
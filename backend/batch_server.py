@@ -0,0 +1,244 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor LOCAL que imita la Batch API d'OpenAI (només el que fa servir el pipeline offline):
+#   POST /v1/files                 -> puja el JSONL
+#   POST /v1/batches               -> crea el batch i el processa en segon pla
+#   GET  /v1/batches/{id}          -> estat
+#   GET  /v1/files/{id}/content    -> JSONL de resultats
+# Les respostes són exercicis sintètics amb l'estructura real, per provar el pipeline sense xarxa.
+#
+# Ús:  python batch_server.py --port 8765
+#      OPENAI_BATCH_BASE_URL=http://127.0.0.1:8765/v1 python seed_db.py --offline
+
+BATCH_COUNT_PATTERN = re.compile(r"Create (\d+) DIFFERENT")
+
+
+def fake_exercise(exercise_type: str, n: int) -> dict:
+    return {
+        "type": exercise_type,
+        "title": f"Stand-in {exercise_type} #{n}",
+        "instructions": "Answer the questions below.",
+        "text": f"Synthetic text for {exercise_type} number {n}.",
+        "questions": [
+            {
+                "question": f"Question {q + 1} ________",
+                "stem": f"Question {q + 1}",
+                "options": [{"text": "alpha"}, {"text": "beta"}, {"text": "gamma"}, {"text": "delta"}],
+                "answer": "alpha",
+                "explanation": "Synthetic explanation.",
+            }
+            for q in range(4)
+        ],
+    }
+
+
+def fake_completion(request: dict, counter: int) -> dict:
+    """Resposta de chat completion sintètica (1 exercici o un lot, segons el prompt)."""
+    body = request.get("body", {})
+    messages = body.get("messages", [])
+    user_text = messages[-1]["content"] if messages else ""
+    exercise_type = request["custom_id"].split("|")[0]
+
+    match = BATCH_COUNT_PATTERN.search(user_text)
+    if match:
+        content = {"exercises": [fake_exercise(exercise_type, counter + i) for i in range(int(match.group(1)))]}
+    else:
+        content = fake_exercise(exercise_type, counter)
+    content = json.dumps(content)
+
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            # Tots els prompts d'un tipus comparteixen el prefix: simulem la cache a partir de 1024 tokens
+            "prompt_tokens_details": {"cached_tokens": (prompt_tokens // 128) * 128 if prompt_tokens >= 1024 else 0},
+        },
+    }
+
+
+class BatchStore:
+    def __init__(self, latency: float, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate    # fracció de peticions que acaben al fitxer d'errors
+        self.files = {}      # id -> (metadata, bytes)
+        self.batches = {}    # id -> objecte batch
+        self.lock = threading.Lock()
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self.lock:
+            self.files[file_id] = (meta, content)
+        return meta
+
+    def create_batch(self, payload: dict) -> dict:
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": payload["input_file_id"],
+            "completion_window": payload.get("completion_window", "24h"),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "in_progress_at": None,
+            "completed_at": None,
+            "metadata": payload.get("metadata") or {},
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._process, args=(batch_id,), daemon=True).start()
+        return dict(batch)
+
+    def _process(self, batch_id: str):
+        with self.lock:
+            batch = self.batches[batch_id]
+            _, content = self.files[batch["input_file_id"]]
+        lines = [json.loads(line) for line in content.decode("utf-8").splitlines() if line.strip()]
+
+        with self.lock:
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+            batch["request_counts"]["total"] = len(lines)
+
+        output, errors = [], []
+        for i, request in enumerate(lines):
+            time.sleep(self.latency)
+            if random.random() < self.error_rate:
+                # Com la Batch API real: les peticions fallides van a 'error_file_id', no a la sortida
+                errors.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 500, "request_id": uuid.uuid4().hex, "body": {"error": {"message": "stand-in failure"}}},
+                    "error": None,
+                }))
+                with self.lock:
+                    batch["request_counts"]["failed"] += 1
+                continue
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": fake_completion(request, i * 10)},
+                "error": None,
+            }))
+            with self.lock:
+                batch["request_counts"]["completed"] += 1
+
+        out_meta = self.add_file(("\n".join(output) + "\n").encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+        err_meta = self.add_file(("\n".join(errors) + "\n").encode("utf-8"), f"{batch_id}_errors.jsonl", "batch_output") if errors else None
+        with self.lock:
+            batch["output_file_id"] = out_meta["id"]
+            batch["error_file_id"] = err_meta["id"] if err_meta else None
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+
+
+def make_handler(store: BatchStore):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, status: int, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            if self.path == "/v1/files":
+                # multipart/form-data: 'purpose' + 'file'
+                raw = self._body()
+                message = BytesParser(policy=default_policy).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + raw
+                )
+                fields = {}
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    fields[name] = (part.get_filename(), part.get_payload(decode=True))
+                filename, content = fields.get("file", ("input.jsonl", b""))
+                purpose = (fields.get("purpose", (None, b"batch"))[1] or b"batch").decode("utf-8")
+                return self._json(200, store.add_file(content, filename or "input.jsonl", purpose))
+
+            if self.path == "/v1/batches":
+                payload = json.loads(self._body() or b"{}")
+                if payload.get("input_file_id") not in store.files:
+                    return self._json(404, {"error": {"message": "input file not found"}})
+                return self._json(200, store.create_batch(payload))
+
+            self._json(404, {"error": {"message": f"unknown route {self.path}"}})
+
+        def do_GET(self):
+            match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+            if match:
+                with store.lock:
+                    batch = store.batches.get(match.group(1))
+                    batch = json.loads(json.dumps(batch)) if batch else None
+                return self._json(200, batch) if batch else self._json(404, {"error": {"message": "batch not found"}})
+
+            match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+            if match and match.group(1) in store.files:
+                _, content = store.files[match.group(1)]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+                return
+
+            self._json(404, {"error": {"message": f"unknown route {self.path}"}})
+
+    return Handler
+
+
+def start_server(port: int = 0, latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Arrenca el servidor en un thread (port 0 = qualsevol port lliure). Útil per als benchmarks."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(BatchStore(latency, error_rate)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita la Batch API d'OpenAI.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Segons simulats per petició.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracció de peticions que fallen (van al fitxer d'errors).")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(BatchStore(args.latency, args.error_rate)))
+    print(f"🧪 Batch API local a http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Aturat.")
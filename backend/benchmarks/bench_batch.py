@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+
+# Executar des de 'backend/':  python benchmarks/bench_batch.py --types grammar_idioms speaking1 --batch-size 4
+# Fa crides REALS a OpenAI (cal OPENAI_API_KEY). No guarda res a Firestore.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.generators.factory import ExerciseFactory  # noqa: E402
+from app.services.llm import llm  # noqa: E402
+
+# Preus de gpt-4o (USD per 1M tokens): entrada, entrada servida de cache, sortida
+PRICES = {"input": 2.50, "cached_input": 1.25, "output": 10.00}
+
+
+def cost(stats: dict) -> float:
+    uncached = stats["prompt_tokens"] - stats["cached_tokens"]
+    return (
+        uncached * PRICES["input"]
+        + stats["cached_tokens"] * PRICES["cached_input"]
+        + stats["completion_tokens"] * PRICES["output"]
+    ) / 1_000_000
+
+
+def run_mode(exercise_type: str, level: str, count: int, batched: bool) -> dict:
+    label = f"exercise_batch:{exercise_type}" if batched else f"exercise:{exercise_type}"
+    before = dict(llm.usage_status().get(label, {}))
+
+    started = time.monotonic()
+    produced = 0
+    if batched:
+        produced = len(ExerciseFactory.create_exercise_batch(exercise_type, level, count))
+    else:
+        for _ in range(count):
+            ExerciseFactory.create_exercise(exercise_type, level)
+            produced += 1
+    seconds = time.monotonic() - started
+
+    after = llm.usage_status()[label]
+    stats = {field: after[field] - before.get(field, 0) for field in ("prompt_tokens", "cached_tokens", "completion_tokens")}
+    stats["exercises"] = produced
+    stats["seconds"] = seconds
+    return stats
+
+
+def report(name: str, stats: dict):
+    total_tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+    per_exercise = cost(stats) / stats["exercises"] if stats["exercises"] else float("nan")
+    print(
+        f"   {name:7} {stats['exercises']:>3} ex  {stats['seconds']:>7.1f}s  "
+        f"prompt {stats['prompt_tokens']:>6} (cached {stats['cached_tokens']:>5})  out {stats['completion_tokens']:>6}  "
+        f"{total_tokens / stats['seconds']:>7.1f} tok/s  ${per_exercise:.4f}/ex"
+    )
+    return per_exercise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generació en lot vs individual: tokens/s i cost per exercici.")
+    parser.add_argument("--types", nargs="+", default=["grammar_conditionals", "reading_and_use_of_language1", "speaking1"])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--level", default="C1")
+    args = parser.parse_args()
+
+    for exercise_type in args.types:
+        if exercise_type not in ExerciseFactory.BATCHABLE_TYPES:
+            print(f"⚠️ {exercise_type} no és a BATCHABLE_TYPES; el saltem.")
+            continue
+        print(f"\n📦 {exercise_type} ({args.batch_size} exercicis)")
+        single = report("single", run_mode(exercise_type, args.level, args.batch_size, batched=False))
+        batch = report("batch", run_mode(exercise_type, args.level, args.batch_size, batched=True))
+        if single and batch:
+            print(f"   💰 Estalvi per exercici: {100 * (1 - batch / single):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
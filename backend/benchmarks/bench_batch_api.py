@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Executar des de 'backend/':  python benchmarks/bench_batch_api.py --exercises 400
+# Fa servir el servidor local 'batch_server.py': no cal xarxa, ni clau real, ni Firestore.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-local")
+os.environ.setdefault("STRIPE_SECRET_KEY", "unused")
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "unused")
+
+from batch_server import start_server  # noqa: E402
+from app.services.batch_api import BatchGenerationPipeline  # noqa: E402
+from app.services.generators.factory import ExerciseFactory  # noqa: E402
+
+DEFAULT_TYPES = ["grammar_conditionals", "reading_and_use_of_language1", "speaking1", "writing1", "listening1"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline offline (Batch API) contra el servidor local.")
+    parser.add_argument("--exercises", type=int, default=200, help="Exercicis per tipus.")
+    parser.add_argument("--types", nargs="+", default=DEFAULT_TYPES)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segons simulats per petició al servidor.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracció de peticions que el servidor fa fallar.")
+    args = parser.parse_args()
+
+    server = start_server(0, args.latency, args.error_rate)
+    pipeline = BatchGenerationPipeline(
+        api_key="sk-local",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        poll_seconds=0.05,
+    )
+
+    jobs = []
+    for exercise_type in args.types:
+        per_call = args.batch_size if exercise_type in ExerciseFactory.BATCHABLE_TYPES else 1
+        remaining = args.exercises
+        while remaining > 0:
+            jobs.append((exercise_type, min(per_call, remaining)))
+            remaining -= per_call
+
+    timings = {}
+    started = time.perf_counter()
+    requests = BatchGenerationPipeline.build_requests(jobs)
+    path = BatchGenerationPipeline.write_jsonl(requests, os.path.join(tempfile.mkdtemp(), "bench.jsonl"))
+    timings["build_jsonl"] = time.perf_counter() - started
+
+    step = time.perf_counter()
+    batch_id = pipeline.submit(path)
+    timings["submit"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    batch = pipeline.wait(batch_id, timeout=600)
+    timings["wait"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    results = BatchGenerationPipeline.parse_results(pipeline.download_results(batch))
+    timings["download_parse"] = time.perf_counter() - step
+    total = time.perf_counter() - started
+    server.shutdown()
+
+    produced = len(results["exercises"])
+    print(f"\n📦 {len(jobs)} peticions, {produced} exercicis ({os.path.getsize(path) / 1024:.0f} KB de JSONL)")
+    for stage, seconds in timings.items():
+        print(f"   {stage:15} {seconds * 1000:>9.1f} ms")
+    print(f"   {'total':15} {total * 1000:>9.1f} ms  ->  {produced / total:.0f} exercicis/s (sense el temps del model)")
+    print(f"   tokens: {results['usage']}  errors: {results['failures'] or 'cap'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+import sys
+import timeit
+
+# Executar des de 'backend/':  python benchmarks/bench_prompts.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.generators.prompts import (  # noqa: E402
+    DEFAULT_JSON_FIELDS_EXAMPLE,
+    JSON_FIELDS_EXAMPLES,
+    PROMPT_REGISTRY,
+    SRS_PROMPT_TEMPLATE,
+    SYSTEM_PROMPT_HARDCORE,
+    TYPE_INSTRUCTIONS,
+    count_tokens,
+    _ENCODING,
+)
+
+ITERATIONS = 20000
+WEAK_WORDS = ["call off", "albeit", "notwithstanding"]
+
+
+# El prompt d'abans, tal com era: nivell i bloc SRS al mig, tot en un sol missatge 'system'
+LEGACY_MASTER_PROMPT = """
+        {system_prompt}
+        
+        TASK: Create a {level} level exercise: {exercise_type}.
+        
+        SPECIFIC INSTRUCTIONS:
+        {type_instructions}
+        
+        {srs_prompt}
+
+        CRITICAL OUTPUT RULES:
+        1. Return ONLY valid JSON.
+        2. Include an 'explanation' field for every question.
+        3. LISTENING ONLY: You MUST include a 'timestamp' field (format "MM:SS").
+        4. NO PLACEHOLDERS: You MUST generate REAL content. Do NOT copy the placeholder text.
+        
+        JSON Structure (Generic/Specific):
+        {{
+            "type": "{exercise_type}",
+            "title": "[Create a real descriptive title for this specific task]",
+            "instructions": "[Write the specific exam instructions here]",
+            "text": "[MANDATORY: Write the FULL audio script or reading text here. Never leave this empty]",
+            "image_prompts": ["Prompt 1", "Prompt 2", "Prompt 3"], 
+            "task1_heading": "[Only for Part 4] TASK 1: Reason for starting",
+            "task1_options": ["[Only for Part 4] A. Option 1", "B. Option 2", "C. Option 3", "D.", "E.", "F.", "G.", "H."],
+            "task2_heading": "[Only for Part 4] TASK 2: How they feel now",
+            "task2_options": ["[Only for Part 4] A. Option 1", "B. Option 2", "C. Option 3", "D.", "E.", "F.", "G.", "H."],
+            "questions": [
+                {{
+                    "question": "[Write the actual question sentence here]",
+                    {json_fields_example}
+                    "answer": "[The correct option/text or letter]",
+                    "explanation": "[Detailed explanation of why it is correct]",
+                    "timestamp": "01:15"
+                }}
+            ]
+        }}
+        """
+
+
+def build_legacy(exercise_type: str, level: str, weak_words: list = None) -> list:
+    """Com ho feia la Factory abans: tot el prompt es formatava a cada crida."""
+    srs_prompt = ""
+    if weak_words and len(weak_words) > 0:
+        srs_prompt = SRS_PROMPT_TEMPLATE.format(weak_words=weak_words)
+    system = LEGACY_MASTER_PROMPT.format(
+        system_prompt=SYSTEM_PROMPT_HARDCORE,
+        level=level,
+        exercise_type=exercise_type,
+        type_instructions=TYPE_INSTRUCTIONS[exercise_type],
+        srs_prompt=srs_prompt,
+        json_fields_example=JSON_FIELDS_EXAMPLES.get(exercise_type, DEFAULT_JSON_FIELDS_EXAMPLE),
+    )
+    return [{"role": "system", "content": system}]
+
+
+def shared_prefix_tokens(a: list, b: list) -> int:
+    """Tokens del prefix comú de dues peticions (el que la cache de prompts pot reaprofitar)."""
+    first, second = "".join(m["content"] for m in a), "".join(m["content"] for m in b)
+    size = 0
+    while size < min(len(first), len(second)) and first[size] == second[size]:
+        size += 1
+    return count_tokens(first[:size])
+
+
+def main():
+    print(f"📏 Tokens: {'tiktoken (o200k_base)' if _ENCODING else 'estimació len/4'}")
+    # 'prefix': tokens comuns entre una petició C1 amb paraules febles i una B2 sense (cacheables si >= 1024)
+    print(f"{'type':32} {'legacy prefix':>13} {'new prefix':>10} {'legacy µs':>10} {'registry µs':>12} {'speedup':>8}")
+
+    total_legacy = total_registry = 0.0
+    for exercise_type, template in PROMPT_REGISTRY.items():
+        legacy_prefix = shared_prefix_tokens(build_legacy(exercise_type, "C1", WEAK_WORDS), build_legacy(exercise_type, "B2"))
+        new_prefix = shared_prefix_tokens(template.messages("C1", WEAK_WORDS), template.messages("B2"))
+
+        legacy = timeit.timeit(lambda: build_legacy(exercise_type, "C1", WEAK_WORDS), number=ITERATIONS)
+        registry = timeit.timeit(lambda: template.messages("C1", WEAK_WORDS), number=ITERATIONS)
+        total_legacy += legacy
+        total_registry += registry
+
+        print(
+            f"{exercise_type:32} {legacy_prefix:>13} {new_prefix:>10} "
+            f"{legacy / ITERATIONS * 1e6:>10.2f} {registry / ITERATIONS * 1e6:>12.2f} {legacy / registry:>7.1f}x"
+        )
+
+    n = len(PROMPT_REGISTRY) * ITERATIONS
+    print(f"\n✅ {len(PROMPT_REGISTRY)} plantilles. Mitjana per crida: legacy {total_legacy / n * 1e6:.2f} µs, "
+          f"registry {total_registry / n * 1e6:.2f} µs ({total_legacy / total_registry:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import copy
+import os
+import random
+import statistics
+import sys
+import time
+
+# Executar des de 'backend/':  python benchmarks/bench_submit.py --requests 200 --rtt-ms 25
+# No toca Firestore: un Firestore fals en memòria simula la latència de cada viatge d'anada i tornada.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_admin.firestore as firebase_firestore  # noqa: E402
+from app.services.user_cache import _merge_into  # noqa: E402
+
+
+class FakeFirestore:
+    """Prou Firestore per a /submit_result/: documents, subcol·leccions, batch i get_all. Compta viatges."""
+
+    def __init__(self, rtt_ms: float):
+        self.rtt_ms = rtt_ms
+        self.data = {}
+        self.round_trips = 0
+
+    def rpc(self):
+        # Cada crida a Firestore és un viatge: latència amb cua llarga (lognormal al voltant de 'rtt_ms')
+        self.round_trips += 1
+        time.sleep(random.lognormvariate(0, 0.35) * self.rtt_ms / 1000)
+
+    def collection(self, name):
+        return _Collection(self, (name,))
+
+    def batch(self):
+        return _Batch(self)
+
+    def get_all(self, refs):
+        self.rpc()
+        return [ref._snapshot() for ref in refs]
+
+
+class _Snapshot:
+    def __init__(self, ref, data):
+        self.reference, self.id, self._data, self.exists = ref, ref.id, data, data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class _Document:
+    def __init__(self, fake, path):
+        self.fake, self.path, self.id = fake, path, path[-1]
+
+    def collection(self, name):
+        return _Collection(self.fake, self.path + (name,))
+
+    def _snapshot(self):
+        return _Snapshot(self, copy.deepcopy(self.fake.data.get(self.path)))
+
+    def _write(self, data, merge=False):
+        if merge:
+            _merge_into(self.fake.data.setdefault(self.path, {}), data)
+        else:
+            self.fake.data[self.path] = copy.deepcopy(data)
+
+    def get(self, **kwargs):
+        self.fake.rpc()
+        return self._snapshot()
+
+    def set(self, data, merge=False):
+        self.fake.rpc()
+        self._write(data, merge)
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self.fake.rpc()
+        self.fake.data.pop(self.path, None)
+
+
+class _Collection:
+    def __init__(self, fake, path, order=None, limit=None):
+        self.fake, self.path, self._order, self._limit = fake, path, order, limit
+
+    def document(self, doc_id=None):
+        return _Document(self.fake, self.path + (doc_id or f"auto{random.getrandbits(48):012x}",))
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def order_by(self, field):
+        return _Collection(self.fake, self.path, field, self._limit)
+
+    def limit(self, count):
+        return _Collection(self.fake, self.path, self._order, count)
+
+    def stream(self):
+        self.fake.rpc()
+        docs = [_Snapshot(_Document(self.fake, p), copy.deepcopy(d)) for p, d in self.fake.data.items() if p[:-1] == self.path]
+        if self._order:
+            docs.sort(key=lambda snap: snap._data.get(self._order))
+        return iter(docs[:self._limit] if self._limit is not None else docs)
+
+
+class _Batch:
+    def __init__(self, fake):
+        self.fake, self.ops = fake, []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(lambda: ref._write(data, merge))
+
+    def update(self, ref, data):
+        self.ops.append(lambda: ref._write(data, merge=True))
+
+    def delete(self, ref):
+        self.ops.append(lambda: self.fake.data.pop(ref.path, None))
+
+    def commit(self):
+        # Un sol viatge per a totes les escriptures (i atòmic)
+        self.fake.rpc()
+        for op in self.ops:
+            op()
+
+
+fake = FakeFirestore(rtt_ms=25)
+firebase_firestore.client = lambda *args, **kwargs: fake
+
+from app.services import db as db_module  # noqa: E402
+from app.services.db import DatabaseService  # noqa: E402
+from app.services.user_cache import user_cache  # noqa: E402
+
+
+def legacy_submit(user_id: str, exercise_type: str, exercise_id: str, score: int, total: int, mistakes: list):
+    """
+    El camí d'abans: llegir el perfil, fusionar 'mistakes_pool' en Python i reescriure'l sencer,
+    i a part save_user_result (user_results.add + lectura i escriptura de l'XP).
+    """
+    user_ref = db_module.db.collection('users').document(user_id)
+    snap = user_ref.get()
+    user_data = snap.to_dict() if snap.exists else {}
+    pool = list(user_data.get("mistakes_pool", []))
+    for new_m in mistakes:
+        stem = new_m.get("stem") or new_m.get("question")
+        existing = next((m for m in pool if (m.get("stem") or m.get("question")) == stem), None)
+        if existing:
+            existing["mastery"] = 0
+        else:
+            pool.append(dict(new_m, mastery=0))
+    user_ref.set({
+        "total_score": firebase_firestore.Increment(score),
+        "exercises_completed": firebase_firestore.Increment(1),
+        "mistakes_pool": pool,
+    }, merge=True)
+
+    db_module.db.collection('user_results').add({
+        'user_id': user_id, 'exercise_id': exercise_id, 'exercise_type': exercise_type,
+        'score': score, 'total': total, 'mistakes': mistakes,
+    })
+    snap = user_ref.get()
+    xp = (snap.to_dict() or {}).get('xp', 0) + 10 + score
+    user_ref.set({'xp': xp, 'level': int(xp / 500) + 1}, merge=True)
+
+
+def make_submission(i: int) -> tuple:
+    wrong = random.sample(range(40), random.randint(0, 4))
+    mistakes = [
+        {"type": "reading_and_use_of_language1", "question": f"Q{q}", "stem": f"Sentence number {q} with a gap",
+         "user_answer": "a", "correct_answer": "b", "question_index": q % 8}
+        for q in wrong
+    ]
+    return "reading_and_use_of_language1", f"ex{i}", 8 - len(mistakes), 8, mistakes
+
+
+def run(name: str, submit, users: int, requests: int, warm_cache: bool) -> dict:
+    random.seed(7)
+    fake.data.clear()
+    user_cache._entries.clear()
+    latencies, trips = [], []
+    for i in range(requests):
+        user_id = f"user{i % users}"
+        if not warm_cache:
+            user_cache.invalidate(user_id)
+        before = fake.round_trips
+        started = time.perf_counter()
+        submit(user_id, *make_submission(i))
+        latencies.append((time.perf_counter() - started) * 1000)
+        trips.append(fake.round_trips - before)
+    latencies.sort()
+    return {
+        "name": name,
+        "trips": statistics.mean(trips),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def report(stats: dict):
+    print(f"   {stats['name']:7} {stats['trips']:>5.2f} viatges/petició   p50 {stats['p50']:>6.1f} ms   p95 {stats['p95']:>6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/submit_result/: viatges a Firestore i latència, abans i ara.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=25.0)
+    parser.add_argument("--warm-cache", action="store_true", help="Perfil ja a la cache (per defecte, lectura en fred)")
+    args = parser.parse_args()
+    fake.rtt_ms = args.rtt_ms
+
+    print(f"\n📮 {args.requests} resultats, {args.users} usuaris, RTT ~{args.rtt_ms:.0f} ms, cache {'calenta' if args.warm_cache else 'freda'}")
+    before = run("abans", legacy_submit, args.users, args.requests, args.warm_cache)
+    after = run("ara", DatabaseService.submit_result, args.users, args.requests, args.warm_cache)
+    report(before)
+    report(after)
+    print(f"   ⚡ p95: {100 * (1 - after['p95'] / before['p95']):.0f}% menys")
+
+
+if __name__ == "__main__":
+    main()
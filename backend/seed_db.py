@@ -1,28 +1,15 @@
 import os
 import json
+import time
+import argparse
 import firebase_admin
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from firebase_admin import credentials, firestore
-from openai import OpenAI
 from dotenv import load_dotenv
 
 # 1. Carreguem variables d'entorn (API KEY)
 load_dotenv()
 
-# 2. Configurar Firebase Admin
-# ⚠️ ASSEGURA'T QUE TENS EL FITXER 'serviceAccountKey.json' A LA MATEIXA CARPETA
-if not firebase_admin._apps:
-    try:
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
-        print("✅ Firebase connectat correctament.")
-    except Exception as e:
-        print(f"❌ Error connectant a Firebase: {e}")
-        print("💡 Recorda baixar la clau privada des de la consola de Firebase!")
-        exit()
-
-db = firestore.client()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # --- LLISTA COMPLETA DE PARTS DEL C1 ---
 EXERCISE_TYPES = [
     # READING & USE OF ENGLISH
@@ -51,68 +38,286 @@ EXERCISE_TYPES = [
     "speaking3"  # Collaborative task
 ]
 
-def generate_and_save(ex_type):
-    print(f"🤖 Generant 1x {ex_type}...")
-    
-    # Prompt específic per assegurar que Listening té 'transcript' i Writing té 'instructions'
-    prompt = f"""
-    Generate a valid JSON object for a Cambridge C1 Advanced {ex_type} exercise.
-    
-    Structure requirements:
-    - For Reading: Include 'text', 'questions', 'options' (if applicable), 'answers'.
-    - For Listening: Include a 'transcript' (the text of the audio), 'questions', 'options', 'answers'.
-    - For Writing: Include 'title', 'task_text' (instructions), 'type' (essay/report/etc).
-    - For Speaking: Include 'questions' for Part 1, or 'task_text' for Parts 2/3.
-    
-    Output ONLY raw JSON. No markdown formatting.
-    """
+DEFAULT_CHECKPOINT = "seed_checkpoint.json"
+
+
+def init_firebase():
+    # 2. Configurar Firebase Admin
+    # ⚠️ ASSEGURA'T QUE TENS EL FITXER 'serviceAccountKey.json' A LA MATEIXA CARPETA
+    if not firebase_admin._apps:
+        try:
+            cred = credentials.Certificate("serviceAccountKey.json")
+            firebase_admin.initialize_app(cred)
+            print("✅ Firebase connectat correctament.")
+        except Exception as e:
+            print(f"❌ Error connectant a Firebase: {e}")
+            print("💡 Recorda baixar la clau privada des de la consola de Firebase!")
+            exit()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sembra la Pool d'exercicis fins a una profunditat objectiu per tipus.")
+    parser.add_argument("--types", nargs="+", default=EXERCISE_TYPES, help="Tipus a sembrar (per defecte, tot el C1).")
+    parser.add_argument("--level", default="C1")
+    parser.add_argument("--target", type=int, default=3, help="Exercicis públics que volem per tipus (comptant els que ja hi ha).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Crides a OpenAI simultànies.")
+    parser.add_argument("--batch-size", type=int, default=4, help="Exercicis per crida als tipus curts (BATCHABLE_TYPES).")
+    parser.add_argument("--flush-every", type=int, default=20, help="Exercicis acumulats abans de cada escriptura agrupada.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Fitxer per reprendre una execució interrompuda.")
+    parser.add_argument("--fresh", action="store_true", help="Ignora el checkpoint i recalcula el pla.")
+    parser.add_argument("--dry-run", action="store_true", help="Només mostra el pla, sense generar res.")
+    parser.add_argument("--offline", action="store_true", help="Fa servir la Batch API (més barata, sense competir amb el trànsit en directe).")
+    parser.add_argument("--batch-dir", default="batches", help="Carpeta on deixem els JSONL de la Batch API.")
+    parser.add_argument("--base-url", default=None, help="URL de la Batch API (p.ex. http://127.0.0.1:8765/v1 per a batch_server.py).")
+    parser.add_argument("--poll-seconds", type=float, default=None, help="Cada quant consultem l'estat del batch.")
+    return parser.parse_args()
 
+
+# ==========================================
+# CHECKPOINT
+# ==========================================
+
+def load_checkpoint(path: str, level: str, target: int, types: list):
+    if not os.path.exists(path):
+        return None
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini", # Fem servir el model ràpid i barat
-            messages=[
-                {"role": "system", "content": "You are a Cambridge C1 exam content generator. Output strictly JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
-        
-        content = response.choices[0].message.content
-        
-        # Neteja de markdown si la IA posa ```json ... ```
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-            
-        data = json.loads(content)
-        
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Checkpoint il·legible ({e}). El recalculem.")
+        return None
+    if state.get("level") != level or state.get("target") != target or state.get("types") != sorted(types):
+        print("⚠️ El checkpoint és d'una altra configuració (nivell/objectiu/tipus). El recalculem.")
+        return None
+    return state
+
+
+def save_checkpoint(path: str, state: dict):
+    # Escriptura atòmica: si ens maten a mitges, el checkpoint anterior continua sencer
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_plan(types: list, level: str, target: int) -> dict:
+    """Quants exercicis falten per tipus segons la profunditat actual de la Pool."""
+    from app.services.db import DatabaseService
+
+    plan = {}
+    for ex_type in types:
+        depth = len(DatabaseService._get_pool(level, ex_type))
+        plan[ex_type] = max(0, target - depth)
+        print(f"   {ex_type:32} pool {depth:>4}  ->  en falten {plan[ex_type]}")
+    return plan
+
+
+# ==========================================
+# GENERACIÓ
+# ==========================================
+
+def build_jobs(plan: dict, batch_size: int, batchable: set) -> list:
+    """Una feina = una crida a OpenAI: (tipus, exercicis que n'esperem)."""
+    jobs = []
+    for ex_type, remaining in plan.items():
+        per_call = batch_size if ex_type in batchable else 1
+        while remaining > 0:
+            count = min(per_call, remaining)
+            jobs.append((ex_type, count))
+            remaining -= count
+    return jobs
+
+
+def with_assets(ex_type: str, data: dict) -> dict:
+    """
+    Recursos que depenen del text (àudio dels listening, imatges de speaking2), com als lots del router:
+    un exercici sembrat ha de sortir de la Pool amb 'audio_url' i 'image_urls' ja desats.
+    """
+    from app.services.pipeline import generation_pipeline
+
+    return generation_pipeline.attach_assets(data, ex_type)
+
+
+def generate_job(ex_type: str, level: str, count: int) -> list:
+    from app.services.generators.factory import ExerciseFactory
+
+    if count > 1:
+        objects = ExerciseFactory.create_exercise_batch(ex_type, level, count)
+    else:
+        objects = [ExerciseFactory.create_exercise(ex_type, level)]
+
+    exercises = []
+    for exercise_object in objects:
+        data = exercise_object.model_dump()
         # Camps de control per a la nostra DB
         data['type'] = ex_type
-        data['level'] = 'C1'
+        data['level'] = level
         data['is_pregenerated'] = True
         data['created_at'] = firestore.SERVER_TIMESTAMP
-        
-        # Guardar a Firebase
-        db.collection('exercises').add(data)
-        print(f"   ✨ Guardat!")
-        
-    except json.JSONDecodeError:
-        print(f"   ⚠️ Error: La IA no ha generat un JSON vàlid per {ex_type}.")
-    except Exception as e:
-        print(f"   ❌ Error inesperat: {e}")
+        exercises.append(with_assets(ex_type, data))
+    return exercises
+
+
+def flush(buffer: list, state: dict, checkpoint: str):
+    """Escriptura agrupada a Firestore i, només després, actualitzem el checkpoint."""
+    from app.services.db import DatabaseService
+
+    if not buffer:
+        return
+    saved_ids = DatabaseService.save_exercises_batch([data for _, data in buffer])
+    saved = len(saved_ids)
+    if saved < len(buffer):
+        # El lot ha fallat: no el descomptem del pla i el tornarem a intentar en reprendre
+        for ex_type, _ in buffer:
+            state["failures"][ex_type] = state["failures"].get(ex_type, 0) + 1
+    else:
+        for ex_type, _ in buffer:
+            state["plan"][ex_type] = max(0, state["plan"][ex_type] - 1)
+            state["saved"][ex_type] = state["saved"].get(ex_type, 0) + 1
+    buffer.clear()
+    save_checkpoint(checkpoint, state)
+
+
+def token_totals(usage: dict, types: list) -> dict:
+    labels = {f"exercise:{t}" for t in types} | {f"exercise_batch:{t}" for t in types}
+    totals = {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    for label, stats in usage.items():
+        if label in labels:
+            for field in totals:
+                totals[field] += stats[field]
+    return totals
+
+
+def main():
+    args = parse_args()
+    init_firebase()
+
+    # ⚠️ Aquests imports necessiten Firebase ja inicialitzat (db.py crea el client en importar-se)
+    from app.services.generators.factory import ExerciseFactory
+    from app.services.llm import llm
+
+    print("🚀 Començant la sembra massiva d'exercicis...")
+    state = None if args.fresh else load_checkpoint(args.checkpoint, args.level, args.target, args.types)
+    if state:
+        print(f"♻️ Reprenent des de '{args.checkpoint}'.")
+    else:
+        print(f"📋 Calculant el pla ({len(args.types)} tipus, objectiu {args.target} per tipus)...")
+        state = {
+            "level": args.level,
+            "target": args.target,
+            "types": sorted(args.types),
+            "plan": build_plan(args.types, args.level, args.target),
+            "saved": {},
+            "failures": {},
+        }
+        save_checkpoint(args.checkpoint, state)
+
+    jobs = build_jobs(state["plan"], args.batch_size, ExerciseFactory.BATCHABLE_TYPES)
+    pending = sum(count for _, count in jobs)
+    print(f"🧮 {pending} exercicis pendents en {len(jobs)} crides (concurrència {args.concurrency}).")
+    if args.dry_run or not jobs:
+        print("\n🏁 Res a generar." if not jobs else "\n🏁 Dry run: no generem res.")
+        return
+
+    if args.offline:
+        return run_offline(args, state, jobs)
+
+    started = time.monotonic()
+    usage_before = token_totals(llm.usage_status(), args.types)
+    generated = 0
+    buffer = []
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {executor.submit(generate_job, ex_type, args.level, count): (ex_type, count) for ex_type, count in jobs}
+        try:
+            for future in as_completed(futures):
+                ex_type, count = futures[future]
+                try:
+                    exercises = future.result()
+                except Exception as e:
+                    print(f"   ❌ Error generant {ex_type}: {e}")
+                    exercises = []
+
+                if len(exercises) < count:
+                    state["failures"][ex_type] = state["failures"].get(ex_type, 0) + count - len(exercises)
+                generated += len(exercises)
+                buffer.extend((ex_type, data) for data in exercises)
+
+                if len(buffer) >= args.flush_every:
+                    flush(buffer, state, args.checkpoint)
+
+                elapsed = time.monotonic() - started
+                print(f"   ✨ {ex_type}: +{len(exercises)}  ({generated}/{pending}, {60 * generated / elapsed:.1f} ex/min)")
+        except KeyboardInterrupt:
+            print("\n⏸️ Interromput. Guardem el que ja tenim i el checkpoint...")
+            for future in futures:
+                future.cancel()
+            flush(buffer, state, args.checkpoint)
+            raise
+
+    flush(buffer, state, args.checkpoint)
+
+    usage_after = token_totals(llm.usage_status(), args.types)
+    tokens = {field: usage_after[field] - usage_before[field] for field in usage_after}
+    print_summary(state, args.checkpoint, time.monotonic() - started, tokens)
+
+
+def run_offline(args, state: dict, jobs: list):
+    """Mode offline: un sol batch amb totes les crides; el batch_id queda al checkpoint per reprendre."""
+    from app.services.batch_api import BatchGenerationPipeline
+
+    pipeline = BatchGenerationPipeline(base_url=args.base_url, poll_seconds=args.poll_seconds)
+    started = time.monotonic()
+
+    if state.get("batch_id"):
+        print(f"♻️ Reprenent l'espera del batch {state['batch_id']}.")
+    else:
+        requests = BatchGenerationPipeline.build_requests(jobs, args.level)
+        path = os.path.join(args.batch_dir, f"seed_{args.level}_{int(time.time())}.jsonl")
+        BatchGenerationPipeline.write_jsonl(requests, path)
+        state["batch_id"] = pipeline.submit(path, metadata={"source": "seed_db", "level": args.level})
+        save_checkpoint(args.checkpoint, state)
+
+    batch = pipeline.wait(state["batch_id"])
+    if batch.status != "completed":
+        print(f"❌ El batch ha acabat en estat '{batch.status}'. El tornarem a enviar a la propera execució.")
+        state.pop("batch_id", None)
+        save_checkpoint(args.checkpoint, state)
+        return
+
+    results = BatchGenerationPipeline.parse_results(pipeline.download_results(batch))
+    for ex_type, failures in results["failures"].items():
+        state["failures"][ex_type] = state["failures"].get(ex_type, 0) + failures
+
+    print(f"🎨 Generant àudio i imatges dels exercicis que en necessiten (concurrència {args.concurrency})...")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        buffer = list(executor.map(lambda data: (data["type"], with_assets(data["type"], data)), results["exercises"]))
+    for start in range(0, len(buffer), 500):
+        flush(buffer[start:start + 500], state, args.checkpoint)
+
+    state.pop("batch_id", None)
+    save_checkpoint(args.checkpoint, state)
+    print_summary(state, args.checkpoint, time.monotonic() - started, results["usage"])
+
+
+def print_summary(state: dict, checkpoint: str, elapsed: float, tokens: dict):
+    saved = sum(state["saved"].values())
+
+    print("\n📊 RESUM")
+    print(f"   Exercicis guardats: {saved} en {elapsed:.1f}s ({60 * saved / max(elapsed, 1e-6):.1f} ex/min)")
+    print(f"   Tokens: prompt {tokens['prompt_tokens']} (cached {tokens['cached_tokens']}), sortida {tokens['completion_tokens']}")
+    if state["failures"]:
+        print("   Errors per tipus:")
+        for ex_type, failures in sorted(state["failures"].items()):
+            print(f"      {ex_type:32} {failures}")
+
+    if not any(state["plan"].values()):
+        os.remove(checkpoint)
+        print("\n🏁 Procés finalitzat! La teva base de dades està plena.")
+    else:
+        print(f"\n⚠️ Queden exercicis pendents. Torna a executar l'script per reprendre des de '{checkpoint}'.")
+
 
 # EXECUTAR L'SCRIPT
 if __name__ == "__main__":
-    print("🚀 Començant la sembra massiva d'exercicis...")
-    print(f"📋 Total de tipus: {len(EXERCISE_TYPES)}")
-    
-    # Canvia aquest número si en vols més o menys de cada
-    QUANTITY_PER_TYPE = 3 
-    
-    for type_name in EXERCISE_TYPES:
-        print(f"\n--- {type_name.upper()} ---")
-        for i in range(QUANTITY_PER_TYPE):
-            generate_and_save(type_name)
-            
-    print("\n🏁 Procés finalitzat! La teva base de dades està plena.")
\ No newline at end of file
+    main()
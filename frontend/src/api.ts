@@ -260,6 +260,11 @@ export async function transcribeAudio(audioBlob: Blob) {
   return response.json();
 }
 
+export function audioFileUrl(audioUrl: string) {
+  // 'audio_url' és una ruta de l'API (/audio/{hash}); les URLs absolutes es deixen tal qual
+  return audioUrl.startsWith("http") ? audioUrl : `${API_URL}${audioUrl}`;
+}
+
 export async function fetchAudio(text: string) {
   try {
     // ✅ FIX: El backend es diu /generate_audio/ i li passem json POST
@@ -271,8 +276,9 @@ export async function fetchAudio(text: string) {
 
     if (!response.ok) throw new Error("TTS Failed");
 
-    const blob = await response.blob();
-    return URL.createObjectURL(blob);
+    // El POST només retorna la URL GET (cachejable, amb ETag): el reproductor la demana directament
+    const data = await response.json();
+    return audioFileUrl(data.audio_url);
   } catch (error) {
     console.error("TTS Error:", error);
     return null;
@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from "react";
 import { ArrowLeft, Download, Eye, XCircle, Send, Loader2, AlertCircle, Mic, StopCircle, Volume2, FileText, Sparkles, ChevronDown, Lock, PenTool, Clock, LayoutList, Users, ArrowRight } from "lucide-react";
-import { preloadExercise, submitResult, gradeWriting, gradeSpeaking, transcribeAudio, fetchAudio } from "../api";
+import { preloadExercise, submitResult, gradeWriting, gradeSpeaking, transcribeAudio, fetchAudio, audioFileUrl } from "../api";
 import { useAuth } from "../context/AuthContext";
 import confetti from 'canvas-confetti';
 import { playSuccessSound, playErrorSound } from "../utils/audioFeedback";
@@ -29,6 +29,8 @@ interface ExerciseData {
   level: string;
   questions: Question[];
   image_urls?: string[]; 
+  audio_url?: string;
+  image_variants?: ({ src: string; srcset: string } | null)[];
   image_prompts?: string[];
   instruction?: string;
   content?: {
@@ -149,11 +151,14 @@ export default function ExercisePlayer({ data, onBack, onOpenPricing }: Props) {
 
   useEffect(() => {
     if (isInteractive) preloadExercise(data.type, data.level || "C1");
-    if (isListening && data.text) {
+    if (isListening && data.audio_url) {
+      // Àudio ja guardat a Storage: el reproductor el demana per rangs, sense tornar a fer TTS
+      setAudioUrl(audioFileUrl(data.audio_url));
+    } else if (isListening && data.text) {
       setLoadingAudio(true);
       fetchAudio(data.text).then(url => setAudioUrl(url)).finally(() => setLoadingAudio(false));
     }
-  }, [data.type, data.level, isInteractive, isListening, data.text]);
+  }, [data.type, data.level, isInteractive, isListening, data.text, data.audio_url]);
 
   const handleEssayChange = (e: React.ChangeEvent<HTMLTextAreaElement>) => {
     const text = e.target.value;
@@ -251,7 +256,8 @@ export default function ExercisePlayer({ data, onBack, onOpenPricing }: Props) {
             question: q.question, 
             stem: q.stem || q.original_sentence || (data.text ? data.text.substring(0, 150) + "..." : "Context unavailable"),
             user_answer: userAnswers[key] || "[Empty]", 
-            correct_answer: q.answer
+            correct_answer: q.answer,
+            question_index: idx
           });
       }
     });
@@ -272,6 +278,7 @@ export default function ExercisePlayer({ data, onBack, onOpenPricing }: Props) {
           await submitResult({ 
               user_id: user.uid, 
               exercise_type: data.type, 
+              exercise_id: data.id,
               score: correct, 
               total: data.questions.length, 
               mistakes: mistakes 
@@ -604,7 +611,7 @@ export default function ExercisePlayer({ data, onBack, onOpenPricing }: Props) {
         {data.image_urls && data.image_urls.length > 0 && (
           <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
             {data.image_urls.map((url, i) => (
-              <div key={i} className="rounded-sm overflow-hidden shadow-sm border border-stone-200"><img src={url} alt="Task" className="w-full h-full object-cover aspect-square" /></div>
+              <div key={i} className="rounded-sm overflow-hidden shadow-sm border border-stone-200"><img src={data.image_variants?.[i]?.src || url} srcSet={data.image_variants?.[i]?.srcset} sizes="(min-width: 768px) 33vw, 100vw" loading="lazy" alt="Task" className="w-full h-full object-cover aspect-square" /></div>
             ))}
           </div>
         )}